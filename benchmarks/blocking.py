@@ -0,0 +1,80 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains benchmark of resource blocking in driver. Run it from app folder:
+$ python -m benchmarks.blocking https://www.wildberries.ru/catalog/12345678/detail.aspx
+"""
+
+import sys
+import time
+from typing import Dict, List
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from config import CFG
+from parsing.drivers import make_driver, quit_driver
+
+#  Sum of bytes transferred for document and all its resources
+TRANSFER_SCRIPT = """
+return performance.getEntriesByType('navigation')
+    .concat(performance.getEntriesByType('resource'))
+    .reduce((total, entry) => total + (entry.transferSize || 0), 0);
+"""
+
+
+def measure(link: str, block: bool) -> Dict[str, float]:
+    """
+    Loads link in new driver and measures it.
+    Args:
+        link: product page to load
+        block: whether to block resources
+    Returns:
+        seconds to visible 'product-page__aside' and kilobytes transferred
+    """
+    driver = make_driver(block=block)
+    try:
+        start_time = time.perf_counter()
+        driver.get(link)
+        try:
+            WebDriverWait(driver, CFG.PAGELOAD_MAXTIME).until(
+                EC.visibility_of_element_located(
+                    (By.XPATH, "//*[@class='product-page__aside']")
+                )
+            )
+        except TimeoutException:
+            pass
+        seconds = time.perf_counter() - start_time
+        transferred = driver.execute_script(TRANSFER_SCRIPT) or 0
+    finally:
+        quit_driver(driver)
+    return {'seconds': seconds, 'kbytes': transferred / 1024}
+
+
+def main(lnks: List[str]) -> None:
+    """Prints measures for every link with and without blocking."""
+    print(f'{"blocking":>8} {"sec":>8} {"KB":>10}  link')
+    for link in lnks:
+        for block in (False, True):
+            result = measure(link, block)
+            print(
+                f'{"on" if block else "off":>8} {result["seconds"]:8.2f} '
+                f'{result["kbytes"]:10.0f}  {link}'
+            )
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
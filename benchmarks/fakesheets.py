@@ -0,0 +1,172 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains local fake of Google Sheets worksheet, keeping rows in memory and
+counting API calls. Used instead of Gc by benchmarks.
+"""
+
+from collections import Counter
+from typing import Any, List, Optional, Tuple
+
+import pygsheets
+
+
+class FakeRange:  # pylint: disable=too-few-public-methods
+    """Named range with start address only."""
+
+    def __init__(self, start_addr: Tuple[int, int]) -> None:
+        self.start_addr = start_addr
+
+
+class FakeSheetApi:  # pylint: disable=too-few-public-methods
+    """Low-level API of pygsheets client, used by append_values()."""
+
+    def __init__(self, spreadsheet: 'FakeSpreadsheet') -> None:
+        self.spreadsheet = spreadsheet
+
+    def values_append(self, _, values: List[List[str]], __, range: str, **___) -> None:
+        """Appends values after last row of worksheet named in range."""
+        # pylint: disable=redefined-builtin
+        self.spreadsheet.calls['values_append'] += 1
+        title = range.strip("'").replace("''", "'")
+        wks = self.spreadsheet.worksheet_by_title(title, count=False)
+        wks.rows.extend(list(value) for value in values)
+
+
+class FakeClient:  # pylint: disable=too-few-public-methods
+    """Client of pygsheets with low-level API only."""
+
+    def __init__(self, spreadsheet: 'FakeSpreadsheet') -> None:
+        self.sheet = FakeSheetApi(spreadsheet)
+
+
+class FakeWorksheet:
+    """Worksheet with rows in memory. Every method call is one API call of pygsheets."""
+
+    def __init__(self, spreadsheet: 'FakeSpreadsheet', title: str, wid: int) -> None:
+        self.spreadsheet = spreadsheet
+        self.client = FakeClient(spreadsheet)
+        self.title = title
+        self.id = wid  # pylint: disable=invalid-name
+        self.rows: List[List[str]] = []
+        self.calls = spreadsheet.calls
+        self._frozen_rows = 0
+
+    @property
+    def frozen_rows(self) -> int:
+        """Quantity of frozen rows."""
+        return self._frozen_rows
+
+    @frozen_rows.setter
+    def frozen_rows(self, value: int) -> None:
+        self.calls['frozen_rows'] += 1
+        self._frozen_rows = value
+
+    def get_named_range(self, name: str) -> FakeRange:
+        """Header is always in the first row."""
+        self.calls['get_named_range'] += 1
+        assert name
+        return FakeRange((1, 1))
+
+    def insert_rows(self, row: int, number: int = 1, **_) -> None:
+        """Inserts empty rows after row."""
+        self.calls['insert_rows'] += 1
+        self.rows[row:row] = [[] for _ in range(number)]
+
+    def update_values(self, crange: Tuple[int, int], values: List[List[str]], **_):
+        """Writes values starting from crange cell."""
+        self.calls['update_values'] += 1
+        start = crange[0] - 1
+        for i, value in enumerate(values):
+            while len(self.rows) <= start + i:
+                self.rows.append([])
+            self.rows[start + i] = list(value)
+
+    def get_col(self, col: int, **_) -> List[str]:
+        """Returns values of column down to last non-empty one."""
+        self.calls['get_col'] += 1
+        values = [row[col - 1] if len(row) >= col else '' for row in self.rows]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def link(self) -> None:
+        """Local operation in pygsheets, not counted."""
+
+    def unlink(self) -> None:
+        """Local operation in pygsheets, not counted."""
+
+
+class FakeSpreadsheet:
+    """Spreadsheet with worksheets in memory, counting API calls of all of them."""
+
+    def __init__(self, header: List[str]) -> None:
+        self.id = 'fake'  # pylint: disable=invalid-name
+        self.calls: Counter = Counter()
+        self.sheets: List[FakeWorksheet] = []
+        self.sheet1 = self.add_worksheet('Sheet1', count=False)
+        self.sheet1.rows.append(header)
+
+    def worksheets(self) -> List[FakeWorksheet]:
+        """Worksheets are cached by pygsheets, not counted."""
+        return self.sheets
+
+    def worksheet_by_title(self, title: str, count: bool = True) -> FakeWorksheet:
+        """Counted as API call, as pygsheets fetches sheets when title is not cached."""
+        for wks in self.sheets:
+            if wks.title == title:
+                return wks
+        if count:
+            self.calls['fetch_sheets'] += 1
+        raise pygsheets.WorksheetNotFound()
+
+    def add_worksheet(self, title: str, count: bool = True, **_: Any) -> FakeWorksheet:
+        """Adds empty worksheet."""
+        if count:
+            self.calls['add_worksheet'] += 1
+        wks = FakeWorksheet(self, title, len(self.sheets))
+        self.sheets.append(wks)
+        return wks
+
+
+class FakeGc:
+    """Stand-in for services.gconnect.Gc with FakeSpreadsheet."""
+
+    def __init__(self, header: List[str]) -> None:
+        self.sh = FakeSpreadsheet(header)
+        self.wks = self.sh.sheet1
+        self.header_position: Optional[Tuple[int, int]] = None
+        self.log_wks: Optional[FakeWorksheet] = None
+        self.log_rows = 0
+
+    def reconnect(self, soft: bool) -> None:
+        """Connection to fake never expires."""
+        assert soft is not None
+
+    def post_position(self) -> Tuple[int, int]:
+        """Returns cell under the header, looked up once like Gc does."""
+        if self.header_position is None:
+            rn, cn = self.wks.get_named_range('headerRange').start_addr
+            self.header_position = (rn + 1, cn)
+        return self.header_position
+
+    def invalidate(self) -> None:
+        """Drops cached header position and log worksheet."""
+        self.header_position = None
+        self.log_wks = None
+
+    @property
+    def calls(self) -> int:
+        """Total API calls made to the spreadsheet."""
+        return sum(self.sh.calls.values())
@@ -0,0 +1,77 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains benchmark of logging call overhead on the calling thread, with log
+written synchronously and by background listener. Run it from app folder:
+$ python -m benchmarks.logcalls --calls 20000 --json
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from logging.handlers import QueueHandler
+from typing import Any, Dict
+
+import services.logger
+from config import CFG
+
+
+def measure(calls: int, queued: bool) -> Dict[str, float]:
+    """
+    Logs rows like post_values() does and measures time spent by calling thread.
+    Args:
+        calls: quantity of logging calls
+        queued: whether log is written by background listener
+    Returns:
+        microseconds per call and seconds until all records are written
+    """
+    path = tempfile.mkdtemp(prefix='wbmon-bench-')
+    name = 'bench-queued' if queued else 'bench-sync'
+    lgr = services.logger.start_logger(name, path, queued=queued, console=False)
+    row = [f'{10000000 + i}' for i in range(8)]
+    filter_msg = CFG.LOGGER_FILTER_MSG
+    start_time = time.perf_counter()
+    for _ in range(calls // 2):
+        lgr.info(  # pylint: disable=logging-not-lazy
+            ' | '.join(row) + ' | ' + filter_msg
+        )
+        lgr.info('%s', '|' + ' | '.join(row))
+    calls_time = time.perf_counter() - start_time
+    #  Listener marks every written record done
+    for handler in lgr.handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue.join()
+    total_time = time.perf_counter() - start_time
+    return {
+        'us_per_call': round(calls_time / calls * 1e6, 2),
+        'written_in_sec': round(total_time, 3),
+    }
+
+
+def main() -> None:
+    """Parses arguments, runs benchmark and prints JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--json', action='store_true', help='add JSON lines file')
+    args = parser.parse_args()
+    CFG.LOGGER_JSON = args.json
+    report: Dict[str, Any] = {'calls': args.calls, 'json': args.json}
+    report['sync'] = measure(args.calls, queued=False)
+    report['queued'] = measure(args.calls, queued=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
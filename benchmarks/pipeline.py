@@ -0,0 +1,269 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains offline benchmark of the job pipeline: scraper, parser, publishing
+and saving run against local fixture server and fake Google Sheets. Run it from app
+folder, it prints JSON report:
+$ python -m benchmarks.pipeline --links 200 --backend http --output bench.json
+Backend 'selenium' needs Chrome and chromedriver installed. Any config value can be
+changed with --set, e.g. --set ASYNC_HOST_RATE=50. With --listings, links are seller,
+search, brand and category listings, harvested before scraping:
+$ python -m benchmarks.pipeline --links 10 --listings
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.fakesheets import FakeGc
+from benchmarks.server import server_settings, start_server
+from config import CFG
+
+
+def override(**values: Any) -> None:
+    """Sets values of shared config."""
+    for name, value in values.items():
+        setattr(CFG, name, value)
+
+
+def timed(func: Callable, latencies: List[float]) -> Callable:
+    """Wraps func to append duration of every call to latencies."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start_time)
+
+    return wrapper
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Returns p50, p90, p99 and max of values, in seconds."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(share: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(share * len(ordered)))], 4)
+
+    return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': pick(1)}
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Returns peak RSS of this process and of its waited children (Chrome), in MB."""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'children': round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1
+        ),
+    }
+
+
+def parse_setting(text: str) -> Tuple[str, Any]:
+    """Parses NAME=VALUE, where VALUE is JSON or plain string."""
+    name, _, value = text.partition('=')
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+
+def time_parsers(backend: str) -> List[float]:
+    """Wraps parsers of scrapers to measure them. Returns list of page latencies."""
+    # pylint: disable=import-outside-toplevel
+    import parsing.httpfetcher
+    import parsing.scraper
+
+    page_latencies: List[float] = []
+    parsing.scraper.wb_parser = timed(parsing.scraper.wb_parser, page_latencies)
+    parsing.httpfetcher.http_parser = timed(
+        parsing.httpfetcher.http_parser, page_latencies
+    )
+    if backend == 'async':
+        import parsing.asyncscraper
+
+        parsing.asyncscraper.http_parser = parsing.httpfetcher.http_parser
+    return page_latencies
+
+
+def run(  # pylint: disable=too-many-arguments
+    links: int,
+    backend: str,
+    workers: int,
+    stream: bool,
+    settings: Dict[str, Any],
+    *,
+    listings: bool = False,
+) -> Dict[str, Any]:
+    """
+    Runs pipeline once and measures it.
+    Args:
+        links: quantity of product links, or listing links with listings
+        backend: 'selenium', 'http' or 'async'
+        workers: quantity of selenium drivers
+        stream: publish results by micro-batches while scraping
+        settings: config values to change
+        listings: links are listings, expanded into product links before scraping
+    Returns:
+        report of the run
+    """
+    # pylint: disable=import-outside-toplevel,too-many-locals
+    import parsing.scraper
+    from parsing.asyncscraper import async_interval_scraper
+    from parsing.listings import LISTINGS
+    from parsing.stream import stream_scraper
+    from services.filesaver import save_values
+    from services.gconnect import post_values
+    from services.sinks import ResultStream, make_sinks
+
+    server = start_server()
+    base = f'http://127.0.0.1:{server.server_port}'
+    workdir = tempfile.mkdtemp(prefix='wbmon-bench-')
+    override(**server_settings(base))
+    override(
+        FETCHER_BACKEND='http' if backend in ('http', 'async') else 'selenium',
+        SCRAPER_WORKERS=workers,
+        SCRAPER_INTERPARSE_MIN=0,
+        SCRAPER_INTERPARSE_MAX=0,
+        SCRAPER_BEFOREQUIT_MIN=0,
+        SCRAPER_BEFOREQUIT_MAX=0,
+        STORING_CSV_FILENAME=os.path.join(workdir, 'results.csv'),
+        STORING_SQLITE_FILENAME=os.path.join(workdir, 'results.sqlite'),
+        PLAN_DB_FILENAME=os.path.join(workdir, 'plan.sqlite'),
+        PAGEWAIT_CSV_FILENAME='',
+        SCRAPER_ENGINE='async' if backend == 'async' else 'blocking',
+        PUBLISH_ONLY_CHANGED=False,
+        ARCHIVE_DIR=os.path.join(workdir, 'archive'),
+        ARCHIVE_DB_FILENAME=os.path.join(workdir, 'archive.sqlite'),
+    )
+    override(**settings)
+    page_latencies = time_parsers(backend)
+
+    stages: Dict[str, float] = {}
+    if listings:
+        start_time = time.perf_counter()
+        lnks = LISTINGS.expand(listing_links(base, links))
+        stages['listings'] = time.perf_counter() - start_time
+    else:
+        lnks = [f'{base}/catalog/{10000000 + i}/detail.aspx' for i in range(links)]
+    gc = FakeGc(CFG.DATA_HEADER)
+    try:
+        if stream:
+            full_result = []
+            start_time = time.perf_counter()
+            result_stream = ResultStream(make_sinks(gc))  # type: ignore
+            for result in stream_scraper(lnks):
+                full_result.append(result)
+                result_stream.add(result)
+            result_stream.close()
+            stages['stream'] = time.perf_counter() - start_time
+        else:
+            start_time = time.perf_counter()
+            if backend == 'async':
+                full_result = async_interval_scraper(lnks)
+            else:
+                full_result = parsing.scraper.interval_scraper(lnks)
+            stages['scrape'] = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            post_values(gc=gc, full_result=full_result)  # type: ignore
+            stages['publish'] = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            save_values(full_result=full_result)
+            stages['save'] = time.perf_counter() - start_time
+    finally:
+        server.shutdown()
+
+    errors = sum(CFG.ERROR_PARSE_STRING in result for result in full_result)
+    return {
+        'backend': backend,
+        'links': links,
+        'products': len(lnks),
+        'workers': workers,
+        'settings': settings,
+        'results': len(full_result),
+        'errors': errors,
+        'stages_sec': {name: round(sec, 4) for name, sec in stages.items()},
+        'page_latency_sec': percentiles(page_latencies),
+        'pages_per_minute': round(
+            len(lnks) / stages.get('scrape', stages.get('stream', 0)) * 60, 1
+        ),
+        'sheets_calls': dict(gc.sh.calls, total=gc.calls),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def listing_links(base: str, links: int) -> List[str]:
+    """Returns seller, search, brand and category listing links of fixture server."""
+    kinds = [
+        base + '/seller/{i}',
+        base + '/catalog/0/search.aspx?search=query+{i}',
+        base + '/brands/brand-{i}',
+        base + '/catalog/zhenshchinam/odezhda/platya',
+    ]
+    return [kinds[i % len(kinds)].format(i=i) for i in range(links)]
+
+
+def main() -> None:
+    """Parses arguments, runs benchmark and prints JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--links', type=int, default=200)
+    parser.add_argument(
+        '--backend', choices=['selenium', 'http', 'async'], default='http'
+    )
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument(
+        '--stream', action='store_true', help='publish results while scraping'
+    )
+    parser.add_argument(
+        '--listings', action='store_true', help='links are listings, not products'
+    )
+    parser.add_argument('--output', help='file to write JSON report to')
+    parser.add_argument(
+        '--set',
+        action='append',
+        default=[],
+        type=parse_setting,
+        metavar='NAME=VALUE',
+        help='change config value',
+    )
+    args = parser.parse_args()
+    report = run(
+        args.links,
+        args.backend,
+        args.workers,
+        args.stream,
+        dict(args.set),
+        listings=args.listings,
+    )
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
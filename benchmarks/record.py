@@ -0,0 +1,84 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file records product page and card of live Wildberries products into fixtures of
+fixture server, with fields the page shows. Run it from app folder:
+$ python -m benchmarks.record 12345678 87654321
+"""
+
+import json
+import os
+import sys
+from typing import Dict, List
+
+from benchmarks.server import FIXTURES
+from parsing.drivers import make_driver, quit_driver
+from parsing.httpfetcher import card_url, http_parser, make_session
+from parsing.results import PageResult
+from parsing.wbparser import wb_parser
+
+EXPECTED = os.path.join(FIXTURES, 'expected.json')
+
+#  Fields of PageResult kept in EXPECTED
+FIELDS = ['brand_name', 'goods_name', 'seller_info', 'nm_id', 'cus_rub', 'sel_rub']
+
+
+def record(nm_id: int) -> Dict[str, str]:
+    """
+    Saves card and page of the product to fixtures.
+    Args:
+        nm_id: product ID
+    Returns:
+        fields of the product as selenium parser reads them from the page
+    """
+    link = f'https://www.wildberries.ru/catalog/{nm_id}/detail.aspx'
+    with make_session() as session:
+        response = session.get(card_url(link), timeout=10)
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES, 'cards', f'{nm_id}.json'), 'wb') as file:
+            file.write(response.content)
+        http_result = http_parser(session, link)
+    driver = make_driver()
+    try:
+        page_result = wb_parser(driver, link)
+        with open(
+            os.path.join(FIXTURES, 'pages', f'{nm_id}.html'), 'w', encoding='utf-8'
+        ) as file:
+            file.write(driver.page_source)
+    finally:
+        quit_driver(driver)
+    if http_result is None or page_result[1:] != http_result[1:]:
+        print(f'Card and page differ: {http_result} {page_result}')
+    return fields(page_result)
+
+
+def fields(result: PageResult) -> Dict[str, str]:
+    """Returns fields of result kept in EXPECTED."""
+    return {name: getattr(result, name) for name in FIELDS}
+
+
+def main(nm_ids: List[str]) -> None:
+    """Records every product and adds its fields to EXPECTED."""
+    with open(EXPECTED, encoding='utf-8') as file:
+        expected = json.load(file)
+    for nm_id in nm_ids:
+        expected[nm_id] = record(int(nm_id))
+        print(f'Recorded {nm_id}: {expected[nm_id]}')
+    with open(EXPECTED, 'w', encoding='utf-8') as file:
+        json.dump(expected, file, ensure_ascii=False, indent=2)
+        file.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
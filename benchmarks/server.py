@@ -0,0 +1,155 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains local HTTP server replaying product-page fixtures. Recorded pages
+are served as is from fixtures/pages/<nm_id>.html and cards from
+fixtures/cards/<nm_id>.json, with fields they show in fixtures/expected.json; other
+products are rendered from templates fixtures/product.html and card.json.
+Listing API pages are served from fixtures/listings/<kind>-<page>.json, or rendered:
+LISTING_PAGES pages of LISTING_PAGE_SIZE products from fixtures/listing_product.json.
+Every tenth listing product has no seller, to be scraped one by one.
+"""
+
+import os
+import re
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+NOT_FOUND = b'<html><body><div class="content404">Not found</div></body></html>'
+
+#  Rendered listing size: pages and products per page
+LISTING_PAGES = 3
+LISTING_PAGE_SIZE = 20
+
+
+def product_fields(nm_id: int) -> Dict[str, str]:
+    """Returns deterministic fields of fake product to render templates."""
+    cus_rub = 1000 + nm_id % 900
+    return {
+        'nm_id': str(nm_id),
+        'brand_name': f'Brand {nm_id % 7}',
+        'goods_name': f'Goods {nm_id}',
+        'seller_info': f'Seller {nm_id % 5}',
+        'cus_rub': str(cus_rub),
+        'sel_rub': str(cus_rub * 2),
+    }
+
+
+def fixture(kind: str, nm_id: int, template: str) -> bytes:
+    """Returns recorded fixture of the product as is, or rendered template."""
+    recorded = os.path.join(FIXTURES, kind, f'{nm_id}.{template.rsplit(".", 1)[1]}')
+    if os.path.exists(recorded):
+        with open(recorded, 'rb') as file:
+            return file.read()
+    with open(os.path.join(FIXTURES, template), encoding='utf-8') as file:
+        text = file.read()
+    return Template(text).safe_substitute(product_fields(nm_id)).encode('utf-8')
+
+
+def listing(kind: str, params: Dict[str, List[str]]) -> bytes:
+    """Returns recorded page of listing, or page rendered with products of the key."""
+    page = int(params.pop('page', ['1'])[0])
+    recorded = os.path.join(FIXTURES, 'listings', f'{kind}-{page}.json')
+    if os.path.exists(recorded):
+        with open(recorded, 'rb') as file:
+            return file.read()
+    products = []
+    if page <= LISTING_PAGES:
+        with open(
+            os.path.join(FIXTURES, 'listing_product.json'), encoding='utf-8'
+        ) as file:
+            template = Template(file.read())
+        key = f'{kind}?{sorted(params.items())}'
+        first = 30000000 + zlib.crc32(key.encode()) % 1000 * 1000
+        first += (page - 1) * LISTING_PAGE_SIZE
+        for nm_id in range(first, first + LISTING_PAGE_SIZE):
+            fields = product_fields(nm_id)
+            if nm_id % 10 == 0:
+                fields['seller_info'] = ''
+            products.append(template.safe_substitute(fields))
+    return ('{"data": {"products": [' + ','.join(products) + ']}}').encode('utf-8')
+
+
+def static(*path: str) -> bytes:
+    """Returns fixture file as is."""
+    with open(os.path.join(FIXTURES, *path), 'rb') as file:
+        return file.read()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves product pages, card and listing API responses from fixtures."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Routes request to fixture."""
+        url = urlparse(self.path)
+        body: Optional[bytes] = None
+        content_type = 'text/html; charset=utf-8'
+        page = re.fullmatch(r'/catalog/(\d+)/detail\.aspx', url.path)
+        listing_api = re.fullmatch(r'/listings/(catalog|brand|seller|search)', url.path)
+        if url.path.startswith('/listings/'):
+            content_type = 'application/json; charset=utf-8'
+        if page:
+            body = fixture('pages', int(page.group(1)), 'product.html')
+        elif listing_api:
+            body = listing(listing_api.group(1), parse_qs(url.query))
+        elif url.path == '/listings/menu.json':
+            body = static('listings', 'menu.json')
+        elif re.fullmatch(r'/listings/brands/[^/]+\.json', url.path):
+            body = static('listings', 'brand.json')
+        elif url.path == '/cards/detail':
+            nm_id = parse_qs(url.query).get('nm', [''])[0]
+            if nm_id.isdigit():
+                body = fixture('cards', int(nm_id), 'card.json')
+                content_type = 'application/json; charset=utf-8'
+        self.send_response(200 if body else 404)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body or NOT_FOUND)))
+        self.end_headers()
+        self.wfile.write(body or NOT_FOUND)
+
+    def log_message(self, *args) -> None:
+        """Keeps benchmark output clean."""
+
+
+def start_server() -> ThreadingHTTPServer:
+    """Starts server on free local port in background thread."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_settings(base: str) -> Dict[str, Any]:
+    """
+    Returns config values pointing card and listing APIs to the server at base URL,
+    without sleeps between requests.
+    """
+    return {
+        'HTTP_CARD_URL': base + '/cards/detail?nm={nm_id}',
+        'HTTP_INTERFETCH_SEC': 0,
+        'LISTING_URLS': {
+            'catalog': base + '/listings/catalog?shard={shard}&{query}&page={page}',
+            'brand': base + '/listings/brand?brand={key}&page={page}',
+            'seller': base + '/listings/seller?supplier={key}&page={page}',
+            'search': base + '/listings/search?query={key}&page={page}',
+        },
+        'LISTING_MENU_URL': base + '/listings/menu.json',
+        'LISTING_BRAND_URL': base + '/listings/brands/{slug}.json',
+        'LISTING_INTERPAGE_SEC': 0,
+    }
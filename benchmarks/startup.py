@@ -0,0 +1,105 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains import-time report of program start: imports of main.py and
+creating of the scheduler, in fresh interpreter. Run it from app folder:
+$ python -m benchmarks.startup --top 15 --max-ms 1000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+#  Runs in fresh interpreter, prints timings as JSON to stdout
+START_SCRIPT = """
+import json, time
+start_time = time.perf_counter()
+import main
+imported = time.perf_counter()
+from config import CFG
+CFG.GSHEETS_EARLY_AUTH = False
+CFG.METRICS_PORT = 0
+main.get_scheduler()
+ready = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start_time) * 1000,
+                  'scheduler_ms': (ready - imported) * 1000}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    Returns modules imported at top level and by them, with cumulative time, slowest
+    first. Deeper imports are counted in cumulative time of their parents.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth > 1:
+            continue
+        modules.append(
+            {
+                'module': name.strip(),
+                'depth': depth,
+                'cumulative_ms': round(int(cumulative_us) / 1000, 1),
+                'self_ms': round(int(self_us.split(':')[-1]) / 1000, 1),
+            }
+        )
+    return sorted(modules, key=lambda module: -module['cumulative_ms'])
+
+
+def measure() -> Dict[str, Any]:
+    """Starts program up to the scheduler in fresh interpreter, in temporary folder."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, PYTHONDONTWRITEBYTECODE='')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', START_SCRIPT],
+        cwd=tempfile.mkdtemp(prefix='wbmon-bench-'),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {
+        'import_ms': round(timings['import_ms'], 1),
+        'scheduler_ms': round(timings['scheduler_ms'], 1),
+        'modules': parse_importtime(completed.stderr),
+    }
+
+
+def main() -> None:
+    """Parses arguments, runs benchmark and prints JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to show')
+    parser.add_argument(
+        '--max-ms', type=float, help='exit with error if start is slower than this'
+    )
+    args = parser.parse_args()
+    report = measure()
+    report['total_ms'] = round(report['import_ms'] + report['scheduler_ms'], 1)
+    report['modules'] = report['modules'][: args.top]
+    print(json.dumps(report, indent=2))
+    if args.max_ms and report['total_ms'] > args.max_ms:
+        sys.exit(f'Start took {report["total_ms"]} ms, more than {args.max_ms} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -76,12 +76,194 @@ class Cfg:
         #  Name of the google credentials file
         self.OAUTH_CREDENTIALS_FILE = 'client_secret.json'
 
-        #  Time delay for pygsheet to reconnect
-        self.SEC_PYGSHEET_RECONNECT_TIME = 600
+        #  If true, Google Sheets is authorized and links are loaded in background
+        #  right after start, otherwise at first job
+        self.GSHEETS_EARLY_AUTH = True
+
+        #  Position of header is looked up again after this time, in seconds
+        self.GSHEETS_CACHE_SEC = 24 * 3600
 
         #  Maximum possible autocreated spreadsheets quantity in single day
         self.MAX_SPREADSHEETS_PERDAY = 27
 
+        #  If true, publish rows by chunks (two API calls per chunk), otherwise two API
+        #  calls per every row
+        self.GSHEETS_BATCH_PUBLISH = True
+
+        #  Maximum rows in single chunk when GSHEETS_BATCH_PUBLISH = True
+        self.GSHEETS_BATCH_ROWS = 200
+
+        #  How rows are published. 'top': inserted under the header of sheet1, newest
+        #  first, history is shifted down on every insert. 'append': appended after last
+        #  row of log worksheet, one API call per chunk whatever history size is. Opt-in:
+        #  'append' adds log, index and newest worksheets to existing spreadsheet
+        self.GSHEETS_LAYOUT = 'top'
+
+        #  When new log worksheet is started with 'append' layout. 'month': worksheet
+        #  per month, titled like wbmon-2023-12. 'rows': next worksheet, titled like
+        #  wbmon-2, when GSHEETS_ROLLOVER_ROWS rows are published
+        self.GSHEETS_ROLLOVER = 'month'
+        self.GSHEETS_ROLLOVER_ROWS = 50000
+
+        #  Prefix of log worksheets titles with 'append' layout
+        self.GSHEETS_WORKSHEET_PREFIX = 'wbmon-'
+
+        #  Worksheet listing log worksheets with links to them
+        self.GSHEETS_INDEX_TITLE = 'index'
+
+        #  Worksheet showing up to GSHEETS_NEWEST_ROWS rows of current log worksheet,
+        #  newest on top, by formula. If empty, is not created
+        self.GSHEETS_NEWEST_TITLE = 'newest'
+        self.GSHEETS_NEWEST_ROWS = 5000
+
+        # CHANGE DETECTION
+
+        #  If true, publish and save only results whose prices or seller changed since
+        #  last job, new products and errors. Others are counted in heartbeat log line.
+        #  Off by default: sheet then gets rows of every job, as before
+        self.PUBLISH_ONLY_CHANGED = False
+
+        #  Local index with last known values of every product
+        self.CHANGES_INDEX_FILENAME = 'wbmon_index.sqlite'
+
+        # RETRIES AND CIRCUIT BREAKER
+
+        #  Attempts in total of flaky call, e.g. Google Sheets request
+        self.RETRY_ATTEMPTS = 4
+
+        #  Attempts in total to load page which was not ready in PAGELOAD_MAXTIME
+        self.PAGE_RETRY_ATTEMPTS = 2
+
+        #  Pause before second attempt is random up to this, in seconds. Doubles with
+        #  every next attempt, up to RETRY_MAX_DELAY
+        self.RETRY_BASE_DELAY = 2
+        self.RETRY_MAX_DELAY = 60
+
+        #  Scraping is paused when share of failed pages among last BREAKER_WINDOW
+        #  reaches BREAKER_ERROR_RATE, but not before BREAKER_MIN_CALLS pages
+        self.BREAKER_WINDOW = 20
+        self.BREAKER_MIN_CALLS = 5
+        self.BREAKER_ERROR_RATE = 0.5
+
+        #  Pause of scraping when breaker opens, in seconds
+        self.BREAKER_COOLDOWN = 600
+
+        # ADAPTIVE SCHEDULING
+
+        #  If true, job is sized to finish before next cron run: sleeps are shrunk,
+        #  drivers added, and links which do not fit are deferred to next runs. With
+        #  SHARDING claimed links are never deferred, only the pace is planned
+        self.PLAN_ADAPTIVE = True
+
+        #  Parse time of every link from former jobs and links deferred
+        self.PLAN_DB_FILENAME = 'wbmon_plan.sqlite'
+
+        #  Share of time before next cron run the job may take
+        self.PLAN_WINDOW_SHARE = 0.9
+
+        #  Parse time of link never parsed before, in seconds
+        self.PLAN_DEFAULT_LINK_SEC = 20
+
+        #  Sleep between links is never shrunk below, in seconds
+        self.PLAN_INTERPARSE_FLOOR = 10
+
+        #  Maximum selenium drivers planner may run
+        self.PLAN_MAX_WORKERS = 2
+
+        #  Weight of the last parse time in moving average
+        self.PLAN_TIMING_WEIGHT = 0.3
+
+        # LINK INGESTION
+
+        #  If true, links are brought to canonical form before the job, and every
+        #  product (nm_id) is scraped once per job, however many times it is listed
+        self.LINKS_NORMALIZE = True
+
+        #  Link of every product by nm_id
+        self.LINKS_DB_FILENAME = 'wbmon_links.sqlite'
+
+        # REFRESH POLICIES
+
+        #  If true, every link is scraped only when it is due: links with changed
+        #  prices every REFRESH_MIN_HOURS, stable ones less often. Fixed interval in
+        #  hours can be set for link in column B of links sheet or after link in
+        #  LINKS_FILE, 'auto' or empty is adaptive. CRON_ARGS is then the tick
+        #  of checking due links. Off by default: every link is scraped every job
+        self.REFRESH_POLICIES = False
+
+        #  Refresh interval and next due time of every link
+        self.REFRESH_DB_FILENAME = 'wbmon_refresh.sqlite'
+
+        #  Interval of stable link is multiplied by this after every unchanged result
+        self.REFRESH_BACKOFF = 2
+
+        # STREAMING
+
+        #  If true, results are published while job runs, by micro-batches, instead of
+        #  after the last link
+        self.STREAM_RESULTS = True
+
+        #  Batch is flushed when it has this many results
+        self.STREAM_BATCH_SIZE = 10
+
+        #  Batch is flushed when its oldest result waits longer, in seconds
+        self.STREAM_FLUSH_SEC = 300
+
+        #  Maximum results waiting between scraper and publishing
+        self.STREAM_QUEUE_SIZE = 100
+
+        # JOB QUEUE
+
+        #  If true, every result is written to JOB_QUEUE_FILENAME as soon as it is
+        #  parsed, and job killed in the middle is resumed before next cron fire time
+        self.JOB_QUEUE = True
+
+        #  Durable queue of jobs and their results. With SHARDING, workers sharing it
+        #  should have SHARD_WORKER_ID set to resume their jobs after restart
+        self.JOB_QUEUE_FILENAME = 'wbmon_queue.sqlite'
+
+        # SHARDING
+
+        #  If true, links are shared between several wbmon processes on one host
+        #  through SHARD_DB_FILENAME, one of them publishes all results. SQLite does
+        #  not work over network filesystem, so workers of other hosts are ignored
+        self.SHARDING = False
+
+        #  Coordination database, the same file for all workers
+        self.SHARD_DB_FILENAME = 'wbmon_shards.sqlite'
+
+        #  ID of this worker. If empty, hostname and process ID are used
+        self.SHARD_WORKER_ID = os.getenv('WBMON_WORKER_ID', '')
+
+        #  Worker is alive while its heartbeat is not older, in seconds. Links claimed
+        #  by worker not alive are claimed again by others
+        self.SHARD_HEARTBEAT_TTL = 90
+
+        #  Interval in seconds to check results of other workers and links of lost
+        #  workers while merging
+        self.SHARD_MERGE_POLL = 10
+
+        # PAGE ARCHIVE
+
+        #  If true, source of every page parsed by selenium is archived compressed,
+        #  to debug parser and parse again without crawling. Takes up to ARCHIVE_MAX_MB
+        #  of disk. Needs zstandard package from requirements.txt, without it archive
+        #  is off with warning
+        self.ARCHIVE_PAGES = False
+
+        #  Folder of compressed pages, and index of them by nm_id and time
+        self.ARCHIVE_DIR = 'wbmon_archive'
+        self.ARCHIVE_DB_FILENAME = 'wbmon_archive.sqlite'
+
+        #  zstd compression level, 1 (fast) to 22 (small)
+        self.ARCHIVE_LEVEL = 6
+
+        #  Pages older than ARCHIVE_MAX_DAYS are dropped, and the oldest ones while
+        #  archive is bigger than ARCHIVE_MAX_MB. Checked every ARCHIVE_PRUNE_EVERY pages
+        self.ARCHIVE_MAX_DAYS = 30
+        self.ARCHIVE_MAX_MB = 1024
+        self.ARCHIVE_PRUNE_EVERY = 100
+
         # STORING TO CSV
 
         #  If true, will save results to file
@@ -93,6 +275,13 @@ class Cfg:
         # Fields separator in csv:
         self.STORING_CSV_SEPARATOR = ';'
 
+        #  Storage of results when SAVE_TO_FILE = True: 'csv' — text file, 'sqlite' —
+        #  typed table indexed by day and product ID, with price history read API
+        self.STORAGE_BACKEND = 'csv'
+
+        #  Filename when STORAGE_BACKEND = 'sqlite'
+        self.STORING_SQLITE_FILENAME = 'wbmon_results.sqlite'
+
         # USER INTERFACE
 
         #  Width of fields to pretty log results in console logger
@@ -110,6 +299,36 @@ class Cfg:
         #  Time between loads in dummyscraper
         self.SEC_WAIT_DUMMYSCRAPER = 5
 
+        # METRICS
+
+        #  File to write metrics to after every job, in Prometheus text format. Empty
+        #  string disables writing
+        self.METRICS_FILENAME = 'wbmon_metrics.prom'
+
+        #  Port of HTTP endpoint with metrics in Prometheus text format. 0 disables it
+        self.METRICS_PORT = 0
+
+        #  Upper bounds of histograms buckets, in seconds
+        self.METRICS_BUCKETS = [
+            0.01,
+            0.05,
+            0.1,
+            0.25,
+            0.5,
+            1,
+            2.5,
+            5,
+            10,
+            30,
+            60,
+            120,
+            300,
+            600,
+            1800,
+            3600,
+            10800,
+        ]
+
         # LOGGER
 
         #  Path to logger files
@@ -124,11 +343,169 @@ class Cfg:
         #  Quantity of files, keeping by rotating logger.
         self.QTY_BACKUPS_ROTATING_LOGGER = 5
 
+        #  If true, log records are formatted and written in background thread, so
+        #  logging does not hold parsing
+        self.LOGGER_QUEUED = True
+
+        #  If true, log is also written as JSON lines to FILE_JSON_LOGGER
+        self.LOGGER_JSON = False
+
+        #  Filename for JSON lines logger
+        self.FILE_JSON_LOGGER = 'logger.jsonl'
+
+        #  When JSON lines file is rotated, 'when' of TimedRotatingFileHandler
+        self.LOGGER_JSON_ROTATE_WHEN = 'midnight'
+
+        #  Quantity of files, keeping by JSON lines logger
+        self.QTY_BACKUPS_JSON_LOGGER = 14
+
         # PARSER
 
         #  Arguments to pass to Chrome driver. Better not to touch
         self.CHROME_DRIVER_ARGS = ['--headless', '--no-sandbox']
 
+        #  If true, driver does not load images and URLs matching DRIVER_BLOCK_URLS
+        self.DRIVER_BLOCK_RESOURCES = True
+
+        #  URL patterns blocked with CDP Network.setBlockedURLs, in URLPattern syntax
+        #  (https://urlpattern.spec.whatwg.org/). Chrome not supporting it blocks images
+        #  only, with warning
+        self.DRIVER_BLOCK_URLS = [
+            '*://*:*/*.png',
+            '*://*:*/*.jpg',
+            '*://*:*/*.jpeg',
+            '*://*:*/*.webp',
+            '*://*:*/*.gif',
+            '*://*:*/*.svg',
+            '*://*:*/*.woff',
+            '*://*:*/*.woff2',
+            '*://*:*/*.ttf',
+            '*://*google-analytics.com:*/*',
+            '*://*googletagmanager.com:*/*',
+            '*://*doubleclick.net:*/*',
+            '*://mc.yandex.ru:*/*',
+            '*://top-fwz1.mail.ru:*/*',
+            '*://*vk.com:*/*',
+        ]
+
+        #  Exceptions of DRIVER_BLOCK_URLS, URL patterns never to block. Patterns of
+        #  DRIVER_BLOCK_URLS still block all other URLs
+        self.DRIVER_ALLOW_URLS = []
+
+        #  If true, drivers are kept warm between jobs, otherwise quit() after every job
+        self.DRIVER_KEEP_WARM = True
+
+        #  Warm driver is recycled (quit, next job starts new) after this many pages
+        self.DRIVER_MAX_PAGES = 600
+
+        #  Warm driver is recycled when its Chrome processes use more memory, in MB
+        self.DRIVER_MAX_RSS_MB = 1500
+
+        #  Quantity of parallel Chrome drivers (workers), scraping links from shared
+        #  queue. Each worker sleeps between its own links. 1 means single driver mode
+        self.SCRAPER_WORKERS = 1
+
+        #  Parser mode: 'elements' — find_element() per field, 'script' — all fields with
+        #  single execute_script() call
+        self.PARSER_MODE = 'elements'
+
+        # ASYNC ENGINE
+
+        #  Engine running jobs: 'blocking' — interval_scraper() with sleeps between
+        #  links, 'async' — asyncio engine fetching many links over HTTP at once
+        self.SCRAPER_ENGINE = 'blocking'
+
+        #  Maximum quantity of simultaneous requests in async engine
+        self.ASYNC_CONCURRENCY = 8
+
+        #  Requests per second to single host in async engine (token-bucket rate)
+        self.ASYNC_HOST_RATE = 2.0
+
+        #  Maximum quantity of requests to single host at once (token-bucket size)
+        self.ASYNC_HOST_BURST = 4
+
+        #  Timeout in seconds for single request in async engine: to connect, and
+        #  between bytes of response
+        self.ASYNC_REQUEST_TIMEOUT = 30
+
+        # PAGE READINESS
+
+        #  How to detect that page is loaded: 'aside' — wait product-page__aside to be
+        #  visible, 'selectors' — wait all the fields parser needs, abort on error page
+        self.PAGE_READY_MODE = 'selectors'
+
+        #  Chrome pageLoadStrategy: 'normal' (all resources loaded), 'eager' (DOM is
+        #  ready, selectors mode waits the fields) or 'none'
+        self.PAGE_LOAD_STRATEGY = 'normal'
+
+        #  Interval in seconds between page readiness checks
+        self.PAGE_READY_POLL = 0.25
+
+        #  File to record wait time of every link, to tune waits. It grows without
+        #  limit, so recording is off by default: empty string disables it
+        self.PAGEWAIT_CSV_FILENAME = ''
+
+        # HTTP FETCHER
+
+        #  Backend to get product data: 'selenium' — render page in Chrome, 'http' — get
+        #  card over plain HTTP, links it can not resolve are passed to selenium
+        self.FETCHER_BACKEND = 'selenium'
+
+        #  URL of card API. {nm_id} is replaced with product ID. Point it to local stub
+        #  with recorded cards for testing
+        self.HTTP_CARD_URL = (
+            'https://card.wb.ru/cards/v1/detail?appType=1&curr=rub&dest=-1257786'
+            '&nm={nm_id}'
+        )
+
+        #  Timeout in seconds for single HTTP request
+        self.HTTP_TIMEOUT = 15
+
+        #  Quantity of kept-alive connections in HTTP session pool
+        self.HTTP_POOL_SIZE = 10
+
+        #  Pause in seconds between HTTP requests
+        self.HTTP_INTERFETCH_SEC = 1
+
+        #  User-Agent header for HTTP requests
+        self.HTTP_USER_AGENT = (
+            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+            'Chrome/120.0.0.0 Safari/537.36'
+        )
+
+        # LISTINGS
+
+        #  If true, category, brand, seller and search links are harvested from listing
+        #  API: every product on their pages is published, and only products whose
+        #  data is missing from the listing are scraped one by one. Off by default:
+        #  sheet gets rows of listed links only
+        self.SCRAPE_LISTINGS = False
+
+        #  Maximum pages of single listing, and pause in seconds between pages
+        self.LISTING_MAX_PAGES = 20
+        self.LISTING_INTERPAGE_SEC = 1
+
+        #  Listing API URLs by kind of link. {page} is page number, {key} is seller ID,
+        #  brand ID or search query, {shard} and {query} are from LISTING_MENU_URL
+        self.LISTING_URLS = {
+            'catalog': 'https://catalog.wb.ru/catalog/{shard}/catalog?appType=1'
+            '&curr=rub&dest=-1257786&{query}&page={page}',
+            'brand': 'https://catalog.wb.ru/brands/b/catalog?appType=1&curr=rub'
+            '&dest=-1257786&brand={key}&page={page}',
+            'seller': 'https://catalog.wb.ru/sellers/catalog?appType=1&curr=rub'
+            '&dest=-1257786&supplier={key}&page={page}',
+            'search': 'https://search.wb.ru/exactmatch/ru/common/v4/search?appType=1'
+            '&curr=rub&dest=-1257786&resultset=catalog&query={key}&page={page}',
+        }
+
+        #  Menu with shard and query of every category, and brand info by brand link
+        self.LISTING_MENU_URL = (
+            'https://static-basket-01.wbbasket.ru/vol0/data/main-menu-ru-ru-v2.json'
+        )
+        self.LISTING_BRAND_URL = (
+            'https://static-basket-01.wbbasket.ru/vol0/data/brands/{slug}.json'
+        )
+
         if test:
             logger.info('Cfg Class says: TEST CONFIG LOADING')
             # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -164,12 +541,22 @@ class Cfg:
             #  Delay before start to load ASAP
             self.ASAPDELAY = 1
 
-            #  How many links maximum will be managed
+            #  How many links maximum will be scraped in single job, of links due
             self.MAX_LINK_QUANTITY = 2
 
             #  Parameter misfire_grace_time for scheduler, time to delete overdue jobs
             self.MISFIRE_TIME = 30
 
+            #  Parse every page with all parser modes and log timings of them. Slower
+            self.PARSER_COMPARE_TIMING = True
+
+            #  How long workers wait for results of the whole round, in seconds
+            self.SHARD_MERGE_TIMEOUT = 120
+
+            #  Min and max refresh interval of link with adaptive policy, in hours
+            self.REFRESH_MIN_HOURS = 1 / 30
+            self.REFRESH_MAX_HOURS = 0.5
+
         else:
             logger.info('Cfg Class says: WORKING CONFIG LOADING')
             # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -190,3 +577,11 @@ class Cfg:
             self.ASAPDELAY = 5
             self.MAX_LINK_QUANTITY = 200
             self.MISFIRE_TIME = 3600
+            self.PARSER_COMPARE_TIMING = False
+            self.SHARD_MERGE_TIMEOUT = 3 * 3600
+            self.REFRESH_MIN_HOURS = 8
+            self.REFRESH_MAX_HOURS = 7 * 24
+
+
+#  The only config instance, shared by all modules
+CFG = Cfg()
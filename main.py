@@ -15,13 +15,9 @@
 
 import logging
 
-from dotenv import load_dotenv
-
 from parsing.scheduler import get_scheduler
 from services.logger import logger
 
-load_dotenv('.env')
-
 logger = logging.getLogger('A.ma')
 logger.setLevel(logging.DEBUG)
 
@@ -0,0 +1,169 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains asyncio scraping engine with concurrency and per-host limits."""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from config import CFG
+from parsing.httpfetcher import card_url, http_parser, make_session
+from parsing.listings import LISTINGS
+from parsing.results import PageResult, ResultCallback, in_link_order
+from parsing.scraper import fill_missed
+from services.metrics import timed
+
+logger = logging.getLogger('A.AS')
+logger.setLevel(logging.DEBUG)
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """
+    Token-bucket rate limiter for single host: ASYNC_HOST_RATE tokens per second,
+    not more than ASYNC_HOST_BURST at once. Should be created inside running loop.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Waits until token is available and takes it."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncScraper:
+    """
+    Fetches many links at once. Global concurrency is capped by ASYNC_CONCURRENCY,
+    every host has own TokenBucket, every request is limited by ASYNC_REQUEST_TIMEOUT.
+    Blocking HTTP calls run in thread pool of the same size as concurrency cap.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session,
+        executor: ThreadPoolExecutor,
+        on_result: Optional[ResultCallback] = None,
+    ):
+        self.session = session
+        self.executor = executor
+        self.on_result = on_result
+        self.semaphore = asyncio.Semaphore(CFG.ASYNC_CONCURRENCY)
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, link: str) -> TokenBucket:
+        """Returns rate limiter for host which will be requested for the link."""
+        host = urlparse(card_url(link) or link).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(CFG.ASYNC_HOST_RATE, CFG.ASYNC_HOST_BURST)
+        return self.buckets[host]
+
+    async def fetch(self, i: int, link: str) -> Optional[PageResult]:
+        """
+        Fetches single link with limits. Token of the host is taken before slot of
+        concurrency, so requests waiting for rate do not hold slots. Request is limited
+        by timeout of requests itself: thread running it can not be cancelled.
+        Args:
+            i: index of the link, for logging
+            link: link to fetch
+        Returns:
+            PageResult, None if link not resolved or timed out
+        """
+        await self.bucket(link).acquire()
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            start_time = time.time()
+            result = await loop.run_in_executor(
+                self.executor,
+                http_parser,
+                self.session,
+                link,
+                CFG.ASYNC_REQUEST_TIMEOUT,
+            )
+            end_time = time.time()
+            logger.debug(
+                'Fetched link №%s in %s sec', i + 1, round(end_time - start_time, 2)
+            )
+        if self.on_result and result:
+            await loop.run_in_executor(None, self.on_result, result)
+        return result
+
+    async def run(self, lnks: List[str]) -> List[Optional[PageResult]]:
+        """Fetches all links concurrently, results are in order of lnks."""
+        return list(
+            await asyncio.gather(*(self.fetch(i, link) for i, link in enumerate(lnks)))
+        )
+
+
+async def async_scraper(
+    lnks: List[str], on_result: Optional[ResultCallback] = None
+) -> List[Optional[PageResult]]:
+    """
+    Coroutine running AsyncScraper for the links.
+    Args:
+        lnks: list of links for single job
+        on_result: function to call with every resolved result as soon as it is got
+    Returns:
+        list of PageResult in order of lnks, None for links it could not resolve
+    """
+    with make_session() as session, ThreadPoolExecutor(
+        max_workers=CFG.ASYNC_CONCURRENCY, thread_name_prefix='async-fetch'
+    ) as executor:
+        return await AsyncScraper(session, executor, on_result).run(lnks)
+
+
+@timed('scrape')
+def async_interval_scraper(
+    lnks: List[str], on_result: Optional[ResultCallback] = None
+) -> List[PageResult]:
+    """
+    Sync wrapper to call asyncio engine from interval_job() instead of
+    interval_scraper(). Unresolved links are parsed with selenium. Results harvested
+    from listings are given without fetching.
+    Args:
+        lnks: list of links for single job
+        on_result: function to call with every result as soon as it is parsed
+    Returns:
+        list of PageResult instances, in order of lnks
+    """
+    left, harvested = LISTINGS.take(lnks, on_result)
+    logger.info('Async scraper started. Have %s links', len(left))
+    start_time = time.time()
+    partial = asyncio.run(async_scraper(left, on_result))
+    end_time = time.time()
+    logger.info(
+        'Async scraper resolved %s of %s links in %s sec',
+        sum(result is not None for result in partial),
+        len(left),
+        round(end_time - start_time, 0),
+    )
+    return in_link_order(lnks, harvested + fill_missed(left, partial, on_result))
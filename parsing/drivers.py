@@ -0,0 +1,200 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains Chrome driver creating and keeping warm drivers between jobs."""
+
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+from config import CFG
+
+logger = logging.getLogger('A.DR')
+logger.setLevel(logging.DEBUG)
+
+
+def make_driver(block: Optional[bool] = None) -> webdriver.Chrome:
+    """
+    Creates Chrome driver with CHROME_DRIVER_ARGS.
+    Args:
+        block: whether to block resources, DRIVER_BLOCK_RESOURCES if None
+    """
+    if block is None:
+        block = CFG.DRIVER_BLOCK_RESOURCES
+    options = webdriver.ChromeOptions()
+    for arg in CFG.CHROME_DRIVER_ARGS:
+        options.add_argument(arg)
+    options.page_load_strategy = CFG.PAGE_LOAD_STRATEGY
+    if block:
+        options.add_experimental_option(
+            'prefs', {'profile.managed_default_content_settings.images': 2}
+        )
+    driver = webdriver.Chrome(options=options)
+    if block:
+        driver.execute_cdp_cmd('Network.enable', {})
+        try:
+            driver.execute_cdp_cmd(
+                'Network.setBlockedURLs', {'urlPatterns': block_patterns()}
+            )
+        except WebDriverException as exc:
+            logger.warning('URLs are not blocked, Chrome is too old: %s', exc.msg)
+    return driver
+
+
+def block_patterns() -> List[Dict[str, Any]]:
+    """
+    Returns BlockPattern list for CDP Network.setBlockedURLs. Chrome uses the first
+    pattern matching URL, so exceptions of DRIVER_ALLOW_URLS go before patterns of
+    DRIVER_BLOCK_URLS.
+    """
+    return [
+        {'urlPattern': pattern, 'block': False} for pattern in CFG.DRIVER_ALLOW_URLS
+    ] + [{'urlPattern': pattern, 'block': True} for pattern in CFG.DRIVER_BLOCK_URLS]
+
+
+def driver_rss_mb(driver: webdriver.Chrome) -> float:
+    """
+    Returns resident memory of chromedriver and all its child Chrome processes, in MB.
+    Reads /proc, so returns 0 where there is no /proc.
+    """
+    try:
+        root = driver.service.process.pid
+        children: Dict[int, List[int]] = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat', encoding='utf-8') as file:
+                    ppid = int(file.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        total_kb = 0
+        pids = [root]
+        while pids:
+            pid = pids.pop()
+            pids.extend(children.get(pid, []))
+            try:
+                with open(f'/proc/{pid}/status', encoding='utf-8') as file:
+                    for line in file:
+                        if line.startswith('VmRSS:'):
+                            total_kb += int(line.split()[1])
+            except OSError:
+                continue
+    except (AttributeError, OSError):
+        return 0
+    return total_kb / 1024
+
+
+def driver_healthy(driver: webdriver.Chrome) -> bool:
+    """Checks that driver answers commands."""
+    try:
+        return driver.execute_script('return 1') == 1
+    except WebDriverException:
+        return False
+
+
+def quit_driver(driver: webdriver.Chrome) -> None:
+    """Quits driver, ignoring errors of already dead one."""
+    try:
+        driver.quit()
+    except WebDriverException:
+        logger.warning('Driver failed to quit properly')
+
+
+class DriverManager:
+    """
+    Keeps warm drivers between jobs. Aims of the class creating is:
+    1. Do not cold-start Chrome on every job when DRIVER_KEEP_WARM = True.
+    2. Health-check driver before reuse, recycle it after DRIVER_MAX_PAGES pages or
+       DRIVER_MAX_RSS_MB memory.
+    3. Quit all drivers when scheduler stops or program exits.
+    """
+
+    def __init__(self) -> None:
+        self.idle: List[webdriver.Chrome] = []
+        self.pages: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self) -> webdriver.Chrome:
+        """Returns healthy warm driver if there is one, otherwise creates new."""
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                driver = self.idle.pop()
+            if driver_healthy(driver):
+                logger.debug('Warm driver reused')
+                return driver
+            logger.warning('Warm driver is not healthy, will be recycled')
+            self.recycle(driver)
+        driver = make_driver()
+        with self.lock:
+            self.pages[driver.session_id] = 0
+        logger.debug('New driver started')
+        return driver
+
+    def release(self, driver: webdriver.Chrome, pages: int) -> None:
+        """
+        Returns driver after job. Keeps it warm, or quits it after pause when warm
+        drivers are off or driver exceeded limits.
+        Args:
+            driver: driver to release
+            pages: quantity of pages driver loaded in the job
+        """
+        if not CFG.DRIVER_KEEP_WARM:
+            beforequit_sleep = random.randint(
+                CFG.SCRAPER_BEFOREQUIT_MIN, CFG.SCRAPER_BEFOREQUIT_MAX
+            )
+            logger.info('Driver will quit() after sleep: %s sec', beforequit_sleep)
+            time.sleep(beforequit_sleep)
+            self.recycle(driver)
+            return
+        with self.lock:
+            total = self.pages.get(driver.session_id, 0) + pages
+            self.pages[driver.session_id] = total
+        rss = driver_rss_mb(driver)
+        if total >= CFG.DRIVER_MAX_PAGES or rss >= CFG.DRIVER_MAX_RSS_MB:
+            logger.info('Driver recycled after %s pages, %s MB', total, round(rss))
+            self.recycle(driver)
+            return
+        with self.lock:
+            self.idle.append(driver)
+        logger.debug('Driver kept warm: %s pages, %s MB', total, round(rss))
+
+    def recycle(self, driver: webdriver.Chrome) -> None:
+        """Quits driver and forgets it."""
+        with self.lock:
+            self.pages.pop(driver.session_id, None)
+        quit_driver(driver)
+
+    def shutdown(self, *_) -> None:
+        """Quits all warm drivers. Accepts args to be used as scheduler listener."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for driver in idle:
+            self.recycle(driver)
+        if idle:
+            logger.info('%s warm drivers quit', len(idle))
+
+
+#  The only driver manager, shared by all scrapers
+DRIVERS = DriverManager()
+atexit.register(DRIVERS.shutdown)
@@ -0,0 +1,191 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains browserless fetcher, getting product data with plain HTTP."""
+
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import CFG
+from parsing.links import link_nm_id
+from parsing.planner import PLANNER
+from parsing.results import SOLDOUT, PageResult, ResultCallback
+from services.metrics import METRICS
+
+logger = logging.getLogger('A.HF')
+logger.setLevel(logging.DEBUG)
+
+
+def make_session() -> requests.Session:
+    """Creates HTTP session with connection pool of HTTP_POOL_SIZE."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=CFG.HTTP_POOL_SIZE, pool_maxsize=CFG.HTTP_POOL_SIZE
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': CFG.HTTP_USER_AGENT})
+    return session
+
+
+def card_url(link: str) -> Optional[str]:
+    """Returns card API URL for the link, None if link has not product ID."""
+    nm_id = link_nm_id(link)
+    return CFG.HTTP_CARD_URL.format(nm_id=nm_id) if nm_id else None
+
+
+def http_scraper(
+    lnks: List[str], on_result: Optional[ResultCallback] = None
+) -> List[Optional[PageResult]]:
+    """
+    Scraper for FETCHER_BACKEND = 'http'. Gets all links with one pooled session.
+    Args:
+        lnks: list of links for single job
+        on_result: function to call with every resolved result as soon as it is got
+    Returns:
+        list of PageResult in order of lnks, None for links it could not resolve
+    """
+    logger.info('HTTP scraper started. Have %s links', len(lnks))
+    full_result: List[Optional[PageResult]] = []
+    with make_session() as session:
+        for i, link in enumerate(lnks):
+            if i:
+                time.sleep(CFG.HTTP_INTERFETCH_SEC)
+            start_time = time.time()
+            full_result.append(http_parser(session, link))
+            end_time = time.time()
+            if full_result[-1]:
+                PLANNER.observe(link, end_time - start_time)
+            if on_result and full_result[-1]:
+                on_result(full_result[-1])
+            logger.debug(
+                'Fetched link №%s of %s in %s sec',
+                i + 1,
+                len(lnks),
+                round(end_time - start_time, 2),
+            )
+    logger.info(
+        'HTTP scraper resolved %s of %s links',
+        sum(result is not None for result in full_result),
+        len(lnks),
+    )
+    return full_result
+
+
+def http_parser(
+    session: requests.Session, link: str, timeout: Optional[float] = None
+) -> Optional[PageResult]:
+    """
+    Parser getting product card over HTTP, without browser.
+    Args:
+        session: HTTP session
+        link: link to parse
+        timeout: seconds to connect and to wait for data, HTTP_TIMEOUT if not given
+    Returns:
+        PageResult like wb_parser() returns, None if link can not be resolved
+    """
+    nm_id = link_nm_id(link)
+    url = card_url(link)
+    if nm_id is None or url is None:
+        logger.debug('No product ID in link: %s', link)
+        return None
+    try:
+        response = session.get(url, timeout=timeout or CFG.HTTP_TIMEOUT)
+        response.raise_for_status()
+        card = response.json()
+    except requests.Timeout as exc:
+        logger.warning('Card of %s timed out: %s', nm_id, exc)
+        METRICS.inc('wbmon_timeouts_total', stage='http_fetch')
+        return None
+    except (requests.RequestException, ValueError) as exc:
+        logger.warning('Can not fetch card of %s: %s', nm_id, exc)
+        return None
+    return card_result(card, link, nm_id)
+
+
+def card_result(card: Dict[str, Any], link: str, nm_id: str) -> Optional[PageResult]:
+    """
+    Converts card API response into PageResult.
+    Args:
+        card: decoded JSON of card API
+        link: link of the product
+        nm_id: product ID from the link
+    Returns:
+        PageResult, None if card has not all the fields
+    """
+    products = card.get('data', {}).get('products') or []
+    product = next((p for p in products if str(p.get('id')) == nm_id), None)
+    if product is None:
+        logger.debug('No product %s in card', nm_id)
+        return None
+    return product_result(product, link, nm_id)
+
+
+def product_result(
+    product: Dict[str, Any], link: str, nm_id: str
+) -> Optional[PageResult]:
+    """
+    Converts product of card or listing API into PageResult.
+    Args:
+        product: decoded JSON of single product
+        link: link of the product
+        nm_id: product ID
+    Returns:
+        PageResult, None if product has not all the fields
+    """
+    brand_name = product.get('brand')
+    goods_name = product.get('name')
+    seller_info = product.get('supplier')
+    if not (brand_name and goods_name and seller_info):
+        logger.debug('Card of %s has no brand, name or seller', nm_id)
+        return None
+
+    prices = card_prices(product)
+    if prices is None:
+        logger.debug('Card of %s has no prices', nm_id)
+        return None
+    cus_rub, sel_rub = prices
+
+    date = datetime.now().strftime(CFG.FORMAT_TIMESTAMP_PARSED)
+    return PageResult(
+        date,
+        link,
+        brand_name,
+        goods_name,
+        seller_info.strip(),
+        nm_id,
+        cus_rub,
+        sel_rub,
+    )
+
+
+def card_prices(product: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Returns 'customer' and 'seller' prices in rubles from card product. Card keeps
+    prices in kopecks, either in product itself or in its sizes.
+    """
+    sizes = product.get('sizes') or []
+    if sizes and not any(size.get('stocks') for size in sizes):
+        return [SOLDOUT, SOLDOUT]
+    if 'salePriceU' in product and 'priceU' in product:
+        return [str(product['salePriceU'] // 100), str(product['priceU'] // 100)]
+    for size in sizes:
+        price = size.get('price')
+        if price and 'product' in price and 'basic' in price:
+            return [str(price['product'] // 100), str(price['basic'] // 100)]
+    return None
@@ -0,0 +1,167 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains link ingestion: canonical links and index of products by nm_id."""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from config import CFG
+from parsing.planner import PLANNER
+from services.metrics import METRICS
+from services.sqlitedb import connect
+
+logger = logging.getLogger('A.LN')
+logger.setLevel(logging.DEBUG)
+
+#  Product ID in links like https://www.wildberries.ru/catalog/12345678/detail.aspx,
+#  not 0 of search links like https://www.wildberries.ru/catalog/0/search.aspx
+NM_ID_PATTERN = re.compile(r'/catalog/([1-9]\d*)(?:/|$)')
+
+#  Hosts which are the same site as their value
+HOST_ALIASES = {'wildberries.ru': 'www.wildberries.ru'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    nm_id TEXT PRIMARY KEY,
+    link TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+"""
+
+#  Links of the job, each product once. duplicates are links dropped, saved_sec is
+#  their parse time estimated by planner
+Ingested = namedtuple('Ingested', 'links duplicates saved_sec')
+
+
+def link_nm_id(link: str) -> Optional[str]:
+    """Returns product ID from the link, None if link has not it."""
+    match = NM_ID_PATTERN.search(urlsplit(link.strip()).path)
+    return match.group(1) if match else None
+
+
+def canonical_link(link: str) -> str:
+    """
+    Returns link in the single form: with scheme, lowercase host, without fragment.
+    Product link is reduced to /catalog/<nm_id>/detail.aspx without query. Empty
+    string for empty link.
+    """
+    link = link.strip()
+    if not link:
+        return ''
+    if '://' not in link:
+        link = 'https://' + link.lstrip('/')
+    parts = urlsplit(link)
+    host = parts.netloc.lower()
+    host = HOST_ALIASES.get(host, host)
+    nm_id = link_nm_id(link)
+    if nm_id:
+        return urlunsplit(
+            (parts.scheme.lower(), host, f'/catalog/{nm_id}/detail.aspx', '', '')
+        )
+    return urlunsplit((parts.scheme.lower(), host, parts.path, parts.query, ''))
+
+
+class LinkIndex:
+    """
+    Ingests links before the job. Aims of the class creating is:
+    1. Bring variants of the same link, with query, without www or with other path
+       after product ID, to canonical form.
+    2. Keep link of every product by nm_id in LINKS_DB_FILENAME, so product has the same
+       link, the key of refresh, planner and changes data, whatever variant is listed.
+    3. Scrape every product once per job, however many times it is listed.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def db(self) -> sqlite3.Connection:
+        """Opens database at first use."""
+        if self.conn is None:
+            self.conn = connect(CFG.LINKS_DB_FILENAME, SCHEMA)
+        return self.conn
+
+    def resolve(self, link: str) -> str:
+        """Returns link of the product from index, or canonical link if not indexed."""
+        link = canonical_link(link)
+        nm_id = link_nm_id(link)
+        if nm_id is None:
+            return link
+        with self.lock:
+            row = (
+                self.db()
+                .execute('SELECT link FROM links WHERE nm_id = ?', (nm_id,))
+                .fetchone()
+            )
+        return row[0] if row else link
+
+    def ingest(self, lnks: List[str]) -> Ingested:
+        """
+        Returns links with every product once, in order of first listing, and indexes
+        new products. Logs and counts duplicates and crawl time they would take.
+        Args:
+            lnks: links as listed in links sheet or links file
+        Returns:
+            links of the job and dropped duplicates
+        """
+        now = time.time()
+        with self.lock, self.db() as conn:
+            known: Dict[str, str] = dict(
+                conn.execute('SELECT nm_id, link FROM links').fetchall()
+            )
+            unique: Dict[str, str] = {}
+            duplicates = []
+            for raw in lnks:
+                link = canonical_link(raw)
+                if not link:
+                    continue
+                nm_id = link_nm_id(link)
+                if nm_id:
+                    link = known.setdefault(nm_id, link)
+                key = nm_id or link
+                if key in unique:
+                    duplicates.append(unique[key])
+                    continue
+                unique[key] = link
+            conn.executemany(
+                'INSERT INTO links VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(nm_id) DO UPDATE SET last_seen = excluded.last_seen',
+                [
+                    (key, link, now, now)
+                    for key, link in unique.items()
+                    if link_nm_id(link) == key
+                ],
+            )
+        saved_sec = sum(PLANNER.estimates(duplicates)) if duplicates else 0.0
+        if duplicates:
+            METRICS.inc('wbmon_duplicate_links_total', len(duplicates))
+            METRICS.inc('wbmon_saved_crawl_seconds_total', saved_sec)
+        logger.info(
+            'Links ingested: %s unique of %s, duplicates: %s, crawl time saved: %s sec',
+            len(unique),
+            len(lnks),
+            len(duplicates),
+            round(saved_sec),
+        )
+        return Ingested(list(unique.values()), duplicates, saved_sec)
+
+
+LINKS = LinkIndex()
@@ -0,0 +1,227 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains listing harvester: products of category, brand, seller and search
+links are got by pages of listing API, instead of product page one by one.
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote_plus, urlsplit
+
+import requests
+
+from config import CFG
+from parsing.httpfetcher import make_session, product_result
+from parsing.links import canonical_link, link_nm_id
+from parsing.results import PageResult, ResultCallback
+from services.metrics import METRICS
+
+logger = logging.getLogger('A.LS')
+logger.setLevel(logging.DEBUG)
+
+
+def listing_kind(link: str) -> Optional[Tuple[str, str]]:
+    """
+    Returns kind of listing link and its key, None if link is not listing. Kinds are
+    keys of LISTING_URLS: 'search' with query, 'seller' with seller ID, 'brand' with
+    brand name in link, 'catalog' with category path.
+    """
+    if link_nm_id(link):
+        return None
+    parts = urlsplit(link)
+    path = parts.path.rstrip('/')
+    if path.endswith('/search.aspx'):
+        query = parse_qs(parts.query).get('search', [''])[0]
+        return ('search', quote_plus(query)) if query else None
+    seller = re.fullmatch(r'/seller/(\d+)', path)
+    if seller:
+        return 'seller', seller.group(1)
+    brand = re.fullmatch(r'/brands/([^/]+)', path)
+    if brand:
+        return 'brand', brand.group(1)
+    if path.startswith('/catalog/'):
+        return 'catalog', path
+    return None
+
+
+def get_json(session: requests.Session, url: str) -> Optional[Any]:
+    """Returns decoded JSON of URL, None on error."""
+    try:
+        response = session.get(url, timeout=CFG.HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError) as exc:
+        logger.warning('Can not get %s: %s', url, exc)
+        return None
+
+
+def walk_menu(nodes: List[Dict[str, Any]], menu: Dict[str, Tuple[str, str]]) -> None:
+    """Collects shard and query of every category of menu tree by its path."""
+    for node in nodes:
+        if node.get('url') and node.get('shard') and node.get('query'):
+            menu[node['url'].rstrip('/')] = (node['shard'], node['query'])
+        walk_menu(node.get('childs') or [], menu)
+
+
+class ListingHarvester:
+    """
+    Turns listing links into product links before the job. Aims of the class creating:
+    1. Get every page of listing, up to LISTING_MAX_PAGES, from listing API.
+    2. Keep result of every product with full data, so scrapers give it without
+       loading its page. Products with missing data are scraped as usual.
+    3. Pass to the job product links of listings instead of listing links.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.harvested: Dict[str, PageResult] = {}
+        self.menu: Optional[Dict[str, Tuple[str, str]]] = None
+
+    def expand(self, lnks: List[str]) -> List[str]:
+        """
+        Returns links with listing links replaced by links of their products, every
+        product once. Results of products are kept for take().
+        """
+        if not any(listing_kind(link) for link in lnks):
+            return lnks
+        with self.lock:
+            self.harvested = {}
+            self.menu = None
+        expanded: Dict[str, None] = {}
+        with make_session() as session:
+            for link in lnks:
+                kind = listing_kind(link)
+                if kind is None:
+                    expanded.setdefault(link)
+                    continue
+                for product_link in self.harvest(session, link, *kind):
+                    expanded.setdefault(product_link)
+        logger.info(
+            'Listings expanded: %s links to %s, results harvested: %s',
+            len(lnks),
+            len(expanded),
+            len(self.harvested),
+        )
+        return list(expanded)
+
+    def harvest(
+        self, session: requests.Session, link: str, kind: str, key: str
+    ) -> List[str]:
+        """
+        Gets pages of listing and keeps results of its products.
+        Args:
+            session: HTTP session
+            link: listing link
+            kind, key: kind of listing and its key, as listing_kind() returns
+        Returns:
+            links of products of the listing
+        """
+        template = self.listing_template(session, kind, key)
+        if template is None:
+            logger.warning('Listing can not be harvested: %s', link)
+            return []
+        parts = urlsplit(link)
+        base = f'{parts.scheme}://{parts.netloc}'
+        product_lnks: List[str] = []
+        missed = 0
+        for page in range(1, CFG.LISTING_MAX_PAGES + 1):
+            if page > 1:
+                time.sleep(CFG.LISTING_INTERPAGE_SEC)
+            listing = get_json(session, template.format(page=page))
+            products = (listing or {}).get('data', {}).get('products') or []
+            if not products:
+                break
+            METRICS.inc('wbmon_listing_pages_total')
+            missed += self.keep_products(base, products, product_lnks)
+        METRICS.inc('wbmon_listing_products_total', len(product_lnks))
+        METRICS.inc('wbmon_listing_fallbacks_total', missed)
+        logger.info(
+            'Listing %s: %s products, %s to scrape one by one',
+            link,
+            len(product_lnks),
+            missed,
+        )
+        return product_lnks
+
+    def keep_products(
+        self, base: str, products: List[Dict[str, Any]], product_lnks: List[str]
+    ) -> int:
+        """
+        Keeps results of listing page products and adds their links to product_lnks.
+        Returns quantity of products with missing data.
+        """
+        missed = 0
+        for product in products:
+            nm_id = str(product.get('id', ''))
+            if not nm_id.isdigit():
+                continue
+            product_link = canonical_link(f'{base}/catalog/{nm_id}/detail.aspx')
+            product_lnks.append(product_link)
+            result = product_result(product, product_link, nm_id)
+            if result is None:
+                missed += 1
+                continue
+            with self.lock:
+                self.harvested[product_link] = result
+        return missed
+
+    def listing_template(
+        self, session: requests.Session, kind: str, key: str
+    ) -> Optional[str]:
+        """Returns listing API URL with {page} left to format, None if not known."""
+        template = CFG.LISTING_URLS[kind]
+        if kind == 'catalog':
+            if self.menu is None:
+                self.menu = {}
+                walk_menu(get_json(session, CFG.LISTING_MENU_URL) or [], self.menu)
+            if key not in self.menu:
+                return None
+            shard, query = self.menu[key]
+            return template.format(shard=shard, query=query, page='{page}')
+        if kind == 'brand' and not key.isdigit():
+            brand = get_json(session, CFG.LISTING_BRAND_URL.format(slug=key)) or {}
+            if not str(brand.get('id', '')).isdigit():
+                return None
+            key = str(brand['id'])
+        return template.format(key=key, page='{page}')
+
+    def take(
+        self, lnks: List[str], on_result: Optional[ResultCallback] = None
+    ) -> Tuple[List[str], List[PageResult]]:
+        """
+        Gives harvested results of links, calling on_result with every one.
+        Returns:
+            links left to scrape and harvested results, in order of lnks
+        """
+        with self.lock:
+            results = [
+                self.harvested.pop(link) for link in lnks if link in self.harvested
+            ]
+        taken = {result.link for result in results}
+        if on_result:
+            for result in results:
+                on_result(result)
+        return [link for link in lnks if link not in taken], results
+
+    def has(self, link: str) -> bool:
+        """Returns true if result of the link is harvested and not taken yet."""
+        with self.lock:
+            return link in self.harvested
+
+
+LISTINGS = ListingHarvester()
@@ -0,0 +1,220 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains job planner, sizing the job to time left before next cron run."""
+
+import logging
+import math
+import random
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+from config import CFG
+from services.metrics import METRICS
+from services.sqlitedb import connect
+
+logger = logging.getLogger('A.PL')
+logger.setLevel(logging.DEBUG)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS timings (
+    link TEXT PRIMARY KEY,
+    seconds REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cursor (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    pos INTEGER NOT NULL
+);
+"""
+
+#  Plan of single job. interparse is (min, max) sleep, projected is in seconds
+Plan = namedtuple('Plan', 'links deferred workers interparse projected window')
+
+
+class Planner:
+    """
+    Sizes job to the cron window. Aims of the class creating is:
+    1. Keep parse time of every link, moving average over jobs, in PLAN_DB_FILENAME.
+    2. Project job duration and fit it before next fire time: shrink sleeps down to
+       PLAN_INTERPARSE_FLOOR, add drivers up to PLAN_MAX_WORKERS, and defer the rest
+       of links to next ticks.
+    3. Give scrapers the pace of current job: sleep between links and drivers count,
+       as planned, or as config says if no plan sets the pace.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        #  Plan of the last job, if it sets pace of selenium scraper
+        self.paced: Optional[Plan] = None
+
+    @property
+    def workers(self) -> int:
+        """Returns drivers count of the planned job, else SCRAPER_WORKERS."""
+        return self.paced.workers if self.paced else CFG.SCRAPER_WORKERS
+
+    @property
+    def interparse(self) -> Tuple[int, int]:
+        """Returns sleep bounds of the planned job, else SCRAPER_INTERPARSE_*."""
+        if self.paced:
+            return self.paced.interparse
+        return CFG.SCRAPER_INTERPARSE_MIN, CFG.SCRAPER_INTERPARSE_MAX
+
+    def db(self) -> sqlite3.Connection:
+        """Opens database at first use."""
+        if self.conn is None:
+            self.conn = connect(CFG.PLAN_DB_FILENAME, SCHEMA)
+        return self.conn
+
+    def interparse_sleep(self) -> int:
+        """Returns random sleep before next link, in seconds."""
+        return random.randint(*self.interparse)
+
+    def observe(self, link: str, seconds: float) -> None:
+        """Updates moving average of link parse time."""
+        weight = CFG.PLAN_TIMING_WEIGHT
+        with self.lock, self.db() as conn:
+            conn.execute(
+                'INSERT INTO timings (link, seconds, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(link) DO UPDATE SET '
+                'seconds = seconds * ? + excluded.seconds * ?, updated = excluded.updated',
+                (link, seconds, time.time(), 1 - weight, weight),
+            )
+
+    def estimates(self, lnks: List[str]) -> List[float]:
+        """
+        Returns parse time of every link. Links never parsed get median of known ones,
+        or PLAN_DEFAULT_LINK_SEC if nothing is known.
+        """
+        with self.lock:
+            known: Dict[str, float] = dict(
+                self.db().execute('SELECT link, seconds FROM timings').fetchall()
+            )
+        values = sorted(known.values())
+        default = values[len(values) // 2] if values else CFG.PLAN_DEFAULT_LINK_SEC
+        return [known.get(link, default) for link in lnks]
+
+    def rotate(self, lnks: List[str]) -> List[str]:
+        """Returns links starting from the first one deferred by former job."""
+        with self.lock:
+            row = self.db().execute('SELECT pos FROM cursor').fetchone()
+        pos = row[0] % len(lnks) if row and lnks else 0
+        return lnks[pos:] + lnks[:pos]
+
+    def advance(self, lnks: List[str], taken: int) -> None:
+        """Remembers where next job starts."""
+        with self.lock, self.db() as conn:
+            row = conn.execute('SELECT pos FROM cursor').fetchone()
+            pos = row[0] % len(lnks) if row and lnks else 0
+            pos = (pos + taken) % len(lnks) if taken < len(lnks) else 0
+            conn.execute(
+                'INSERT OR REPLACE INTO cursor (id, pos) VALUES (0, ?)', (pos,)
+            )
+
+    def plan(
+        self, lnks: List[str], window: float, rotate: bool = True, defer: bool = True
+    ) -> Plan:
+        """
+        Fits the job to the window and sets pace for scrapers. Logs projection.
+        Args:
+            lnks: links of the job
+            window: seconds left before next cron run
+            rotate: start from links deferred by former job, otherwise keep order
+            defer: leave links which do not fit to next runs, otherwise take all
+        Returns:
+            plan with links to scrape in this job
+        """
+        ordered = self.rotate(lnks) if rotate else lnks
+        estimates = self.estimates(ordered)
+        budget = max(window * CFG.PLAN_WINDOW_SHARE - CFG.SCRAPER_BEFOREQUIT_MAX, 1)
+        interparse = (CFG.SCRAPER_INTERPARSE_MIN, CFG.SCRAPER_INTERPARSE_MAX)
+        workers = CFG.SCRAPER_WORKERS
+        #  Sleeps and drivers count are used only by selenium scraper
+        pace = CFG.FETCHER_BACKEND == 'selenium' and CFG.SCRAPER_ENGINE == 'blocking'
+        if not pace:
+            interparse = (0, 0)
+
+        taken = len(ordered)
+        if pace and project(estimates, interparse, workers) > budget:
+            interparse = shrink_sleeps(estimates, interparse, workers, budget)
+        if pace and project(estimates, interparse, workers) > budget:
+            needed = sum(estimates) + len(estimates) * sum(interparse) / 2
+            workers = min(
+                CFG.PLAN_MAX_WORKERS, max(workers, math.ceil(needed / budget))
+            )
+        while (
+            defer
+            and taken > 1
+            and project(estimates[:taken], interparse, workers) > budget
+        ):
+            taken -= 1
+
+        if rotate:
+            self.advance(ordered, taken)
+        plan = Plan(
+            links=ordered[:taken],
+            deferred=len(ordered) - taken,
+            workers=workers,
+            interparse=interparse,
+            projected=project(estimates[:taken], interparse, workers),
+            window=window,
+        )
+        self.paced = plan if pace else None
+        log_plan(plan)
+        if plan.deferred:
+            METRICS.inc('wbmon_deferred_links_total', plan.deferred)
+        return plan
+
+
+def project(estimates: List[float], interparse: Tuple[int, int], workers: int) -> float:
+    """Returns projected job duration in seconds: parse and sleep, shared by drivers."""
+    sleep = sum(interparse) / 2
+    return (sum(estimates) + len(estimates) * sleep) / max(workers, 1)
+
+
+def shrink_sleeps(
+    estimates: List[float], interparse: Tuple[int, int], workers: int, budget: float
+) -> Tuple[int, int]:
+    """
+    Returns sleep bounds scaled down to fit budget, but not below PLAN_INTERPARSE_FLOOR.
+    """
+    if not estimates:
+        return interparse
+    mean_sleep = sum(interparse) / 2
+    allowed = (budget * max(workers, 1) - sum(estimates)) / len(estimates)
+    factor = max(allowed, 0) / mean_sleep if mean_sleep else 1
+    floor = min(CFG.PLAN_INTERPARSE_FLOOR, interparse[0])
+    low = max(floor, min(interparse[0], int(interparse[0] * factor)))
+    high = max(low, min(interparse[1], int(interparse[1] * factor)))
+    return low, high
+
+
+def log_plan(plan: Plan) -> None:
+    """Logs projection of the job."""
+    logger.info(
+        'Job projection: %s links in %s min with %s drivers, sleep %s-%s sec. '
+        'Window %s min. Deferred to next runs: %s links',
+        len(plan.links),
+        round(plan.projected / 60, 1),
+        plan.workers,
+        *plan.interparse,
+        round(plan.window / 60, 1) if math.isfinite(plan.window) else 'unlimited',
+        plan.deferred,
+    )
+
+
+PLANNER = Planner()
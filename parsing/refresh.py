@@ -0,0 +1,136 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains refresh queue: every link is scraped when it is due by policy."""
+
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import CFG
+from parsing.results import PageResult
+from services.changes import is_error
+from services.metrics import METRICS
+from services.sqlitedb import connect
+
+logger = logging.getLogger('A.RF')
+logger.setLevel(logging.DEBUG)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS refresh (
+    link TEXT PRIMARY KEY,
+    interval REAL NOT NULL,
+    next_due REAL NOT NULL,
+    cus_rub TEXT,
+    sel_rub TEXT
+);
+"""
+
+
+def parse_policy(text: str) -> Optional[float]:
+    """
+    Returns refresh interval in hours from policy text: number of hours is fixed
+    interval, empty or 'auto' is adaptive one (None).
+    """
+    text = text.strip().lower().replace(',', '.')
+    if text in ('', 'auto'):
+        return None
+    try:
+        hours = float(text)
+    except ValueError:
+        logger.warning('Refresh policy %s not understood, auto is used', text)
+        return None
+    return max(hours, 0)
+
+
+class RefreshQueue:
+    """
+    Decides which links are due in the job. Aims of the class creating is:
+    1. Keep refresh interval and next due time of every link in REFRESH_DB_FILENAME.
+    2. Scrape volatile links every REFRESH_MIN_HOURS and back off stable ones
+       exponentially by REFRESH_BACKOFF, up to REFRESH_MAX_HOURS.
+    3. Respect fixed interval set for link in links sheet or links file.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.fixed: Dict[str, float] = {}
+
+    def db(self) -> sqlite3.Connection:
+        """Opens database at first use."""
+        if self.conn is None:
+            self.conn = connect(CFG.REFRESH_DB_FILENAME, SCHEMA)
+        return self.conn
+
+    def set_policies(self, policies: Dict[str, str]) -> None:
+        """Remembers fixed intervals from policy texts of links."""
+        self.fixed = {}
+        for link, text in policies.items():
+            hours = parse_policy(text)
+            if hours is not None:
+                self.fixed[link] = hours
+        logger.info('Links with fixed refresh interval: %s', len(self.fixed))
+
+    def due(self, lnks: List[str], until: float) -> List[str]:
+        """
+        Returns links due before the time, most overdue first. New links are due.
+        Args:
+            lnks: all links
+            until: timestamp, usually next run of the job
+        Returns:
+            links to scrape in this job
+        """
+        with self.lock:
+            next_due: Dict[str, float] = dict(
+                self.db().execute('SELECT link, next_due FROM refresh').fetchall()
+            )
+        heap: List[Tuple[float, int, str]] = [
+            (next_due.get(link, 0), pos, link) for pos, link in enumerate(lnks)
+        ]
+        heapq.heapify(heap)
+        due_lnks = []
+        while heap and heap[0][0] <= until:
+            due_lnks.append(heapq.heappop(heap)[2])
+        logger.info('Links due: %s of %s', len(due_lnks), len(lnks))
+        METRICS.inc('wbmon_not_due_links_total', len(lnks) - len(due_lnks))
+        return due_lnks
+
+    def update(self, result: PageResult) -> None:
+        """Sets next due time of the link by its policy and price change."""
+        now = time.time()
+        with self.lock, self.db() as conn:
+            row = conn.execute(
+                'SELECT interval, cus_rub, sel_rub FROM refresh WHERE link = ?',
+                (result.link,),
+            ).fetchone()
+            prices = (result.cus_rub, result.sel_rub)
+            if result.link in self.fixed:
+                interval = self.fixed[result.link]
+            elif row is None or is_error(result) or tuple(row[1:]) != prices:
+                interval = CFG.REFRESH_MIN_HOURS
+            else:
+                interval = min(row[0] * CFG.REFRESH_BACKOFF, CFG.REFRESH_MAX_HOURS)
+            if is_error(result) and row is not None:
+                #  Prices of error are not compared next time
+                prices = tuple(row[1:])
+            conn.execute(
+                'INSERT OR REPLACE INTO refresh VALUES (?, ?, ?, ?, ?)',
+                (result.link, interval, now + interval * 3600, *prices),
+            )
+
+
+REFRESH = RefreshQueue()
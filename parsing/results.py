@@ -0,0 +1,53 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains storing dataclass of parsed results. It does not import selenium, so
+modules working with results only are loaded fast.
+"""
+
+import collections
+from typing import Callable, Dict, List
+
+from config import CFG
+
+
+class PageResult(  # pylint: disable=too-few-public-methods
+    collections.namedtuple(
+        typename='pageResult',
+        field_names=[name.lower() for name in CFG.DATA_HEADER],
+        rename=False,
+        defaults=None,
+    )
+):
+    """
+    Store for results obtained from parsing.
+    """
+
+
+#  Function called with every PageResult as soon as it is parsed
+ResultCallback = Callable[[PageResult], None]
+
+#  Text of the page instead of prices, when product is sold out
+SOLDOUT = 'Нет в наличии'
+
+
+def in_link_order(lnks: List[str], full_result: List[PageResult]) -> List[PageResult]:
+    """
+    Returns results sorted in order of their links in lnks, results of the same link
+    in order they came. Results of other links go last.
+    """
+    positions: Dict[str, int] = {}
+    for pos, link in enumerate(lnks):
+        positions.setdefault(link, pos)
+    return sorted(full_result, key=lambda result: positions.get(result.link, len(lnks)))
@@ -14,37 +14,99 @@
 """This file contains high-level scheduling functns, running interval_scraper() job."""
 
 import logging
-import os
+import math
+import sys
+import threading
 import time
 from datetime import datetime, timedelta
-from typing import List
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 
+from apscheduler.events import EVENT_SCHEDULER_SHUTDOWN
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 from tzlocal import get_localzone
 
-from config import Cfg
-from parsing.scraper import interval_scraper
+from config import CFG
+from parsing.links import LINKS
+from parsing.planner import PLANNER
+from parsing.refresh import REFRESH
+from parsing.results import PageResult, ResultCallback
+from services.changes import changed_results, remember_results
 from services.filesaver import save_values
-from services.gconnect import Gc, post_values, start_gsheets
+from services.jobqueue import JobQueue, unfinished_job
+from services.metrics import METRICS, start_metrics_server, write_metrics
+from services.shards import claim_links, leave, merge_results, start_heartbeat
+
+if TYPE_CHECKING:
+    from services.gconnect import Gc
+
+#  Scrapers (selenium) and Google Sheets (pygsheets) are imported by jobs, not at start
+#  pylint: disable=import-outside-toplevel
 
-CFG = Cfg(test=os.getenv('TEST') == 'true')
 logger = logging.getLogger('A.GC')
 logger.setLevel(logging.DEBUG)
 
 
+class GsheetsLoader:
+    """
+    Connects to Google Sheets apart from scheduler start. Aims of the class creating is:
+    1. Start scheduler at once, while OAuth and loading links go in background thread
+       (GSHEETS_EARLY_AUTH) or at first job.
+    2. Give every job links and connection, waiting for them if they are not ready.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.loaded: Optional[Tuple[List[str], Dict[str, str], 'Gc']] = None
+
+    def start(self) -> None:
+        """Starts loading in background thread."""
+        threading.Thread(target=self.preload, name='gsheets', daemon=True).start()
+
+    def preload(self) -> None:
+        """Loads in background. On error job will try again."""
+        try:
+            self.load()
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception('Google Sheets not connected at start, job will retry')
+
+    def load(self) -> Tuple[List[str], Dict[str, str], 'Gc']:
+        """Connects and loads links once, waiting if other thread is loading."""
+        with self.lock:
+            if self.loaded is None:
+                from services.gconnect import start_gsheets
+
+                self.loaded = start_gsheets()
+                if CFG.REFRESH_POLICIES:
+                    policies = self.loaded[1]
+                    if CFG.LINKS_NORMALIZE:
+                        policies = {
+                            LINKS.resolve(link): text for link, text in policies.items()
+                        }
+                    REFRESH.set_policies(policies)
+            return self.loaded
+
+
 def get_scheduler() -> BlockingScheduler:
     """
-    Runs parsing process once at start: connect GSheets, load links, set schedule jobs.
+    Runs parsing process once at start: start connecting GSheets and loading links,
+    set schedule jobs.
     Returns:
         the only scheduler
     """
 
-    lnks, gc = start_gsheets()
+    start_metrics_server()
+    sheets = GsheetsLoader()
+    if CFG.GSHEETS_EARLY_AUTH:
+        sheets.start()
     #  From doc: «A scheduler that runs in the foreground (start() will block)».
     scheduler = BlockingScheduler()
+    scheduler.add_listener(shutdown_drivers, EVENT_SCHEDULER_SHUTDOWN)
+    if CFG.SHARDING:
+        start_heartbeat()
+        scheduler.add_listener(leave, EVENT_SCHEDULER_SHUTDOWN)
     trigger = CronTrigger(**CFG.CRON_ARGS)
-    kwargs = {'lnks': lnks[0 : CFG.MAX_LINK_QUANTITY], 'gc': gc, 'trigger': trigger}
+    kwargs = {'sheets': sheets, 'trigger': trigger}
 
     scheduler.add_job(
         func=interval_job,
@@ -54,7 +116,10 @@ def get_scheduler() -> BlockingScheduler:
         misfire_grace_time=CFG.MISFIRE_TIME,
         coalesce=True,
     )
-    if CFG.ASAP and (calc_delay(trigger).total_seconds() > CFG.ASAPTRIGGER):
+    resume = CFG.JOB_QUEUE and unfinished_job(job_round()) is not None
+    if resume:
+        logger.info('Unfinished job found, it will be resumed')
+    if resume or (CFG.ASAP and (calc_delay(trigger).total_seconds() > CFG.ASAPTRIGGER)):
         for job in scheduler.get_jobs():
             job.modify(next_run_time=datetime.now() + timedelta(seconds=CFG.ASAPDELAY))
             logger.info('TIME OF NEXT JOB CHANGED. %s sec to run', CFG.ASAPDELAY)
@@ -62,28 +127,302 @@ def get_scheduler() -> BlockingScheduler:
     return scheduler
 
 
-def interval_job(lnks: List[str], gc: Gc, trigger: CronTrigger) -> None:
+def shutdown_drivers(event) -> None:
+    """Quits warm drivers, if scraper was ever imported."""
+    drivers = sys.modules.get('parsing.drivers')
+    if drivers:
+        drivers.DRIVERS.shutdown(event)
+
+
+def interval_job(sheets: GsheetsLoader, trigger: CronTrigger) -> None:
     """
     Function executed by the BlockingScheduler: logging + sending links to scraper.
     Args:
-        lnks: list of links to load in single job
-        gc: Gc class instance with active google sheets connection
+        sheets: loader of links and google sheets connection
         trigger: Active apscheduler trigger to write info about next run
     """
     start_time = time.time()
     logger.info('=' * 20 + ' JOBSTARTED')  #  pylint: disable=logging-not-lazy
-    full_result = interval_scraper(lnks)
-    if CFG.SAVE_TO_GSHEETS:
-        post_values(gc=gc, full_result=full_result)
-    if CFG.SAVE_TO_FILE:
-        save_values(full_result=full_result)
+    METRICS.inc('wbmon_jobs_total')
+    lnks, _, gc = sheets.load()
+    ingested = None
+    if CFG.LINKS_NORMALIZE:
+        ingested = LINKS.ingest(lnks)
+        lnks = ingested.links
+    round_lnks = round_links(lnks)
+    job_lnks = round_lnks
+    round_key = job_round()
+    if CFG.SHARDING:
+        round_lnks, job_lnks = claim_links(round_key, round_lnks)
+    run_job(job_lnks, gc, round_key, round_lnks)
     end_time = time.time()
+    METRICS.observe('wbmon_stage_seconds', end_time - start_time, stage='job')
+    write_metrics()
     logger.info(  #  pylint: disable=logging-not-lazy
-        '=' * 20 + ' JOBDONE in %s sec', round(end_time - start_time, 0)
+        '=' * 20 + ' JOBDONE in %s sec. Duplicate links skipped: %s, saved %s sec',
+        round(end_time - start_time, 0),
+        len(ingested.duplicates) if ingested else 0,
+        round(ingested.saved_sec) if ingested else 0,
     )
     calc_delay(trigger)
 
 
+def round_links(lnks: List[str]) -> List[str]:
+    """
+    Returns links of the job: listings expanded into products, then links due by
+    refresh policies, most overdue first, capped at MAX_LINK_QUANTITY links to scrape.
+    So many more links may be watched than scraped in single job. Products harvested
+    from listings need no page load and are not counted.
+    """
+    harvested: Callable[[str], bool] = lambda link: False
+    if CFG.SCRAPE_LISTINGS:
+        from parsing.listings import LISTINGS
+
+        lnks = LISTINGS.expand(lnks)
+        harvested = LISTINGS.has
+    if CFG.REFRESH_POLICIES:
+        next_time = cron_next_time()
+        until = next_time.timestamp() if next_time else math.inf
+        lnks = REFRESH.due(lnks, until)
+    capped = []
+    to_scrape = 0
+    for link in lnks:
+        if harvested(link):
+            capped.append(link)
+        elif to_scrape < CFG.MAX_LINK_QUANTITY:
+            capped.append(link)
+            to_scrape += 1
+    if len(capped) < len(lnks):
+        logger.info(
+            '%s links left to next jobs by MAX_LINK_QUANTITY', len(lnks) - len(capped)
+        )
+    return capped
+
+
+def run_job(lnks: List[str], gc: 'Gc', round_key: str, round_lnks: List[str]) -> None:
+    """
+    Plans the job, or resumes unfinished one of the round, then scrapes and
+    publishes. Job failed with exception is left unfinished and resumed by next run.
+    Args:
+        lnks: links of this worker for the round
+        gc: Gc class instance with active google sheets connection
+        round_key: ID of the round, next cron fire time
+        round_lnks: all links of the round
+    """
+    resume = CFG.JOB_QUEUE and unfinished_job(round_key) is not None
+    job_lnks = lnks
+    if CFG.PLAN_ADAPTIVE and not resume:
+        job_lnks = plan_job(lnks)
+    job = JobQueue(job_lnks, round_key) if CFG.JOB_QUEUE else None
+    if job:
+        job_lnks = job.pending
+    try:
+        if CFG.STREAM_RESULTS and not CFG.SHARDING:
+            #  Sharded results are published after merge, not while scraping
+            stream_job(job_lnks, gc, job)
+        else:
+            batch_job(job_lnks, gc, job, round_key, round_lnks)
+        if job:
+            finish_job(job)
+    finally:
+        if job:
+            job.close()
+
+
+def finish_job(job: JobQueue) -> None:
+    """
+    Finishes job if all its results are published. Otherwise job is left unfinished:
+    it is resumed in the same round, or its results are carried to next job.
+    """
+    unpublished = len(job.unpublished())
+    if unpublished:
+        logger.warning(
+            'Job %s left unfinished: %s results not published yet',
+            job.job_id,
+            unpublished,
+        )
+    else:
+        job.finish()
+
+
+def plan_job(lnks: List[str]) -> List[str]:
+    """
+    Returns links of the job fitting the cron window. Links harvested from listings
+    take no time, they are not planned. With SHARDING links are claimed by this
+    worker for the round and nobody else scrapes them, so none is deferred: the plan
+    only sets the pace.
+    """
+    #  Refresh queue puts overdue links first, so planner does not rotate them
+    rotate = not CFG.REFRESH_POLICIES and not CFG.SHARDING
+    defer = not CFG.SHARDING
+    if not CFG.SCRAPE_LISTINGS:
+        return PLANNER.plan(lnks, cron_window(), rotate, defer).links
+    from parsing.listings import LISTINGS
+
+    to_plan = [link for link in lnks if not LISTINGS.has(link)]
+    planned = set(PLANNER.plan(to_plan, cron_window(), rotate, defer).links)
+    return [link for link in lnks if link in planned or LISTINGS.has(link)]
+
+
+def batch_job(
+    lnks: List[str],
+    gc: 'Gc',
+    job: Optional[JobQueue],
+    round_key: str,
+    round_lnks: List[str],
+) -> None:
+    """
+    Scrapes links and publishes results after the last one, or after merge of shards.
+    Args:
+        lnks: list of links to scrape
+        gc: Gc class instance with active google sheets connection
+        job: durable queue of the job, if used
+        round_key: ID of the round, next cron fire time
+        round_lnks: all links of the round
+    """
+    full_result = scrape_links(lnks, job.record if job else None)
+    if job:
+        full_result = job.results()
+    account_results(full_result)
+    to_publish = job.unpublished() if job else full_result
+    if CFG.SHARDING:
+        merged = merge_results(round_key, round_lnks, to_publish, scrape_lost)
+        if job:
+            #  Results are stored for the round, the worker taking it publishes them
+            job.mark_published(to_publish)
+        to_publish = merged if merged is not None else []
+    if publish_results(gc, to_publish):
+        if job:
+            job.mark_published(to_publish)
+    elif job and CFG.SHARDING:
+        job.keep(to_publish)
+
+
+def scrape_links(
+    lnks: List[str], on_result: Optional[ResultCallback] = None
+) -> List[PageResult]:
+    """Scrapes links with SCRAPER_ENGINE."""
+    if CFG.SCRAPER_ENGINE == 'async':
+        from parsing.asyncscraper import async_interval_scraper
+
+        full_result = async_interval_scraper(lnks, on_result)
+    else:
+        from parsing.scraper import interval_scraper
+
+        full_result = interval_scraper(lnks, on_result)
+    return full_result
+
+
+def scrape_lost(lnks: List[str]) -> List[PageResult]:
+    """Scrapes links claimed from lost shard workers, accounted like own results."""
+    full_result = scrape_links(lnks)
+    account_results(full_result)
+    return full_result
+
+
+def account_results(full_result: List[PageResult]) -> None:
+    """Counts errors of results and updates refresh times of their links."""
+    count_errors(full_result)
+    if CFG.REFRESH_POLICIES:
+        for result in full_result:
+            REFRESH.update(result)
+
+
+def stream_job(lnks: List[str], gc: 'Gc', job: Optional[JobQueue]) -> None:
+    """
+    Scrapes links and publishes results by micro-batches while scraping.
+    Args:
+        lnks: list of links to scrape
+        gc: Gc class instance with active google sheets connection
+        job: durable queue of the job, if used
+    """
+    from parsing.stream import stream_scraper
+    from services.sinks import ResultStream, make_sinks
+
+    on_published = job.mark_published if job else None
+    stream = ResultStream(make_sinks(gc), on_published)
+    if job:
+        #  Results of resumed job, parsed but not published before restart
+        for result in job.unpublished():
+            stream.add(result)
+    results = stream_scraper(lnks)
+    try:
+        for result in results:
+            if job:
+                job.record(result)
+            count_errors([result])
+            if CFG.REFRESH_POLICIES:
+                REFRESH.update(result)
+            stream.add(result)
+    finally:
+        #  Stops and joins scraper thread, if this loop failed
+        results.close()
+        stream.close()
+
+
+def publish_results(gc: 'Gc', full_result: List[PageResult]) -> bool:
+    """
+    Publishes results to Google Sheets and saves them to file, as config says. If
+    Google Sheets fails after retries, results are still saved to file.
+    Args:
+        gc: Gc class instance with active google sheets connection
+        full_result: results to publish
+    Returns:
+        True if results are published to Google Sheets or it is off
+    """
+    if CFG.PUBLISH_ONLY_CHANGED:
+        to_publish = changed_results(full_result)
+    else:
+        to_publish = full_result
+    published = True
+    if CFG.SAVE_TO_GSHEETS and to_publish:
+        from services.gconnect import SHEETS_ERRORS, post_values
+
+        try:
+            post_values(gc=gc, full_result=to_publish)
+        except SHEETS_ERRORS:
+            logger.exception('Results are not published to Google Sheets')
+            published = False
+    if CFG.SAVE_TO_FILE and to_publish:
+        save_values(full_result=to_publish)
+    if CFG.PUBLISH_ONLY_CHANGED and published:
+        remember_results(full_result)
+    return published
+
+
+def count_errors(full_result: List[PageResult]) -> None:
+    """Counts results and fields with ERROR_PARSE_STRING into metrics."""
+    METRICS.inc('wbmon_results_total', len(full_result))
+    for result in full_result:
+        for field, value in result._asdict().items():
+            if value == CFG.ERROR_PARSE_STRING:
+                METRICS.inc('wbmon_err_fields_total', field=field)
+
+
+def job_round() -> str:
+    """
+    Returns ID of the round: next fire time of CRON_ARGS without jitter. It is the
+    same for all workers, whatever jitter delayed their jobs, and after restart.
+    """
+    next_time = cron_next_time()
+    return next_time.isoformat() if next_time else 'once'
+
+
+def cron_window() -> float:
+    """Returns seconds left before next fire time of CRON_ARGS, infinity if none."""
+    next_time = cron_next_time()
+    if not next_time:
+        return math.inf
+    return (next_time - datetime.now(tz=get_localzone())).total_seconds()
+
+
+def cron_next_time() -> Optional[datetime]:
+    """Returns next fire time of CRON_ARGS without jitter, same for all workers."""
+    cron_args = {key: value for key, value in CFG.CRON_ARGS.items() if key != 'jitter'}
+    now = datetime.now(tz=get_localzone())
+    return CronTrigger(**cron_args).get_next_fire_time(None, now)
+
+
 def calc_delay(trigger: CronTrigger) -> timedelta:
     """
     Obtain next time job running and calculates waiting interval.
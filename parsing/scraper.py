@@ -14,64 +14,219 @@
 """This file contains low-level scheduling funcs, i.e. pauses & running wb_parser()."""
 
 import logging
-import os
-import random
+import queue
+import threading
 import time
-from typing import List
+from typing import List, Optional
 
-from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver import Chrome
 
-from config import Cfg
-from parsing.wbparser import PageResult, dummy_parser, wb_parser
-
-CFG = Cfg(test=os.getenv('TEST') == 'true')
+from config import CFG
+from parsing.drivers import DRIVERS
+from parsing.httpfetcher import http_scraper
+from parsing.listings import LISTINGS
+from parsing.planner import PLANNER
+from parsing.results import PageResult, ResultCallback, in_link_order
+from parsing.wbparser import dummy_parser, error_result, wb_parser
+from services.metrics import timed
 
 logger = logging.getLogger('A.SC')
 logger.setLevel(logging.DEBUG)
 
 
-def interval_scraper(lnks: List[str]) -> List[PageResult]:
+@timed('scrape')
+def interval_scraper(
+    lnks: List[str], on_result: Optional[ResultCallback] = None
+) -> List[PageResult]:
     """
     main()-> get_scheduler()-> interval_job(lnks, gc, trigger)-> interval_scraper(lnks)
-    Scraper. Almost like just loop for parser.
+    Scraper. Runs FETCHER_BACKEND, with 'http' passes unresolved links to selenium.
+    Results harvested from listings are given without loading pages.
+    Args:
+        lnks: list of links for single job
+        on_result: function to call with every result as soon as it is parsed
+    Returns:
+        list of PageResult instances it had obtain, in order of lnks
+    """
+    left, harvested = LISTINGS.take(lnks, on_result)
+    if CFG.FETCHER_BACKEND != 'http':
+        scraped = selenium_scraper(left, on_result)
+    else:
+        scraped = fill_missed(left, http_scraper(left, on_result), on_result)
+    return in_link_order(lnks, harvested + scraped)
+
+
+def fill_missed(
+    lnks: List[str],
+    partial: List[Optional[PageResult]],
+    on_result: Optional[ResultCallback] = None,
+) -> List[PageResult]:
+    """
+    Parses with selenium links that browserless fetcher could not resolve.
     Args:
         lnks: list of links for single job
+        partial: results in order of lnks, None for unresolved links
+        on_result: function to call with every result as soon as it is parsed
+    Returns:
+        list of PageResult instances, in order of lnks
+    """
+    missed = [i for i, result in enumerate(partial) if result is None]
+    if missed:
+        logger.info('%s links will be parsed with selenium', len(missed))
+        fallback = selenium_scraper([lnks[i] for i in missed], on_result)
+        for i, result in zip(missed, fallback):
+            partial[i] = result
+    return [result for result in partial if result is not None]
+
+
+def selenium_scraper(
+    lnks: List[str], on_result: Optional[ResultCallback] = None
+) -> List[PageResult]:
+    """
+    Scraper with Chrome. Almost like just loop for parser. With more than one worker
+    planned runs pool.
+    Args:
+        lnks: list of links to parse
+        on_result: function to call with every result as soon as it is parsed
     Returns:
         list of PageResult instances it had obtain
     """
+    if not lnks:
+        return []
+    if PLANNER.workers > 1 and len(lnks) > 1:
+        return pool_scraper(lnks, workers=PLANNER.workers, on_result=on_result)
+
     logger.info('Interval scraper started. Have %s links', len(lnks))
     logger.debug('-' * 20)
 
-    options = webdriver.ChromeOptions()
-    for arg in CFG.CHROME_DRIVER_ARGS:
-        options.add_argument(arg)
-    driver = webdriver.Chrome(options=options)
+    driver = DRIVERS.acquire()
+    full_result: List[PageResult] = []
+    try:
+        for i, link in enumerate(lnks):
+            interparse_sleep = PLANNER.interparse_sleep()
+            logger.info(
+                'Scrape link №%s of %s. Sleep: %s sec',
+                i + 1,
+                len(lnks),
+                interparse_sleep,
+            )
+            time.sleep(interparse_sleep)
+            full_result.append(parse_link(driver, link, i))
+            if on_result:
+                on_result(full_result[-1])
+    finally:
+        DRIVERS.release(driver, pages=len(full_result))
+    return full_result
 
-    full_result = []
+
+def parse_link(driver: Chrome, link: str, i: int) -> PageResult:
+    """
+    Runs parser on the link and observes its time. Driver failure gives error result,
+    so job goes on.
+    Args:
+        driver: web-driver
+        link: link to parse
+        i: index of the link in the job, for logs
+    """
+    start_time = time.time()
+    ##########################
+    # LINE BELOW RUNS PARSER #
+    ##########################
+    try:
+        result = wb_parser(driver=driver, link=link)
+    except WebDriverException:
+        logger.exception('Driver failed on link №%s', i + 1)
+        result = error_result(link)
+    end_time = time.time()
+    PLANNER.observe(link, end_time - start_time)
+    logger.debug(  #  pylint: disable=logging-not-lazy
+        '-' * 20 + ' PARSED in %s sec', round(end_time - start_time, 0)
+    )
+    return result
+
+
+def pool_scraper(
+    lnks: List[str], workers: int, on_result: Optional[ResultCallback] = None
+) -> List[PageResult]:
+    """
+    Pool mode of selenium_scraper(): several threads, each with its own driver, take
+    links from the shared queue. Results are placed by link index, so order is the
+    same as in lnks.
+    Args:
+        lnks: list of links for single job
+        workers: quantity of drivers to run
+        on_result: function to call with every result as soon as it is parsed
+    Returns:
+        list of PageResult instances, in order of lnks
+    """
+    workers = min(workers, len(lnks))
+    logger.info('Pool scraper started. Have %s links, %s workers', len(lnks), workers)
+    logger.debug('-' * 20)
+
+    tasks: queue.Queue = queue.Queue()
     for i, link in enumerate(lnks):
-        interparse_sleep = random.randint(
-            CFG.SCRAPER_INTERPARSE_MIN, CFG.SCRAPER_INTERPARSE_MAX
-        )
-        logger.info(
-            'Scrape link №%s of %s. Sleep: %s sec', i + 1, len(lnks), interparse_sleep
-        )
-        time.sleep(interparse_sleep)
-        start_time = time.time()
-        ##########################
-        # LINE BELOW RUNS PARSER #
-        ##########################
-        full_result.append(wb_parser(driver=driver, link=link))
-        end_time = time.time()
-        logger.debug(  #  pylint: disable=logging-not-lazy
-            '-' * 20 + ' PARSED in %s sec', round(end_time - start_time, 0)
+        tasks.put((i, link))
+    full_result: List[Optional[PageResult]] = [None] * len(lnks)
+
+    threads = [
+        threading.Thread(
+            target=pool_worker,
+            args=(tasks, full_result, on_result),
+            name=f'scraper-{num}',
+            daemon=True,
         )
-    beforequit_sleep = random.randint(
-        CFG.SCRAPER_BEFOREQUIT_MIN, CFG.SCRAPER_BEFOREQUIT_MAX
-    )
-    logger.info('Driver will quit() after sleep: %s sec', beforequit_sleep)
-    time.sleep(beforequit_sleep)
-    driver.quit()
-    return full_result
+        for num in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return [
+        result if result is not None else error_result(lnks[i])
+        for i, result in enumerate(full_result)
+    ]
+
+
+def pool_worker(
+    tasks: queue.Queue,
+    full_result: List[Optional[PageResult]],
+    on_result: Optional[ResultCallback],
+) -> None:
+    """
+    Single worker of pool_scraper(). Sleeps between its own links, not the whole run.
+    Args:
+        tasks: queue with (index, link) tuples
+        full_result: list to put results by index
+        on_result: function to call with every result as soon as it is parsed
+    """
+    try:
+        driver = DRIVERS.acquire()
+    except WebDriverException:
+        logger.exception('Worker can not start driver, leaves queue to others')
+        return
+    pages = 0
+    try:
+        while True:
+            try:
+                i, link = tasks.get_nowait()
+            except queue.Empty:
+                break
+            pages += 1
+            interparse_sleep = PLANNER.interparse_sleep()
+            logger.info(
+                'Scrape link №%s of %s. Sleep: %s sec',
+                i + 1,
+                len(full_result),
+                interparse_sleep,
+            )
+            time.sleep(interparse_sleep)
+            full_result[i] = parse_link(driver, link, i)
+            if on_result:
+                on_result(full_result[i])
+    finally:
+        DRIVERS.release(driver, pages=pages)
 
 
 def dum_interval_scraper(lnks: List[str]) -> List[PageResult]:
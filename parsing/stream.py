@@ -0,0 +1,92 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains streaming scraper, yielding results as soon as they are parsed."""
+
+import logging
+import queue
+import threading
+from typing import Iterator, List, Optional
+
+from config import CFG
+from parsing.asyncscraper import async_interval_scraper
+from parsing.results import PageResult
+from parsing.scraper import interval_scraper
+
+logger = logging.getLogger('A.SC')
+logger.setLevel(logging.DEBUG)
+
+
+#  Producer checks if consumer stopped every this seconds while queue is full
+PUT_TIMEOUT_SEC = 1
+
+
+class StreamStopped(Exception):
+    """Consumer of the stream stopped, scraper should quit."""
+
+
+def stream_scraper(lnks: List[str]) -> Iterator[PageResult]:
+    """
+    Runs SCRAPER_ENGINE in background thread and yields its results one by one. Queue
+    between them is bounded, so slow consumer holds the scraper. When consumer stops,
+    by error or close() of the generator, scraper quits at next result and thread is
+    joined.
+    Args:
+        lnks: list of links for single job
+    Yields:
+        PageResult instances, in order they are parsed
+    """
+    results: queue.Queue = queue.Queue(maxsize=CFG.STREAM_QUEUE_SIZE)
+    done = object()
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def put(item: object) -> None:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=PUT_TIMEOUT_SEC)
+                return
+            except queue.Full:
+                continue
+        raise StreamStopped()
+
+    def produce() -> None:
+        try:
+            if CFG.SCRAPER_ENGINE == 'async':
+                async_interval_scraper(lnks, on_result=put)
+            else:
+                interval_scraper(lnks, on_result=put)
+        except StreamStopped:
+            logger.warning('Stream consumer stopped, scraper quits')
+        except BaseException as exc:  # pylint: disable=broad-exception-caught
+            errors.append(exc)
+        finally:
+            try:
+                put(done)
+            except StreamStopped:
+                pass
+
+    thread = threading.Thread(target=produce, name='stream-scraper', daemon=True)
+    thread.start()
+    try:
+        while True:
+            result: Optional[object] = results.get()
+            if result is done:
+                break
+            assert isinstance(result, PageResult)
+            yield result
+    finally:
+        stop.set()
+        thread.join()
+    if errors:
+        raise errors[0]
@@ -11,40 +11,99 @@
 
 # You should have received a copy of the GNU General Public License along with this
 # program.  If not, see <https://www.gnu.org/licenses/>.
-"""This file contains parser func itself. Also storing dataclass and dummy parser."""
+"""This file contains parser func itself. Also dummy parser."""
 
-import collections
 import logging
-import os
 import re
+import threading
+import time
 from datetime import datetime
-from typing import Tuple
+from typing import Callable, Dict, Optional, Tuple
 
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    TimeoutException,
+    WebDriverException,
+)
 from selenium.webdriver import Chrome
 from selenium.webdriver.common.by import By
-from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
-from config import Cfg
+from config import CFG
+from parsing.links import link_nm_id
+from parsing.results import SOLDOUT, PageResult
+from services.archive import ARCHIVE, ARCHIVE_ERRORS
+from services.metrics import METRICS, timer
+from services.resilience import SCRAPE_BREAKER, retry_call
+from services.storage import result_status
 
-CFG = Cfg(test=os.getenv('TEST') == 'true')
 logger = logging.getLogger('A.SC')
 logger.setLevel(logging.DEBUG)
 
 
-class PageResult(  # pylint: disable=too-few-public-methods
-    collections.namedtuple(
-        typename='pageResult',
-        field_names=[name.lower() for name in CFG.DATA_HEADER],
-        rename=False,
-        defaults=None,
-    )
-):
-    """
-    Store for results obtained from parsing.
-    """
+class PageTimeout(Exception):
+    """Page was not ready in PAGELOAD_MAXTIME."""
+
+
+#  Declarative selector table: field -> (XPath, DOM property to read). Property
+#  'innerText' equals to WebElement.text, 'textContent' to get_attribute('textContent')
+SELECTORS = {
+    'header': ("//*[@class='product-page__header']", 'innerText'),
+    'seller': ("//*[@class='seller-info__name']", 'textContent'),
+    'nm_id': (
+        "//*[@class='product-params__cell product-params__cell--copy']",
+        'textContent',
+    ),
+    'price_block': (
+        "//div[contains(@class, 'product-page__price-block product-page__price-block--common')]",  #  pylint: disable=line-too-long
+        'innerText',
+    ),
+    'final_price': ("//*[@class='price-block__final-price']", 'innerText'),
+    'old_price': ("//*[@class='price-block__old-price']", 'innerText'),
+}
+
+#  Script collecting all SELECTORS in one execute_script() call. Missing node is null
+EXTRACT_SCRIPT = """
+const table = arguments[0];
+const out = {};
+for (const [key, [xpath, prop]] of Object.entries(table)) {
+    const node = document.evaluate(
+        xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+    ).singleNodeValue;
+    const value = node ? node[prop] : null;
+    out[key] = (prop === 'innerText' && value !== null) ? value.trim() : value;
+}
+return out;
+"""
+
+#  Fields which should be on the page to start parsing with PAGE_READY_MODE='selectors'
+READY_FIELDS = ['header', 'nm_id', 'price_block']
+
+#  XPaths of elements on error pages (not found, removed product, server error)
+ERROR_PAGE_XPATHS = [
+    "//*[contains(@class, 'content404')]",
+    "//*[contains(@class, 'error-page')]",
+]
+
+#  Script returning 'error' for error page, 'ready' if READY_FIELDS and price (or
+#  soldout) are present, null otherwise. Page with window.wbmonStale is previous one
+READY_SCRIPT = """
+const [table, ready, errors, soldout] = arguments;
+if (window.wbmonStale) { return null; }
+const find = (xpath) => document.evaluate(
+    xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+).singleNodeValue;
+if (errors.some((xpath) => find(xpath))) { return 'error'; }
+if (!ready.every((field) => find(table[field][0]))) { return null; }
+const block = find(table['price_block'][0]);
+if (!block.textContent.includes(soldout) && !find(table['final_price'][0])) {
+    return null;
+}
+return 'ready';
+"""
+
+_wait_lock = threading.Lock()
 
 
 def wb_parser(driver: Chrome, link: str) -> PageResult:
@@ -54,94 +113,251 @@ def wb_parser(driver: Chrome, link: str) -> PageResult:
         driver: web-driver; Chrome is unarguemented choice
         Link: link to parse
     """
-    driver.get(link)
-    driver = wait_driver(driver)
+    SCRAPE_BREAKER.wait()
+    try:
+        state = retry_call(
+            'page',
+            open_page,
+            driver,
+            link,
+            retry_on=(PageTimeout, TimeoutException),
+            attempts=CFG.PAGE_RETRY_ATTEMPTS,
+        )
+    except PageTimeout:
+        state = 'timeout'
+    except WebDriverException:
+        SCRAPE_BREAKER.record(False)
+        raise
+    #  Error page is 404 or delisted product, fast and legitimate: not a failure
+    SCRAPE_BREAKER.record(state != 'timeout')
+    if state == 'error':
+        logger.warning('Error page, parsing aborted: %s', link)
+        result = error_result(link)
+    else:
+        fields = parse_fields(driver)
+        date = datetime.now().strftime(CFG.FORMAT_TIMESTAMP_PARSED)
+        result = PageResult(date, link, *fields)
+
+    if ARCHIVE.enabled():
+        with timer('archive'):
+            archive_page(driver, result)
+    return result
+
+
+def archive_page(driver: Chrome, result: PageResult) -> None:
+    """Stores source of parsed page to archive. Archive failure is only logged."""
+    nm_id = result.nm_id if result.nm_id.isdigit() else link_nm_id(result.link)
+    try:
+        page = driver.page_source
+    except WebDriverException as exc:
+        logger.warning('Page source not got for archive: %s: %s', result.link, exc)
+        return
+    try:
+        ARCHIVE.store(
+            result.link, int(nm_id) if nm_id else None, result_status(result), page
+        )
+    except ARCHIVE_ERRORS as exc:
+        logger.warning('Page is not archived: %s: %s', result.link, exc)
 
-    brand_name, goods_name = parse_goods_name(driver)
-    seller_info = parse_shop_name(driver)
-    nm_id = parse_id(driver)
-    cus_rub, sel_rub = parse_price(driver)
-    date = datetime.now().strftime(CFG.FORMAT_TIMESTAMP_PARSED)
 
-    return PageResult(
-        date, link, brand_name, goods_name, seller_info, nm_id, cus_rub, sel_rub
+def open_page(driver: Chrome, link: str) -> str:
+    """
+    Loads link and waits for page.
+    Returns:
+        'ready' or 'error' for error page, raises PageTimeout on timeout
+    """
+    with timer('navigate'):
+        if CFG.PAGE_READY_MODE == 'selectors':
+            driver.execute_script('window.wbmonStale = true;')
+        driver.get(link)
+    start_time = time.perf_counter()
+    state = wait_page(driver)
+    record_wait(link, state, time.perf_counter() - start_time)
+    METRICS.inc('wbmon_pages_total', state=state)
+    if state == 'timeout':
+        raise PageTimeout(link)
+    return state
+
+
+def parse_fields(driver: Chrome) -> Tuple[str, ...]:
+    """
+    Parses all fields except date and link with PARSER_MODE. If PARSER_COMPARE_TIMING,
+    runs both modes on the page and logs their timings.
+    Returns:
+        tuple of brand_name, goods_name, seller_info, nm_id, cus_rub, sel_rub
+    """
+    if not CFG.PARSER_COMPARE_TIMING:
+        return PARSE_MODES[CFG.PARSER_MODE](driver)
+    results = {}
+    timings = {}
+    for mode, parse_func in PARSE_MODES.items():
+        start_time = time.perf_counter()
+        results[mode] = parse_func(driver)
+        timings[mode] = time.perf_counter() - start_time
+    logger.info(
+        'Parse timing: %s',
+        ', '.join(f'{mode} {sec:.3f} sec' for mode, sec in timings.items()),
     )
+    if len(set(results.values())) > 1:
+        logger.warning('Parse modes give different results: %s', results)
+    return results[CFG.PARSER_MODE]
+
+
+def parse_fields_elements(driver: Chrome) -> Tuple[str, ...]:
+    """Parses fields with separate find_element() call for every field."""
+    with timer('parse_goods_name'):
+        brand_name, goods_name = parse_goods_name(driver)
+    with timer('parse_shop_name'):
+        seller_info = parse_shop_name(driver)
+    with timer('parse_id'):
+        nm_id = parse_id(driver)
+    with timer('parse_price'):
+        cus_rub, sel_rub = parse_price(driver)
+    return brand_name, goods_name, seller_info, nm_id, cus_rub, sel_rub
+
+
+def parse_fields_script(driver: Chrome) -> Tuple[str, ...]:
+    """Parses fields with single execute_script() call, driven by SELECTORS."""
+    with timer('parse_script'):
+        raw = driver.execute_script(EXTRACT_SCRIPT, SELECTORS)
+    if not isinstance(raw, dict):
+        logger.warning('Extract script returned nothing')
+        raw = {}
+    brand_name, goods_name = goods_from_text(raw.get('header'))
+    seller_info = shop_from_text(raw.get('seller'))
+    nm_id = id_from_text(raw.get('nm_id'))
+    cus_rub, sel_rub = price_from_text(
+        raw.get('price_block'), raw.get('final_price'), raw.get('old_price')
+    )
+    return brand_name, goods_name, seller_info, nm_id, cus_rub, sel_rub
 
 
-def wait_driver(driver: Chrome) -> Chrome:
-    """Waits until page will be loaded. XPATH changed once."""
-    try:
-        WebDriverWait(driver, CFG.PAGELOAD_MAXTIME).until(
-            EC.visibility_of_element_located(
-                (By.XPATH, "//*[@class='product-page__aside']")
-            )
+def wait_page(driver: Chrome) -> str:
+    """
+    Waits until page will be loaded, with PAGE_READY_MODE. XPATH changed once.
+    Returns:
+        'ready', 'error' for error page or 'timeout'
+    """
+    if CFG.PAGE_READY_MODE == 'aside':
+        condition = EC.visibility_of_element_located(
+            (By.XPATH, "//*[@class='product-page__aside']")
         )
+    else:
+        condition = page_state
+    try:
+        state = WebDriverWait(
+            driver, CFG.PAGELOAD_MAXTIME, poll_frequency=CFG.PAGE_READY_POLL
+        ).until(condition)
     except TimeoutException:
         logger.warning('TimeoutException when waited for main page to load')
-    return driver
+        METRICS.inc('wbmon_timeouts_total', stage='wait')
+        return 'timeout'
+    return state if isinstance(state, str) else 'ready'
 
 
-def parse_shop_name(driver: Chrome) -> str:
-    """Get seller name. Sometimes it is missed on the page."""
+def page_state(driver: Chrome) -> Optional[str]:
+    """Condition for WebDriverWait: 'ready', 'error' or None if page is loading."""
+    return driver.execute_script(
+        READY_SCRIPT, SELECTORS, READY_FIELDS, ERROR_PAGE_XPATHS, SOLDOUT
+    )
+
+
+def record_wait(link: str, state: str, seconds: float) -> None:
+    """
+    Logs time of page waiting and appends it to PAGEWAIT_CSV_FILENAME, if it is set.
+    Args:
+        link: loaded link
+        state: result of wait_page()
+        seconds: time of waiting
+    """
+    logger.debug('Page %s after %s sec', state, round(seconds, 2))
+    METRICS.observe('wbmon_stage_seconds', seconds, stage='wait')
+    if not CFG.PAGEWAIT_CSV_FILENAME:
+        return
+    date = datetime.now().strftime(CFG.FORMAT_TIMESTAMP_PARSED)
+    row = [date, link, state, f'{seconds:.3f}']
+    with _wait_lock:
+        with open(CFG.PAGEWAIT_CSV_FILENAME, 'a', encoding='utf-8') as file:
+            file.write(CFG.STORING_CSV_SEPARATOR.join(row) + '\n')
+
+
+def find_value(driver: Chrome, field: str) -> Optional[str]:
+    """Reads SELECTORS field with find_element(). Returns None if no element."""
+    xpath, prop = SELECTORS[field]
     try:
-        elem = driver.find_element(
-            By.XPATH, "//*[@class='seller-info__name']"
-        ).get_attribute('textContent')
+        elem = driver.find_element(By.XPATH, xpath)
     except NoSuchElementException:
-        elem = CFG.ERROR_PARSE_STRING
-    if isinstance(elem, str):
-        return elem.strip()
+        return None
+    if prop == 'innerText':
+        return elem.text
+    return elem.get_attribute(prop)
+
+
+def parse_shop_name(driver: Chrome) -> str:
+    """Get seller name. Sometimes it is missed on the page."""
+    return shop_from_text(find_value(driver, 'seller'))
+
+
+def shop_from_text(text: Optional[str]) -> str:
+    """Returns seller name from text of seller element."""
+    if isinstance(text, str):
+        return text.strip()
     return CFG.ERROR_PARSE_STRING
 
 
-def retain_num(elem: WebElement) -> int:
+def retain_num(text: str) -> int:
     """Filters all characters except digits."""
-    return int(re.sub(r'[^0-9]', '', elem.text))
+    return int(re.sub(r'[^0-9]', '', text))
 
 
 def parse_price(driver: Chrome) -> Tuple[str, str]:
     """Get 'customer' (real) and 'seller' (striked) prices."""
+    block = find_value(driver, 'price_block')
+    if block is None or SOLDOUT in block:
+        return price_from_text(block, None, None)
+    return price_from_text(
+        block, find_value(driver, 'final_price'), find_value(driver, 'old_price')
+    )
 
-    soldout = 'Нет в наличии'
 
-    try:
-        e12 = driver.find_element(
-            By.XPATH,
-            "//div[contains(@class, 'product-page__price-block product-page__price-block--common')]",  #  pylint: disable=line-too-long
-        ).text
-    except NoSuchElementException:
+def price_from_text(
+    block: Optional[str], final: Optional[str], old: Optional[str]
+) -> Tuple[str, str]:
+    """Returns 'customer' and 'seller' prices from texts of price elements."""
+    if block is None:
         logger.warning('Cannot find neither prices nor soldout')
         return CFG.ERROR_PARSE_STRING, CFG.ERROR_PARSE_STRING
 
-    if soldout in e12:
-        return soldout, soldout
+    if SOLDOUT in block:
+        return SOLDOUT, SOLDOUT
 
-    try:
-        e1 = driver.find_element(By.XPATH, "//*[@class='price-block__final-price']")
-        e1 = str(retain_num(e1))
-    except NoSuchElementException:
-        logger.warning('Undocumented case e_1: %s', e12)
+    if final is None:
+        logger.warning('Undocumented case e_1: %s', block)
         e1 = CFG.ERROR_PARSE_STRING
+    else:
+        e1 = str(retain_num(final))
 
-    try:
-        e2 = driver.find_element(By.XPATH, "//*[@class='price-block__old-price']")
-        e2 = str(retain_num(e2))
-    except NoSuchElementException:
+    if old is None:
         logger.warning('No seller price parsed')
         e2 = CFG.ERROR_PARSE_STRING
+    else:
+        e2 = str(retain_num(old))
 
     return e1, e2
 
 
 def parse_goods_name(driver: Chrome) -> Tuple[str, str]:
     """Get brand name and thing name, that are in same string."""
-    try:
-        elem = driver.find_element(By.XPATH, "//*[@class='product-page__header']")
-    except NoSuchElementException:
+    return goods_from_text(find_value(driver, 'header'))
+
+
+def goods_from_text(text: Optional[str]) -> Tuple[str, str]:
+    """Returns brand name and thing name from text of header element."""
+    if text is None:
         logger.warning('Can not find brand/good name')
         return CFG.ERROR_PARSE_STRING, CFG.ERROR_PARSE_STRING
     try:
-        brand_name, goods_name = elem.text.split('\n')
+        brand_name, goods_name = text.split('\n')
     except ValueError:
         logger.warning('Find product name, but can not parse it to brand and good')
         return CFG.ERROR_PARSE_STRING, CFG.ERROR_PARSE_STRING
@@ -150,23 +366,37 @@ def parse_goods_name(driver: Chrome) -> Tuple[str, str]:
 
 def parse_id(driver: Chrome) -> str:
     """Get nomenclature ID number of goods."""
-    try:
-        elem = driver.find_element(
-            By.XPATH, "//*[@class='product-params__cell product-params__cell--copy']"
-        ).get_attribute('textContent')
-    except NoSuchElementException:
+    return id_from_text(find_value(driver, 'nm_id'))
+
+
+def id_from_text(text: Optional[str]) -> str:
+    """Returns nomenclature ID from text of ID element."""
+    if text is None:
         logger.warning('Can not find product ID')
         return CFG.ERROR_PARSE_STRING
     try:
-        assert isinstance(elem, str)
-        int(elem)
-    except TypeError:
+        int(text)
+    except (TypeError, ValueError):
         logger.warning('Find product ID, but it is not a numeric')
         return CFG.ERROR_PARSE_STRING
-    except IndexError:
-        logger.warning('Find product ID, but it is not iterates properly')
-        return CFG.ERROR_PARSE_STRING
-    return elem
+    return text
+
+
+#  Parse modes to choose with PARSER_MODE
+PARSE_MODES: Dict[str, Callable[[Chrome], Tuple[str, ...]]] = {
+    'elements': parse_fields_elements,
+    'script': parse_fields_script,
+}
+
+
+def error_result(link: str) -> PageResult:
+    """
+    Returns PageResult with all parsed fields set to ERROR_PARSE_STRING. Used when page
+    can not be parsed at all, to keep result in place of the link.
+    """
+    date = datetime.now().strftime(CFG.FORMAT_TIMESTAMP_PARSED)
+    err = CFG.ERROR_PARSE_STRING
+    return PageResult(date, link, err, err, err, err, err, err)
 
 
 def dummy_parser(dummydriver: int, link: str) -> PageResult:
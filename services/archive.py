@@ -0,0 +1,224 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains archive of raw pages: page sources compressed with zstd, stored
+once per content hash and indexed by nm_id and time, to debug parser and parse again
+without crawling.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from config import CFG
+from services.metrics import METRICS
+from services.sqlitedb import connect
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency: archive is off without it
+    zstandard = None
+
+logger = logging.getLogger('A.AR')
+logger.setLevel(logging.DEBUG)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    fetched REAL NOT NULL,
+    nm_id INTEGER,
+    link TEXT NOT NULL,
+    status TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_nm_id ON pages (nm_id, fetched);
+CREATE INDEX IF NOT EXISTS pages_fetched ON pages (fetched);
+CREATE INDEX IF NOT EXISTS pages_hash ON pages (hash);
+"""
+
+#  Errors of storing page: disk, index, compression and encoding of page source
+ARCHIVE_ERRORS = (OSError, sqlite3.Error, ValueError) + (
+    (zstandard.ZstdError,) if zstandard else ()
+)
+
+#  Oldest pages dropped at once while archive is bigger than ARCHIVE_MAX_MB
+PRUNE_BATCH = 100
+
+#  Single archived page: time fetched, link, status of result, content hash
+PageRow = Tuple[float, str, str, str]
+
+
+class PageArchive:
+    """
+    Keeps raw pages of wb_parser(). Aims of the class creating is:
+    1. Store page source compressed with zstd in ARCHIVE_DIR, file name is hash of
+       content, so the same page is stored once.
+    2. Index pages by nm_id and fetch time in ARCHIVE_DB_FILENAME.
+    3. Cap disk used: pages older than ARCHIVE_MAX_DAYS are dropped, and the oldest
+       ones while archive is bigger than ARCHIVE_MAX_MB.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.warned = False
+        self.stored = 0
+
+    def enabled(self) -> bool:
+        """Returns true if archive is on and zstandard is installed. Warns once if not."""
+        if not CFG.ARCHIVE_PAGES:
+            return False
+        if zstandard is None:
+            if not self.warned:
+                logger.warning('Package zstandard is not installed, pages not archived')
+                self.warned = True
+            return False
+        return True
+
+    def db(self) -> sqlite3.Connection:
+        """Opens database at first use."""
+        if self.conn is None:
+            os.makedirs(CFG.ARCHIVE_DIR, exist_ok=True)
+            self.conn = connect(CFG.ARCHIVE_DB_FILENAME, SCHEMA)
+        return self.conn
+
+    def path(self, digest: str) -> str:
+        """Returns file of the blob, in subfolder by first two hash characters."""
+        return os.path.join(CFG.ARCHIVE_DIR, digest[:2], digest + '.html.zst')
+
+    def store(self, link: str, nm_id: Optional[int], status: str, page: str) -> str:
+        """
+        Archives page, writing blob only if the same content is not stored yet.
+        Args:
+            link: link of the page
+            nm_id: product ID, None if not known
+            status: status of result, as storage.result_status() returns
+            page: page source
+        Returns:
+            content hash of the page
+        """
+        raw = page.encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        with self.lock, self.db() as conn:
+            known = conn.execute(
+                'SELECT 1 FROM blobs WHERE hash = ?', (digest,)
+            ).fetchone()
+            if known:
+                METRICS.inc('wbmon_archive_dedup_total')
+            else:
+                data = zstandard.ZstdCompressor(level=CFG.ARCHIVE_LEVEL).compress(raw)
+                os.makedirs(os.path.dirname(self.path(digest)), exist_ok=True)
+                with open(self.path(digest), 'wb') as file:
+                    file.write(data)
+                conn.execute(
+                    'INSERT INTO blobs VALUES (?, ?, ?)', (digest, len(data), len(raw))
+                )
+                METRICS.inc('wbmon_archive_bytes_total', len(data))
+            conn.execute(
+                'INSERT INTO pages VALUES (?, ?, ?, ?, ?)',
+                (time.time(), nm_id, link, status, digest),
+            )
+            self.stored += 1
+            prune = self.stored % CFG.ARCHIVE_PRUNE_EVERY == 0
+        if prune:
+            self.enforce_retention()
+        return digest
+
+    def load(self, digest: str) -> str:
+        """Returns page source by content hash."""
+        with open(self.path(digest), 'rb') as file:
+            data = file.read()
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+
+    def pages(self, nm_id: int, since: Optional[float] = None) -> List[PageRow]:
+        """Returns archived pages of product, oldest first, using index by nm_id."""
+        with self.lock:
+            return (
+                self.db()
+                .execute(
+                    'SELECT fetched, link, status, hash FROM pages '
+                    'WHERE nm_id = ? AND fetched >= ? ORDER BY fetched',
+                    (nm_id, since or 0),
+                )
+                .fetchall()
+            )
+
+    def export(self, nm_id: int, folder: str) -> Optional[str]:
+        """
+        Writes the latest page of product to <folder>/<nm_id>.html, the name the fixture
+        server of benchmarks replays recorded pages by.
+        Returns:
+            path of written file, None if product has no pages
+        """
+        rows = self.pages(nm_id)
+        if not rows:
+            return None
+        path = os.path.join(folder, f'{nm_id}.html')
+        os.makedirs(folder, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.load(rows[-1][3]))
+        return path
+
+    def enforce_retention(self) -> None:
+        """Drops pages by ARCHIVE_MAX_DAYS and ARCHIVE_MAX_MB, then unused blobs."""
+        with self.lock, self.db() as conn:
+            conn.execute(
+                'DELETE FROM pages WHERE fetched < ?',
+                (time.time() - CFG.ARCHIVE_MAX_DAYS * 86400,),
+            )
+            self.drop_unused(conn)
+            limit = CFG.ARCHIVE_MAX_MB * 1024 * 1024
+            while total_size(conn) > limit:
+                deleted = conn.execute(
+                    'DELETE FROM pages WHERE rowid IN (SELECT rowid FROM pages '
+                    'ORDER BY fetched LIMIT ?)',
+                    (PRUNE_BATCH,),
+                ).rowcount
+                if not deleted:
+                    break
+                self.drop_unused(conn)
+
+    def drop_unused(self, conn: sqlite3.Connection) -> None:
+        """Deletes blobs no page refers to, with their files. Called under lock."""
+        unused = [
+            row[0]
+            for row in conn.execute(
+                'SELECT hash FROM blobs WHERE hash NOT IN (SELECT hash FROM pages)'
+            )
+        ]
+        for digest in unused:
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
+        conn.executemany('DELETE FROM blobs WHERE hash = ?', [(d,) for d in unused])
+        if unused:
+            logger.info('Archive retention dropped %s stored pages', len(unused))
+
+
+def total_size(conn: sqlite3.Connection) -> int:
+    """Returns size of all blobs on disk, in bytes."""
+    return conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+
+#  The only archive, shared by all drivers
+ARCHIVE = PageArchive()
@@ -0,0 +1,128 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains change detection: filters results, which not changed since."""
+
+import logging
+from datetime import datetime
+from typing import List
+
+from config import CFG
+from parsing.results import PageResult
+from services.sqlitedb import connect
+from services.storage import result_status
+
+logger = logging.getLogger('A.CH')
+logger.setLevel(logging.DEBUG)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS last_values (
+    key TEXT PRIMARY KEY,
+    cus_rub TEXT,
+    sel_rub TEXT,
+    seller_info TEXT,
+    changed_at TEXT NOT NULL,
+    seen_at TEXT NOT NULL
+);
+"""
+
+
+def result_key(result: PageResult) -> str:
+    """Returns product ID of the result, or link if ID was not parsed."""
+    nm_id = str(result.nm_id)
+    return nm_id if nm_id.isdigit() else result.link
+
+
+def is_error(result: PageResult) -> bool:
+    """
+    Checks whether result is failed, by the same rule as storage: no ID or customer
+    price parsed. No old price (sel_rub) is usual for product without discount.
+    """
+    return result_status(result) == 'error'
+
+
+def changed_results(full_result: List[PageResult]) -> List[PageResult]:
+    """
+    Compares results with last known values from CHANGES_INDEX_FILENAME. Logs compact
+    heartbeat with quantity of unchanged results.
+    Args:
+        full_result: parsed data of the job
+    Returns:
+        results with changed prices or seller, new products and errors
+    """
+    conn = connect(CFG.CHANGES_INDEX_FILENAME, SCHEMA)
+    try:
+        known = {
+            row[0]: tuple(row[1:])
+            for row in conn.execute(
+                'SELECT key, cus_rub, sel_rub, seller_info FROM last_values'
+            )
+        }
+    finally:
+        conn.close()
+    changed = [
+        result
+        for result in full_result
+        if is_error(result)
+        or known.get(result_key(result))
+        != (str(result.cus_rub), str(result.sel_rub), str(result.seller_info))
+    ]
+    logger.info(
+        'HEARTBEAT: %s of %s results unchanged, %s to publish',
+        len(full_result) - len(changed),
+        len(full_result),
+        len(changed),
+    )
+    return changed
+
+
+def remember_results(full_result: List[PageResult]) -> None:
+    """
+    Saves values of the results as last known ones. Should be called after publishing.
+    Results with errors are not saved.
+    Args:
+        full_result: parsed data of the job
+    """
+    now = datetime.now().isoformat(sep=' ', timespec='seconds')
+    rows = [
+        (
+            result_key(result),
+            str(result.cus_rub),
+            str(result.sel_rub),
+            str(result.seller_info),
+            now,
+            now,
+        )
+        for result in full_result
+        if not is_error(result)
+    ]
+    conn = connect(CFG.CHANGES_INDEX_FILENAME, SCHEMA)
+    try:
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO last_values VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    changed_at = CASE
+                        WHEN (cus_rub, sel_rub, seller_info)
+                            = (excluded.cus_rub, excluded.sel_rub, excluded.seller_info)
+                        THEN changed_at ELSE excluded.changed_at END,
+                    cus_rub = excluded.cus_rub,
+                    sel_rub = excluded.sel_rub,
+                    seller_info = excluded.seller_info,
+                    seen_at = excluded.seen_at
+                """,
+                rows,
+            )
+    finally:
+        conn.close()
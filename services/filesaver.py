@@ -11,37 +11,52 @@
 
 # You should have received a copy of the GNU General Public License along with this
 # program.  If not, see <https://www.gnu.org/licenses/>.
-"""This file contains function to save results into csv file."""
+"""This file contains functions to save results into csv file or other storage."""
 
 import logging
 import os
-from typing import List
+from typing import Callable, Dict, List
 
-from config import Cfg
-from parsing.wbparser import PageResult
+from config import CFG
+from parsing.results import PageResult
+from services.metrics import timed
+from services.storage import save_sqlite
 
-CFG = Cfg(test=os.getenv('TEST') == 'true')
 logger = logging.getLogger('A.GC')
 logger.setLevel(logging.DEBUG)
 
 
+@timed('save_values')
 def save_values(full_result: List[PageResult]) -> None:
+    """
+    Function to save results with STORAGE_BACKEND.
+    Args:
+        full_result: parsed data
+    """
+    STORAGES[CFG.STORAGE_BACKEND](full_result)
+
+
+def save_csv(full_result: List[PageResult]) -> None:
     """
     Function to save results into text file. Creates, if not exist.
     Args:
         full_result: parsed data
     """
     header_vars = [name.lower() for name in CFG.DATA_HEADER]
-    try:
-        with open(CFG.STORING_CSV_FILENAME, encoding='utf-8'):
-            pass
-    except FileNotFoundError:
-        with open(CFG.STORING_CSV_FILENAME, 'a', encoding='utf-8') as file:
+    new_file = not os.path.exists(CFG.STORING_CSV_FILENAME)
+    with open(CFG.STORING_CSV_FILENAME, 'a', encoding='utf-8') as file:
+        if new_file:
             file.write(CFG.STORING_CSV_SEPARATOR.join(header_vars))
             file.write('\n')
-    with open(CFG.STORING_CSV_FILENAME, 'a', encoding='utf-8') as file:
         for result in full_result:
             result_list = [str(result._asdict()[name]) for name in header_vars]
             result_list.append('\n')
             file.write(CFG.STORING_CSV_SEPARATOR.join(result_list))
     logger.info('Data saved to file: %s', CFG.STORING_CSV_FILENAME)
+
+
+#  Storage backends to choose with STORAGE_BACKEND
+STORAGES: Dict[str, Callable[[List[PageResult]], None]] = {
+    'csv': save_csv,
+    'sqlite': save_sqlite,
+}
@@ -17,28 +17,48 @@ import logging
 import os
 import time
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import httplib2
 import pygsheets
+from google.auth.exceptions import RefreshError, TransportError
+from google_auth_httplib2 import Request
+from googleapiclient.errors import HttpError
 from pygsheets import Cell
 from pygsheets.client import Client
 from pygsheets.datarange import DataRange
 
-from config import Cfg
-from parsing.wbparser import PageResult
-
-CFG = Cfg(test=os.getenv('TEST') == 'true')
+from config import CFG
+from parsing.results import PageResult
+from services.metrics import METRICS, timed
+from services.resilience import backoff_delay, retry_call
 
 logger = logging.getLogger('A.GC')
 logger.setLevel(logging.DEBUG)
 
+#  Errors of Google Sheets calls, which may pass on next attempt
+SHEETS_TRANSIENT = (
+    HttpError,
+    TransportError,
+    pygsheets.exceptions.RequestError,
+    OSError,
+)
+
+#  Errors publishing may fail with. Refresh token expired or revoked (with Testing
+#  publishing status it expires after 7 days) does not pass on retry
+SHEETS_ERRORS = SHEETS_TRANSIENT + (RefreshError,)
 
-class Gc:
+
+class Gc:  # pylint: disable=too-many-instance-attributes
     """
     Represent continuous connection to google.sheets. Aims of the class creating is:
-    1. Provide smart reconnect google sheets connection after long delay (controls with
-       CFG. PYGSHEET_RECONNECT_TIME).
+    1. Keep one client and one HTTP transport with kept-alive connections for all
+       publishing: Sheets calls, token refresh and re-authorization. OAuth token is
+       refreshed only when it expired; client is re-authorized only after errors.
     2. Put into a single variable with Client, Spreadsheet, Worksheet, Spreadsh.id.
+    3. Cache position of header for GSHEETS_CACHE_SEC, so publishing does not look for
+       it every time.
+    4. Keep log worksheet and its rows count for 'append' layout.
     """
 
     def __init__(self) -> None:
@@ -47,9 +67,16 @@ class Gc:
         (spreadsheet), (4) opens worksheet "sheet1" in it, (5) creates header if needed
         """
         logger.debug('Gonna authorize pygsheets')
-        self.client = pygsheets.authorize(client_secret=CFG.OAUTH_CREDENTIALS_FILE)
+        self.http = httplib2.Http()
+        self.client = pygsheets.authorize(
+            client_secret=CFG.OAUTH_CREDENTIALS_FILE, http=self.http
+        )
         logger.debug('Client authorized at start')
-        self.started = time.monotonic()
+        self.header_position: Optional[Tuple[int, int]] = None
+        self.cached = time.monotonic()
+        self.stale = False
+        self.log_wks: Optional[pygsheets.Worksheet] = None
+        self.log_rows = 0
 
         if CFG.CREATE_NEW_SPREADSHEET:
             spreadsheet = self.create_new_sheet()
@@ -60,34 +87,66 @@ class Gc:
         self.sh = self.client.open(spreadsheet)
         self.wks = self.sh.sheet1
         if CFG.CREATE_NEW_SPREADSHEET:
-            create_header(self.wks)
+            if CFG.GSHEETS_LAYOUT == 'top':
+                create_header(self.wks)
+            else:
+                create_index(self.wks)
 
     def reconnect(self, soft: bool) -> None:
         """
-        Reconnect Gc() instance to google before send data to gsheets.
-        #TODO review. Is it really needed? May be I wrong and pygsheets do it...Catch ex
+        Prepares Gc() instance before send data to gsheets.
         Args:
-            soft: if true, look config and decides on time of last conn, otherwise force
+            soft: if true, only refreshes expired token, unless former publishing
+                failed or token can not be refreshed; otherwise re-authorizes and
+                reloads Spreadsheet and Worksheet. RefreshError of re-authorization
+                is raised, it is one of SHEETS_ERRORS
         """
-        last_connect = time.monotonic() - self.started
-        if (soft and (last_connect > CFG.SEC_PYGSHEET_RECONNECT_TIME)) or (not soft):
-            logger.info(
-                'Will reconnect. Last connection was %s min ago, MORE than %s',
-                round(last_connect / 60, 1),
-                round(CFG.SEC_PYGSHEET_RECONNECT_TIME / 60, 1),
-            )
-            self.client = pygsheets.authorize(client_secret=CFG.OAUTH_CREDENTIALS_FILE)
-            assert self.sh
-            self.sh = self.client.open_by_key(self.sh.id)
-            self.wks = self.sh.sheet1
-            self.started = time.monotonic()
-            logger.info('Client re-authorized, Spreadsheet and Worksheet reloaded')
-        else:
-            logger.info(
-                'Will not reconnect. Last connection was %s min ago, LESS than %s',
-                round(last_connect / 60, 1),
-                round(CFG.SEC_PYGSHEET_RECONNECT_TIME / 60, 1),
+        if soft and not self.stale:
+            credentials = self.client.oauth
+            if not credentials.expired and credentials.valid:
+                return
+            try:
+                credentials.refresh(Request(self.http))
+                METRICS.inc('wbmon_token_refreshes_total')
+                logger.info('OAuth token refreshed')
+                return
+            except RefreshError:
+                #  Token file may be renewed by hand, full authorization reads it again
+                logger.exception('OAuth token not refreshed, will authorize again')
+        logger.info(
+            'Will reconnect. Soft: %s, former publishing failed: %s', soft, self.stale
+        )
+        METRICS.inc('wbmon_reconnects_total')
+        self.client = pygsheets.authorize(
+            client_secret=CFG.OAUTH_CREDENTIALS_FILE, http=self.http
+        )
+        assert self.sh
+        self.sh = self.client.open_by_key(self.sh.id)
+        self.wks = self.sh.sheet1
+        self.header_position = None
+        self.log_wks = None
+        self.stale = False
+        logger.info('Client re-authorized, Spreadsheet and Worksheet reloaded')
+
+    def post_position(self) -> Tuple[int, int]:
+        """Returns cell under the header, cached for GSHEETS_CACHE_SEC."""
+        if (
+            self.header_position is None
+            or time.monotonic() - self.cached > CFG.GSHEETS_CACHE_SEC
+        ):
+            head_range = sheets_call(
+                'get_named_range', self.wks.get_named_range, name=CFG.HEADER_RANGE_NAME
             )
+            rn, cn = head_range.start_addr
+            self.header_position = (rn + 1, cn)
+            self.cached = time.monotonic()
+        return self.header_position
+
+    def invalidate(self) -> None:
+        """Drops cache and makes next reconnect re-authorize, after failed publishing."""
+        self.header_position = None
+        self.log_wks = None
+        self.stale = True
 
     def create_new_sheet(self) -> str:
         """
@@ -120,14 +179,15 @@ class Gc:
         return gsheet_name
 
 
-def get_links(client: Client) -> Optional[List[str]]:
+def get_links(client: Client) -> Optional[Tuple[List[str], Dict[str, str]]]:
     """
     Load links from named range LINKS_RANGE_NAME on Sheet1 of special Spreadsheet named
     LINKS_SPREADSHEET_NAME. Raises Exception, should be moderated by admin every launch.
+    Refresh policy of link is in column B of the sheet, or after whitespace in file.
     Args:
         client: Client pygsheets instance
     Returns:
-        list of links if OK, None if spreadsheet nof found
+        list of links and refresh policies of links if OK, None if spreadsheet nof found
     """
     logger.debug('Prepare to open links spreadsheet')
     try:
@@ -137,21 +197,27 @@ def get_links(client: Client) -> Optional[List[str]]:
         logger.warning('Cant load links from spreadsheet! trying links.txt...')
         try:
             with open(CFG.LINKS_FILE, encoding='utf-8') as file:
-                links = file.readlines()
+                rows = [line.split(maxsplit=1) for line in file.readlines()]
+                links = [row[0] for row in rows if row]
+                policies = {row[0]: row[1].strip() for row in rows if len(row) > 1}
                 logger.info('Found %s links in %s', len(links), CFG.LINKS_FILE)
-                return links
+                return links, policies
         except FileNotFoundError as exc2:
             logger.exception('Cant find links. Exit.')
             raise RuntimeError from exc2
     wks_links = sh_links.sheet1
-    lnkrange_values = wks_links.get_values(start=(1, 1), end=(CFG.MAX_LINK_QUANTITY, 1))
+    #  All rows: MAX_LINK_QUANTITY caps links due in the job, not links watched
+    lnkrange_values = wks_links.get_values(start=(1, 1), end=(wks_links.rows, 2))
     wks_links.unlink()
     logger.debug('Links values downloaded')
     lnks = []
+    policies = {}
     for cell in lnkrange_values:
-        if cell[0]:
+        if cell and cell[0]:
             lnks.append(cell[0])
-    return lnks
+            if len(cell) > 1 and cell[1]:
+                policies[cell[0]] = cell[1]
+    return lnks, policies
 
 
 def create_header(wks: pygsheets.Worksheet) -> bool:
@@ -190,18 +256,19 @@ def create_header(wks: pygsheets.Worksheet) -> bool:
     return False
 
 
-def start_gsheets() -> Tuple[List[str], Gc]:
+def start_gsheets() -> Tuple[List[str], Dict[str, str], Gc]:
     """
     Starts work with googlesheets. Establish connection, create new list, create header.
     Returns:
-        links to load and spreadsheet to write
+        links to load, refresh policies of links and spreadsheet to write
     """
     gc = Gc()
     client = gc.client
     logger.info('Client authorized at start')
 
-    lnks = get_links(client)
-    assert isinstance(lnks, list)
+    links = get_links(client)
+    assert links is not None
+    lnks, policies = links
 
     logger.info(
         "TEST MODE: %s, MAX_LINK_QUANTITY: %s",
@@ -209,33 +276,98 @@ def start_gsheets() -> Tuple[List[str], Gc]:
         CFG.MAX_LINK_QUANTITY,
     )
 
-    return lnks, gc
+    return lnks, policies, gc
 
 
-def post_values(gc: Gc, full_result: List[PageResult]) -> bool:
+@timed('post_values')
+def post_values(gc: Gc, full_result: List[PageResult], log_rows: bool = True) -> bool:
     """
-    Finds actual header position and post all rows below it. Print beautiful logs.
+    Appends rows to log worksheet, or with 'top' layout finds actual header position
+    and post all rows below it. Print beautiful logs.
     Args:
         gc: Gc() instance with connection
         full_result: namedtuple with data to publish
+        log_rows: if False, rows are not logged, e.g. when console sink logs them
     Returns:
         True
     """
-    gc.reconnect(soft=True)
-    wks = gc.wks
     logger.debug(' START POSTING\n')
-    logger.info('%s', '|' + ' | '.join(logresult_prepare(header=True)))
+    if log_rows:
+        log_header()
     start_time = time.time()
-    assert wks
-    head_range = wks.get_named_range(name=CFG.HEADER_RANGE_NAME)
-    rn, cn = head_range.start_addr
-    post_position = (rn + 1, cn)
-    wks.unlink()
-    header_vars = [name.lower() for name in CFG.DATA_HEADER]
-    for result in full_result:
-        wks.insert_rows(row=1, number=1, values=None, inherit=False)
-        result_list = [str(result._asdict()[name]) for name in header_vars]
-        wks.update_values(
+    rows = [result_row(result) for result in full_result]
+    try:
+        sheets_call('reconnect', gc.reconnect, soft=True)
+        if CFG.GSHEETS_LAYOUT == 'append':
+            publish_append(gc, rows)
+        else:
+            wks = gc.wks
+            assert wks
+            post_position = gc.post_position()
+            if CFG.GSHEETS_BATCH_PUBLISH:
+                publish_batches(wks, post_position, rows)
+            else:
+                publish_rows(wks, post_position, rows)
+    except SHEETS_ERRORS:
+        gc.invalidate()
+        raise
+    if log_rows:
+        for result_list in rows:
+            log_row(result_list)
+    end_time = time.time()
+    logger.debug(' FINISH POSTING. DONE in %s sec \n', round(end_time - start_time, 0))
+    return True
+
+
+def sheets_call(op: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Calls Google Sheets with retries on SHEETS_TRANSIENT. Only for idempotent calls."""
+    return retry_call(op, func, *args, retry_on=SHEETS_TRANSIENT, **kwargs)
+
+
+def sheets_write(op: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Calls Google Sheets once, for writes which are not idempotent, like inserting or
+    appending rows: request timed out may be applied already, so repeating it would
+    duplicate rows.
+    """
+    return retry_call(op, func, *args, retry_on=SHEETS_TRANSIENT, attempts=1, **kwargs)
+
+
+def result_row(result: PageResult) -> List[str]:
+    """Returns result as list of strings, in order of DATA_HEADER."""
+    return [str(value) for value in result]
+
+
+def log_header() -> None:
+    """Logs padded header before rows."""
+    logger.info('%s', '|' + ' | '.join(logresult_prepare(header=True)))
+
+
+def log_row(result_list: List[str]) -> None:
+    """Logs row in full to file only, and trimmed to console."""
+    logger.info(  # pylint: disable=logging-not-lazy
+        ' | '.join(result_list) + ' | ' + CFG.LOGGER_FILTER_MSG
+    )
+    logger.info('%s', '|' + ' | '.join(logresult_prepare(data=result_list)))
+
+
+def publish_rows(
+    wks: pygsheets.Worksheet, post_position: Tuple[int, int], rows: List[List[str]]
+) -> None:
+    """
+    Inserts rows on top one by one: two API calls per row.
+    Args:
+        wks: worksheet to publish
+        post_position: cell under the header
+        rows: values to publish
+    """
+    for result_list in rows:
+        sheets_write(
+            'insert_rows', wks.insert_rows, row=1, number=1, values=None, inherit=False
+        )
+        sheets_call(
+            'update_values',
+            wks.update_values,
             crange=post_position,
             values=[result_list],
             cell_list=None,
@@ -243,14 +375,235 @@ def post_values(gc: Gc, full_result: List[PageResult]) -> bool:
             majordim='ROWS',
             parse=None,
         )
-        logger.info(  # pylint: disable=logging-not-lazy
-            ' | '.join(result_list) + ' | ' + CFG.LOGGER_FILTER_MSG
+
+
+def publish_batches(
+    wks: pygsheets.Worksheet, post_position: Tuple[int, int], rows: List[List[str]]
+) -> None:
+    """
+    Inserts rows on top by chunks of GSHEETS_BATCH_ROWS: two API calls per chunk. Chunk
+    is written reversed, so rows are placed in the same order as publish_rows() does.
+    Args:
+        wks: worksheet to publish
+        post_position: cell under the header
+        rows: values to publish
+    """
+    for start in range(0, len(rows), CFG.GSHEETS_BATCH_ROWS):
+        chunk = rows[start : start + CFG.GSHEETS_BATCH_ROWS]
+        sheets_write(
+            'insert_rows',
+            wks.insert_rows,
+            row=1,
+            number=len(chunk),
+            values=None,
+            inherit=False,
         )
-        logger.info('%s', '|' + ' | '.join(logresult_prepare(data=result_list)))
-    wks.link()
-    end_time = time.time()
-    logger.debug(' FINISH POSTING. DONE in %s sec \n', round(end_time - start_time, 0))
-    return True
+        sheets_call(
+            'update_values',
+            wks.update_values,
+            crange=post_position,
+            values=chunk[::-1],
+            cell_list=None,
+            extend=False,
+            majordim='ROWS',
+            parse=None,
+        )
+        logger.debug('Published chunk of %s rows', len(chunk))
+
+
+def publish_append(gc: Gc, rows: List[List[str]]) -> None:
+    """
+    Appends rows after last row of log worksheet by chunks of GSHEETS_BATCH_ROWS (or
+    row by row): one API call per chunk. Rows are in order of scraping, oldest first.
+    Args:
+        gc: Gc() instance with connection
+        rows: values to publish
+    """
+    size = CFG.GSHEETS_BATCH_ROWS if CFG.GSHEETS_BATCH_PUBLISH else 1
+    start = 0
+    while start < len(rows):
+        wks = log_worksheet(gc)
+        room = size
+        if CFG.GSHEETS_ROLLOVER == 'rows':
+            room = min(size, CFG.GSHEETS_ROLLOVER_ROWS - gc.log_rows)
+        chunk = rows[start : start + room]
+        append_checked(gc, wks, chunk)
+        gc.log_rows += len(chunk)
+        start += len(chunk)
+        logger.debug('Appended chunk of %s rows to %s', len(chunk), wks.title)
+
+
+def append_checked(gc: Gc, wks: pygsheets.Worksheet, chunk: List[List[str]]) -> None:
+    """
+    Appends chunk to log worksheet with retries. Append is not idempotent, so after
+    error rows are counted again: chunk is appended again only if it is not there.
+    """
+    for attempt in range(CFG.RETRY_ATTEMPTS):
+        try:
+            sheets_write('values_append', append_values, wks, chunk)
+            return
+        except SHEETS_TRANSIENT:
+            if attempt + 1 >= CFG.RETRY_ATTEMPTS:
+                raise
+            time.sleep(backoff_delay(attempt))
+            rows = count_rows(wks)
+            if rows == gc.log_rows + len(chunk):
+                logger.warning('Chunk was appended before error, not appended again')
+                return
+            if rows != gc.log_rows:
+                raise
+            logger.warning('Chunk was not appended, attempt %s', attempt + 2)
+    raise AssertionError('Attempts should be positive')
+
+
+def count_rows(wks: pygsheets.Worksheet) -> int:
+    """Returns quantity of rows under header of log worksheet, by column A."""
+    column = sheets_call('get_col', wks.get_col, 1, include_tailing_empty=False)
+    return max(len(column) - 1, 0)
+
+
+def append_values(wks: pygsheets.Worksheet, rows: List[List[str]]) -> None:
+    """
+    Appends rows after the table starting at A1. Unlike Worksheet.append_table(), does
+    not reload worksheet properties after, so it is one API call.
+    """
+    wks.client.sheet.values_append(
+        wks.spreadsheet.id,
+        rows,
+        'ROWS',
+        range=quote_title(wks.title),
+        insertDataOption='OVERWRITE',
+    )
+
+
+def log_worksheet(gc: Gc) -> pygsheets.Worksheet:
+    """
+    Returns log worksheet to append rows to. Starts next one by GSHEETS_ROLLOVER: when
+    month changes, or when GSHEETS_ROLLOVER_ROWS rows are published.
+    """
+    prefix = CFG.GSHEETS_WORKSHEET_PREFIX
+    if CFG.GSHEETS_ROLLOVER == 'month':
+        title = prefix + datetime.now().strftime('%Y-%m')
+        if gc.log_wks is None or gc.log_wks.title != title:
+            gc.log_wks, gc.log_rows = open_log(gc.sh, title)
+        return gc.log_wks
+    if gc.log_wks is None:
+        numbers = [
+            int(wks.title[len(prefix) :])
+            for wks in gc.sh.worksheets()
+            if wks.title.startswith(prefix) and wks.title[len(prefix) :].isdigit()
+        ]
+        gc.log_wks, gc.log_rows = open_log(gc.sh, prefix + str(max(numbers or [1])))
+    if gc.log_rows >= CFG.GSHEETS_ROLLOVER_ROWS:
+        number = int(gc.log_wks.title[len(prefix) :]) + 1
+        gc.log_wks, gc.log_rows = open_log(gc.sh, prefix + str(number))
+    return gc.log_wks
+
+
+def open_log(sh: pygsheets.Spreadsheet, title: str) -> Tuple[pygsheets.Worksheet, int]:
+    """
+    Opens log worksheet, or creates it with header and adds it to index. Points newest
+    view to it.
+    Args:
+        sh: spreadsheet to publish
+        title: title of log worksheet
+    Returns:
+        worksheet and quantity of rows under header
+    """
+    try:
+        wks = sheets_call('worksheet_by_title', sh.worksheet_by_title, title)
+        rows = count_rows(wks)
+        logger.info('Log worksheet opened: %s, rows: %s', title, rows)
+    except pygsheets.WorksheetNotFound:
+        wks = sheets_call(
+            'add_worksheet', sh.add_worksheet, title, rows=1, cols=len(CFG.DATA_HEADER)
+        )
+        create_plain_header(wks, CFG.DATA_HEADER)
+        add_to_index(sh, wks)
+        rows = 0
+        logger.info('Log worksheet created: %s', title)
+    if CFG.GSHEETS_NEWEST_TITLE:
+        show_newest(sh, title)
+    return wks, rows
+
+
+def create_plain_header(wks: pygsheets.Worksheet, header: List[str]) -> None:
+    """Writes header to the first row and freezes it."""
+    sheets_call(
+        'update_values', wks.update_values, crange=(1, 1), values=[header], parse=False
+    )
+    wks.frozen_rows = 1
+
+
+def create_index(wks: pygsheets.Worksheet) -> None:
+    """Makes index of log worksheets from worksheet, usually empty sheet1."""
+    wks.title = CFG.GSHEETS_INDEX_TITLE
+    create_plain_header(wks, ['Worksheet', 'Created'])
+    logger.debug('Index worksheet created')
+
+
+def add_to_index(sh: pygsheets.Spreadsheet, wks: pygsheets.Worksheet) -> None:
+    """Appends link to log worksheet and its creating time to index."""
+    try:
+        index = sheets_call(
+            'worksheet_by_title', sh.worksheet_by_title, CFG.GSHEETS_INDEX_TITLE
+        )
+    except pygsheets.WorksheetNotFound:
+        index = sheets_call(
+            'add_worksheet', sh.add_worksheet, CFG.GSHEETS_INDEX_TITLE, rows=1, cols=2
+        )
+        create_index(index)
+    row = [
+        f'=HYPERLINK("#gid={wks.id}", "{wks.title}")',
+        datetime.now().strftime(CFG.FORMAT_TIMESTAMP_PARSED),
+    ]
+    sheets_write('values_append', append_values, index, [row])
+
+
+def quote_title(title: str) -> str:
+    """Returns worksheet title quoted for A1 notation."""
+    escaped = title.replace("'", "''")
+    return f"'{escaped}'"
+
+
+def newest_formula(title: str) -> str:
+    """
+    Returns formula with rows of log worksheet newest on top: sorted by row number
+    descending, empty rows dropped, up to GSHEETS_NEWEST_ROWS rows.
+    """
+    last_col = chr(ord('A') + len(CFG.DATA_HEADER) - 1)
+    sheet = quote_title(title) + '!'
+    data, key = f'{sheet}A2:{last_col}', f'{sheet}A2:A'
+    return (
+        f'=ARRAY_CONSTRAIN(SORT(FILTER({data}, {key}<>""), '
+        f'FILTER(ROW({key}), {key}<>""), FALSE), '
+        f'{CFG.GSHEETS_NEWEST_ROWS}, {len(CFG.DATA_HEADER)})'
+    )
+
+
+def show_newest(sh: pygsheets.Spreadsheet, title: str) -> None:
+    """Points newest view worksheet to log worksheet, creating view if needed."""
+    try:
+        view = sheets_call(
+            'worksheet_by_title', sh.worksheet_by_title, CFG.GSHEETS_NEWEST_TITLE
+        )
+    except pygsheets.WorksheetNotFound:
+        view = sheets_call(
+            'add_worksheet',
+            sh.add_worksheet,
+            CFG.GSHEETS_NEWEST_TITLE,
+            rows=CFG.GSHEETS_NEWEST_ROWS + 1,
+            cols=len(CFG.DATA_HEADER),
+        )
+        create_plain_header(view, CFG.DATA_HEADER)
+    sheets_call(
+        'update_values',
+        view.update_values,
+        crange=(2, 1),
+        values=[[newest_formula(title)]],
+        parse=True,
+    )
+    logger.debug('Newest view shows %s', title)
 
 
 def logresult_prepare(
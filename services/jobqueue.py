@@ -0,0 +1,269 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains durable job queue. Every result is written to disk as soon as it is
+parsed, so job killed in the middle is resumed from the link it stopped at.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from config import CFG
+from parsing.results import PageResult
+from services.shards import WORKER_ID
+from services.sqlitedb import connect
+
+logger = logging.getLogger('A.JQ')
+logger.setLevel(logging.DEBUG)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0,
+    worker TEXT NOT NULL,
+    round TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    link TEXT NOT NULL,
+    result TEXT,
+    published INTEGER NOT NULL DEFAULT 0,
+    carried INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, pos)
+);
+"""
+
+
+def open_queue() -> sqlite3.Connection:
+    """Opens queue database."""
+    return connect(CFG.JOB_QUEUE_FILENAME, SCHEMA)
+
+
+def queue_worker() -> str:
+    """
+    Returns owner of jobs of this process: shard worker ID with SHARDING, so workers
+    sharing the queue file never resume or finish jobs of each other, else empty.
+    """
+    return WORKER_ID if CFG.SHARDING else ''
+
+
+def unfinished_job(round_key: str) -> Optional[int]:
+    """
+    Returns ID of the newest unfinished job of this worker for the round. Round is
+    next cron fire time, so it survives restart, while links of the job do not:
+    refresh policies and planner choose other links once some are scraped.
+    """
+    conn = open_queue()
+    try:
+        row = conn.execute(
+            'SELECT job_id FROM jobs WHERE finished = 0 AND worker = ? AND round = ? '
+            'ORDER BY job_id DESC LIMIT 1',
+            (queue_worker(), round_key),
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+class JobQueue:
+    """
+    Durable queue of single job. Aims of the class creating is:
+    1. Resume unfinished job of this worker for the same cron round, instead of
+       starting new one. Job failed with exception is not finished, so it is resumed
+       by next run before next cron fire time.
+    2. Record every PageResult as soon as it is parsed (record() is ResultCallback).
+    3. Remember which results are published, so resumed job publishes only the rest.
+    4. Carry results not published by former jobs of this worker into the new job, so
+       they are published later and never dropped.
+    """
+
+    def __init__(self, lnks: List[str], round_key: str) -> None:
+        """
+        Opens unfinished job of the round or creates new one with the links.
+        Args:
+            lnks: links of the job
+            round_key: ID of the round, next cron fire time
+        """
+        self.lock = threading.Lock()
+        self.conn = open_queue()
+        job_id = unfinished_job(round_key)
+        if job_id is None:
+            job_id = self.create(lnks, round_key)
+        elif CFG.SHARDING:
+            #  Claims of the round grow when workers leave, only this worker has them
+            self.extend(job_id, lnks)
+        self.job_id: int = job_id
+        self.pending = [
+            row[0]
+            for row in self.conn.execute(
+                'SELECT link FROM items WHERE job_id = ? AND result IS NULL '
+                'ORDER BY pos',
+                (self.job_id,),
+            )
+        ]
+        logger.info('Job %s has %s links to scrape', self.job_id, len(self.pending))
+
+    def create(self, lnks: List[str], round_key: str) -> int:
+        """
+        Creates job with the links. Unfinished jobs of this worker are finished, their
+        results not published are carried to the new job, before its links.
+        """
+        worker = queue_worker()
+        with self.conn:
+            carried = self.conn.execute(
+                'SELECT link, result FROM items WHERE result IS NOT NULL '
+                'AND published = 0 AND job_id IN (SELECT job_id FROM jobs '
+                'WHERE finished = 0 AND worker = ?) ORDER BY job_id, pos',
+                (worker,),
+            ).fetchall()
+            self.conn.execute(
+                'UPDATE jobs SET finished = 1 WHERE finished = 0 AND worker = ?',
+                (worker,),
+            )
+            job_id = self.conn.execute(
+                'INSERT INTO jobs (created, worker, round) VALUES (?, ?, ?)',
+                (time.time(), worker, round_key),
+            ).lastrowid
+            self.conn.executemany(
+                'INSERT INTO items (job_id, pos, link, result, carried) '
+                'VALUES (?, ?, ?, ?, 1)',
+                [
+                    (job_id, pos, link, result)
+                    for pos, (link, result) in enumerate(carried)
+                ],
+            )
+            self.conn.executemany(
+                'INSERT INTO items (job_id, pos, link) VALUES (?, ?, ?)',
+                [(job_id, len(carried) + pos, link) for pos, link in enumerate(lnks)],
+            )
+        logger.info(
+            'Job %s created with %s links, %s results carried from former jobs',
+            job_id,
+            len(lnks),
+            len(carried),
+        )
+        assert job_id is not None
+        return job_id
+
+    def extend(self, job_id: int, lnks: List[str]) -> None:
+        """Adds links missing in the job to its end."""
+        with self.conn:
+            known = {
+                row[0]
+                for row in self.conn.execute(
+                    'SELECT link FROM items WHERE job_id = ?', (job_id,)
+                )
+            }
+            start = self.conn.execute(
+                'SELECT COALESCE(MAX(pos) + 1, 0) FROM items WHERE job_id = ?',
+                (job_id,),
+            ).fetchone()[0]
+            missing = [link for link in lnks if link not in known]
+            self.conn.executemany(
+                'INSERT INTO items (job_id, pos, link) VALUES (?, ?, ?)',
+                [(job_id, start + i, link) for i, link in enumerate(missing)],
+            )
+        if missing:
+            logger.info('Job %s extended with %s links', job_id, len(missing))
+
+    def record(self, result: PageResult) -> None:
+        """Saves result of the first link without result."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                'UPDATE items SET result = ? WHERE job_id = ? AND pos = ('
+                'SELECT MIN(pos) FROM items WHERE job_id = ? AND link = ? '
+                'AND result IS NULL)',
+                (json.dumps(list(result)), self.job_id, self.job_id, result.link),
+            )
+
+    def fetch(self, condition: str) -> List[PageResult]:
+        """Returns results of job items matching SQL condition, in order of links."""
+        with self.lock:
+            return [
+                PageResult(*json.loads(row[0]))
+                for row in self.conn.execute(
+                    'SELECT result FROM items WHERE job_id = ? '
+                    f'AND result IS NOT NULL AND {condition} ORDER BY pos',
+                    (self.job_id,),
+                )
+            ]
+
+    def results(self) -> List[PageResult]:
+        """Returns recorded results of links of the job, in order of links."""
+        return self.fetch('carried = 0')
+
+    def unpublished(self) -> List[PageResult]:
+        """
+        Returns recorded results, which are not published yet: carried ones first,
+        then results of links of the job.
+        """
+        return self.fetch('published = 0')
+
+    def keep(self, full_result: List[PageResult]) -> None:
+        """
+        Adds results, not recorded by this job, to carry them to next job: results of
+        other shard workers, if publishing of the round failed.
+        """
+        with self.lock, self.conn:
+            start = self.conn.execute(
+                'SELECT MAX(pos) + 1 FROM items WHERE job_id = ?', (self.job_id,)
+            ).fetchone()[0]
+            self.conn.executemany(
+                'INSERT INTO items (job_id, pos, link, result, carried) '
+                'VALUES (?, ?, ?, ?, 1)',
+                [
+                    (
+                        self.job_id,
+                        (start or 0) + i,
+                        result.link,
+                        json.dumps(list(result)),
+                    )
+                    for i, result in enumerate(full_result)
+                ],
+            )
+
+    def mark_published(self, batch: List[PageResult]) -> None:
+        """Marks results of the batch published."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'UPDATE items SET published = 1 WHERE job_id = ? AND link = ? '
+                'AND result IS NOT NULL',
+                [(self.job_id, result.link) for result in batch],
+            )
+
+    def finish(self) -> None:
+        """
+        Marks job finished and deletes items of finished jobs. Call it only when all
+        results are published, otherwise they are lost.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                'UPDATE jobs SET finished = 1 WHERE job_id = ?', (self.job_id,)
+            )
+            self.conn.execute(
+                'DELETE FROM items WHERE job_id IN '
+                '(SELECT job_id FROM jobs WHERE finished = 1)'
+            )
+        logger.info('Job %s finished', self.job_id)
+
+    def close(self) -> None:
+        """Closes database. Job not finished is resumed by next run."""
+        with self.lock:
+            self.conn.close()
@@ -13,58 +13,143 @@
 # program.  If not, see <https://www.gnu.org/licenses/>.
 """This file contains advanced function to generate logging.Logger logger."""
 
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+from typing import List
 
-from config import Cfg
+from config import CFG
 
-CFG = Cfg(test=os.getenv('TEST') == 'true')
 
+class ContextFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """
+    Necessary for escaping messages in console with large data (URLs, ...), but log
+    it in rotating handler.
+    """
+
+    def filter(self, record):
+        return 0 if CFG.LOGGER_FILTER_MSG in str(record.msg) else 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats record as one JSON object per line."""
 
-def start_logger() -> logging.Logger:
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'ms': int(record.msecs),
+            'level': record.levelname,
+            'logger': record.name,
+            'func': record.funcName,
+            'line': record.lineno,
+            'thread': record.threadName,
+            'message': record.getMessage().replace(CFG.LOGGER_FILTER_MSG, '').strip(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LazyQueueHandler(QueueHandler):
     """
-    Returns logging.Logger from nothing. Loggers definition. Logger in logger.py is the
-    highest (A), other are descendants: A.ma, A.gc, etc.
+    QueueHandler which only merges args into message before putting, so mutable args
+    are logged as they were at the call. Standard one also formats record on the
+    logging thread; here formatting is done by listener thread.
     """
-    lgr = logging.getLogger('A')
-    lgr.setLevel(logging.DEBUG)
 
-    class ContextFilter(logging.Filter):  # pylint: disable=too-few-public-methods
-        """
-        Necessary for escaping messages in console with large data (URLs, ...), but log
-        it in rotating handler.
-        """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
 
-        def filter(self, record):
-            return 0 if CFG.LOGGER_FILTER_MSG in record.msg else 1
 
-    #  Logging to console.
-    ch = logging.StreamHandler()
+def make_handlers(path: str, console: bool = True) -> List[logging.Handler]:
+    """
+    Returns handlers writing log: console, rotating file and, if LOGGER_JSON, JSON
+    lines file rotated by time.
+    Args:
+        path: folder for log files
+        console: whether to log to console
+    """
+    handlers: List[logging.Handler] = []
+    if console:
+        #  Logging to console.
+        ch = logging.StreamHandler()
+        ch.setFormatter(
+            logging.Formatter(
+                '[%(asctime)s.%(msecs)03d - %(name)3s - %(levelname)8s '
+                '- %(funcName)18s()] %(message)s',
+                '%H:%M:%S',
+            )
+        )
+        ch.addFilter(ContextFilter())
+        handlers.append(ch)
     #  Logging to file, continuous after bot restart.
     rh = RotatingFileHandler(
-        filename=os.path.join(CFG.PATH_LOGGER, CFG.FILE_ROTATING_LOGGER),
+        filename=os.path.join(path, CFG.FILE_ROTATING_LOGGER),
         mode='a',
         maxBytes=CFG.BYTES_MAX_ROTATING_LOGGER,
         backupCount=CFG.QTY_BACKUPS_ROTATING_LOGGER,
     )
-    ch_formatter = logging.Formatter(
-        '[%(asctime)s.%(msecs)03d - %(name)3s - %(levelname)8s - %(funcName)18s()] %(message)s',
-        '%H:%M:%S',
-    )
-    fh_formatter = logging.Formatter(
-        '[%(asctime)s.%(msecs)03d - %(name)20s - %(filename)20s:%(lineno)4s \
+    rh.setFormatter(
+        logging.Formatter(
+            '[%(asctime)s.%(msecs)03d - %(name)20s - %(filename)20s:%(lineno)4s \
 - %(funcName)20s() - %(levelname)8s - %(threadName)10s] %(message)s',
-        '%Y-%m-%d %H:%M:%S',
+            '%Y-%m-%d %H:%M:%S',
+        )
     )
-    ch.setLevel(logging.DEBUG)
-    rh.setLevel(logging.DEBUG)
-    ch.setFormatter(ch_formatter)
-    rh.setFormatter(fh_formatter)
-    lgr.addHandler(ch)
-    lgr.addHandler(rh)
-    ch_filter = ContextFilter()
-    ch.addFilter(ch_filter)
+    handlers.append(rh)
+    if CFG.LOGGER_JSON:
+        jh = TimedRotatingFileHandler(
+            filename=os.path.join(path, CFG.FILE_JSON_LOGGER),
+            when=CFG.LOGGER_JSON_ROTATE_WHEN,
+            backupCount=CFG.QTY_BACKUPS_JSON_LOGGER,
+            encoding='utf-8',
+        )
+        jh.setFormatter(JsonFormatter())
+        handlers.append(jh)
+    for handler in handlers:
+        handler.setLevel(logging.DEBUG)
+    return handlers
+
+
+def start_logger(
+    name: str = 'A',
+    path: str = CFG.PATH_LOGGER,
+    queued: bool = CFG.LOGGER_QUEUED,
+    console: bool = True,
+) -> logging.Logger:
+    """
+    Returns logging.Logger from nothing. Loggers definition. Logger in logger.py is the
+    highest (A), other are descendants: A.ma, A.gc, etc. With queued, records are only
+    put to queue, and formatted and written by listener in background thread.
+    Args:
+        name: name of the logger
+        path: folder for log files
+        queued: whether to write log in background thread
+        console: whether to log to console
+    """
+    lgr = logging.getLogger(name)
+    lgr.setLevel(logging.DEBUG)
+    handlers = make_handlers(path, console)
+    if not queued:
+        for handler in handlers:
+            lgr.addHandler(handler)
+        return lgr
+    records: queue.Queue = queue.Queue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    #  Listener writes the rest of records before program exits
+    atexit.register(listener.stop)
+    lgr.addHandler(LazyQueueHandler(records))
     return lgr
 
 
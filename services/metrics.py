@@ -0,0 +1,172 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains metrics: histograms, counters and export in Prometheus format."""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from config import CFG
+
+logger = logging.getLogger('A.ME')
+logger.setLevel(logging.DEBUG)
+
+#  Metric key: name and sorted labels
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:  # pylint: disable=too-few-public-methods
+    """Cumulative histogram with METRICS_BUCKETS upper bounds, in seconds."""
+
+    def __init__(self, bounds: List[float]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Adds single value."""
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    """Keeps all metrics of the process. Thread-safe."""
+
+    def __init__(self) -> None:
+        self.histograms: Dict[Key, Histogram] = {}
+        self.counters: Dict[Key, float] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Adds value to histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(CFG.METRICS_BUCKETS)
+            self.histograms[key].observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Increments counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def export(self) -> str:
+        """Returns all metrics in Prometheus text exposition format."""
+        lines: List[str] = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} counter')
+                    typed.add(name)
+                lines.append(f'{name}{render_labels(labels)} {value:g}')
+            for (name, labels), hist in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} histogram')
+                    typed.add(name)
+                for bound, count in zip(hist.bounds, hist.counts):
+                    le = render_labels(labels + (('le', f'{bound:g}'),))
+                    lines.append(f'{name}_bucket{le} {count}')
+                inf = render_labels(labels + (('le', '+Inf'),))
+                lines.append(f'{name}_bucket{inf} {hist.total}')
+                lines.append(f'{name}_sum{render_labels(labels)} {hist.sum:.6f}')
+                lines.append(f'{name}_count{render_labels(labels)} {hist.total}')
+        return '\n'.join(lines) + '\n'
+
+
+def render_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """Returns labels as {name="value",...}, empty string if no labels."""
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+#  The only registry, shared by all modules
+METRICS = Registry()
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """Measures duration of the block into wbmon_stage_seconds histogram."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.observe(
+            'wbmon_stage_seconds', time.perf_counter() - start_time, stage=stage
+        )
+
+
+def timed(stage: str) -> Callable:
+    """Decorator measuring every call of function into wbmon_stage_seconds."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def write_metrics() -> None:
+    """Writes metrics to METRICS_FILENAME atomically, if it is set."""
+    if not CFG.METRICS_FILENAME:
+        return
+    temp_filename = CFG.METRICS_FILENAME + '.tmp'
+    with open(temp_filename, 'w', encoding='utf-8') as file:
+        file.write(METRICS.export())
+    os.replace(temp_filename, CFG.METRICS_FILENAME)
+    logger.debug('Metrics written to %s', CFG.METRICS_FILENAME)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves metrics on any GET path."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Returns metrics in Prometheus text format."""
+        body = METRICS.export().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        """Scrapes of metrics are not logged."""
+
+
+def start_metrics_server() -> None:
+    """Starts HTTP endpoint with metrics on METRICS_PORT in background, if it is set."""
+    if not CFG.METRICS_PORT:
+        return
+    server = ThreadingHTTPServer(('0.0.0.0', CFG.METRICS_PORT), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info('Metrics endpoint started on port %s', CFG.METRICS_PORT)
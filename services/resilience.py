@@ -0,0 +1,143 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains retries with backoff and circuit breaker for flaky calls."""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Optional, Tuple, Type
+
+from config import CFG
+from services.metrics import METRICS
+
+logger = logging.getLogger('A.RS')
+logger.setLevel(logging.DEBUG)
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Returns pause before next attempt: exponential backoff with full jitter.
+    Args:
+        attempt: number of failed attempt, from 0
+    """
+    cap = min(CFG.RETRY_MAX_DELAY, CFG.RETRY_BASE_DELAY * 2**attempt)
+    return random.uniform(0, cap)
+
+
+def retry_call(
+    op: str,
+    func: Callable[..., Any],
+    *args: Any,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    attempts: Optional[int] = None,
+    **kwargs: Any,
+) -> Any:
+    """
+    Calls function, and on errors calls it again after backoff_delay(), up to
+    RETRY_ATTEMPTS times in total. Last error is raised.
+    Args:
+        op: name of operation for logs and metrics
+        func: function to call
+        retry_on: errors to retry, other errors are raised at once
+        attempts: attempts in total, if differs from RETRY_ATTEMPTS
+    Returns:
+        what function returns
+    """
+    attempts = attempts or CFG.RETRY_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except retry_on as exc:
+            if attempt + 1 >= attempts:
+                METRICS.inc('wbmon_retry_failures_total', op=op)
+                raise
+            delay = backoff_delay(attempt)
+            METRICS.inc('wbmon_retries_total', op=op)
+            logger.warning(
+                '%s failed: %s. Attempt %s of %s in %s sec',
+                op,
+                type(exc).__name__,
+                attempt + 2,
+                attempts,
+                round(delay, 1),
+            )
+            time.sleep(delay)
+    raise AssertionError('Attempts should be positive')
+
+
+class CircuitBreaker:
+    """
+    Pauses calls when they fail too often. Aims of the class creating is:
+    1. Keep outcomes of last BREAKER_WINDOW calls.
+    2. Open when share of failures reaches BREAKER_ERROR_RATE: callers wait
+       BREAKER_COOLDOWN seconds, because failures usually mean throttling.
+    3. After pause let calls go again (half-open): success closes breaker, failure
+       opens it for next pause.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.lock = threading.Lock()
+        self.outcomes: Deque[bool] = deque(maxlen=CFG.BREAKER_WINDOW)
+        self.opened_until = 0.0
+        self.half_open = False
+
+    def wait(self) -> None:
+        """Blocks while breaker is open."""
+        while True:
+            with self.lock:
+                pause = self.opened_until - time.monotonic()
+            if pause <= 0:
+                return
+            logger.warning('Breaker %s is open, pause %s sec', self.name, round(pause))
+            time.sleep(pause)
+
+    def record(self, success: bool) -> None:
+        """Remembers outcome of call and opens breaker if needed."""
+        with self.lock:
+            if time.monotonic() < self.opened_until:
+                #  Call started before breaker opened
+                return
+            if self.half_open:
+                self.half_open = False
+                if success:
+                    logger.info('Breaker %s closed', self.name)
+                    self.outcomes.clear()
+                else:
+                    self.open()
+                return
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if (
+                len(self.outcomes) >= CFG.BREAKER_MIN_CALLS
+                and failures / len(self.outcomes) >= CFG.BREAKER_ERROR_RATE
+            ):
+                self.open()
+
+    def open(self) -> None:
+        """Opens breaker for BREAKER_COOLDOWN seconds. Called under lock."""
+        self.opened_until = time.monotonic() + CFG.BREAKER_COOLDOWN
+        self.half_open = True
+        self.outcomes.clear()
+        METRICS.inc('wbmon_breaker_opened_total', breaker=self.name)
+        logger.warning(
+            'Breaker %s opened, calls paused for %s sec',
+            self.name,
+            CFG.BREAKER_COOLDOWN,
+        )
+
+
+SCRAPE_BREAKER = CircuitBreaker('scrape')
@@ -0,0 +1,342 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains sharding of links between several wbmon processes on one host.
+Workers share SQLite database: they send heartbeats there, claim own links for the
+round and store results. Links of the round are stored by the first worker, so all
+workers shard the same set. Link owner is chosen with rendezvous hashing over alive
+workers, so when worker joins or leaves, only its links move. Claim lasts while its
+worker sends heartbeats: links of lost worker are claimed again by others. The first
+worker to see results of all links publishes the round.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import CFG
+from parsing.results import PageResult
+from services.sqlitedb import connect
+
+logger = logging.getLogger('A.SH')
+logger.setLevel(logging.DEBUG)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rounds (
+    round TEXT PRIMARY KEY,
+    links TEXT NOT NULL,
+    published INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS claims (
+    round TEXT NOT NULL,
+    link TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    PRIMARY KEY (round, link)
+);
+CREATE TABLE IF NOT EXISTS results (
+    round TEXT NOT NULL,
+    link TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (round, link)
+);
+"""
+
+#  Host of this process. SQLite can not be shared by hosts over network filesystem
+HOST = socket.gethostname()
+
+#  ID of this process in coordination database
+WORKER_ID = CFG.SHARD_WORKER_ID or f'{HOST}-{os.getpid()}'
+
+#  Scraper of links claimed again from lost workers
+Scrape = Callable[[List[str]], List[PageResult]]
+
+
+def open_db() -> sqlite3.Connection:
+    """Opens coordination database."""
+    return connect(CFG.SHARD_DB_FILENAME, SCHEMA)
+
+
+def heartbeat() -> None:
+    """Marks this worker alive."""
+    conn = open_db()
+    try:
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO workers VALUES (?, ?, ?)',
+                (WORKER_ID, HOST, time.time()),
+            )
+    finally:
+        conn.close()
+
+
+def start_heartbeat() -> None:
+    """Sends heartbeats in background thread, every third of SHARD_HEARTBEAT_TTL."""
+
+    def beat() -> None:
+        while True:
+            try:
+                heartbeat()
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception('Heartbeat failed')
+            time.sleep(CFG.SHARD_HEARTBEAT_TTL / 3)
+
+    heartbeat()
+    threading.Thread(target=beat, name='heartbeat', daemon=True).start()
+    logger.info('Worker %s joined shards', WORKER_ID)
+
+
+def leave(*_) -> None:
+    """Removes this worker, so its links move to others at once. Scheduler listener."""
+    conn = open_db()
+    try:
+        with conn:
+            conn.execute('DELETE FROM workers WHERE worker = ?', (WORKER_ID,))
+    finally:
+        conn.close()
+    logger.info('Worker %s left shards', WORKER_ID)
+
+
+def alive_workers() -> List[str]:
+    """
+    Returns sorted IDs of workers on this host with fresh heartbeat, this one
+    included. Workers of other hosts are ignored with error.
+    """
+    heartbeat()
+    conn = open_db()
+    try:
+        rows = conn.execute(
+            'SELECT worker, host FROM workers WHERE heartbeat > ? ORDER BY worker',
+            (time.time() - CFG.SHARD_HEARTBEAT_TTL,),
+        ).fetchall()
+    finally:
+        conn.close()
+    strangers = [worker for worker, host in rows if host != HOST]
+    if strangers:
+        logger.error('Workers of other hosts ignored, share one host: %s', strangers)
+    return [worker for worker, host in rows if host == HOST]
+
+
+def link_owner(link: str, workers: List[str]) -> str:
+    """Rendezvous hashing: owner is worker with highest hash of (worker, link)."""
+    return max(
+        workers,
+        key=lambda worker: hashlib.sha1(f'{worker}|{link}'.encode()).digest(),
+    )
+
+
+def claim_links(round_key: str, lnks: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Stores links of the round, if this worker is the first, and claims links of this
+    worker among them. Link claimed by other worker earlier in the round is not
+    claimed again.
+    Args:
+        round_key: ID of the round, same for all workers
+        lnks: links of the job, as this worker sees them
+    Returns:
+        links of the round, the same for all workers, and links this worker should
+        scrape, in order of round links
+    """
+    workers = alive_workers()
+    conn = open_db()
+    try:
+        with conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO rounds (round, links) VALUES (?, ?)',
+                (round_key, json.dumps(lnks)),
+            )
+            round_lnks = json.loads(
+                conn.execute(
+                    'SELECT links FROM rounds WHERE round = ?', (round_key,)
+                ).fetchone()[0]
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO claims VALUES (?, ?, ?)',
+                [
+                    (round_key, link, WORKER_ID)
+                    for link in round_lnks
+                    if link_owner(link, workers) == WORKER_ID
+                ],
+            )
+            claimed = {
+                row[0]
+                for row in conn.execute(
+                    'SELECT link FROM claims WHERE round = ? AND worker = ?',
+                    (round_key, WORKER_ID),
+                )
+            }
+    finally:
+        conn.close()
+    logger.info(
+        'Round %s: %s workers alive, %s of %s links claimed by %s',
+        round_key,
+        len(workers),
+        len(claimed),
+        len(round_lnks),
+        WORKER_ID,
+    )
+    return round_lnks, [link for link in round_lnks if link in claimed]
+
+
+def reclaim_links(round_key: str, lnks: List[str]) -> List[str]:
+    """
+    Claims links without result whose claim expired: not claimed, or claimed by
+    worker whose heartbeat is older than SHARD_HEARTBEAT_TTL.
+    Args:
+        round_key: ID of the round
+        lnks: links without result
+    Returns:
+        links claimed by this worker now, to scrape
+    """
+    alive = set(alive_workers())
+    conn = open_db()
+    try:
+        with conn:
+            claims = dict(
+                conn.execute(
+                    'SELECT link, worker FROM claims WHERE round = ?', (round_key,)
+                ).fetchall()
+            )
+            stored = {
+                row[0]
+                for row in conn.execute(
+                    'SELECT link FROM results WHERE round = ?', (round_key,)
+                )
+            }
+            expired = [
+                link
+                for link in lnks
+                if link not in stored and claims.get(link) not in alive
+            ]
+            conn.executemany(
+                'INSERT OR REPLACE INTO claims VALUES (?, ?, ?)',
+                [(round_key, link, WORKER_ID) for link in expired],
+            )
+    finally:
+        conn.close()
+    if expired:
+        logger.warning(
+            'Round %s: %s links of lost workers claimed by %s',
+            round_key,
+            len(expired),
+            WORKER_ID,
+        )
+    return expired
+
+
+def store_results(round_key: str, full_result: List[PageResult]) -> None:
+    """Saves results of this worker for the round."""
+    conn = open_db()
+    try:
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                [
+                    (round_key, result.link, json.dumps(list(result)))
+                    for result in full_result
+                ],
+            )
+    finally:
+        conn.close()
+
+
+def merge_results(
+    round_key: str, lnks: List[str], full_result: List[PageResult], scrape: Scrape
+) -> Optional[List[PageResult]]:
+    """
+    Stores results of this worker and waits up to SHARD_MERGE_TIMEOUT for results of
+    all links, scraping links of lost workers meanwhile. The first worker to see all
+    results publishes the round.
+    Args:
+        round_key: ID of the round
+        lnks: all links of the round
+        full_result: results of this worker, may have results of former rounds which
+            are not published yet
+        scrape: scraper of links claimed again
+    Returns:
+        results of all workers in order of lnks, then results of other links, if this
+        worker publishes, else None
+    """
+    store_results(round_key, full_result)
+    deadline = time.monotonic() + CFG.SHARD_MERGE_TIMEOUT
+    while True:
+        stored = stored_results(round_key)
+        missed = [link for link in lnks if link not in stored]
+        if not missed or time.monotonic() > deadline:
+            break
+        expired = reclaim_links(round_key, missed)
+        if expired:
+            store_results(round_key, scrape(expired))
+            continue
+        time.sleep(CFG.SHARD_MERGE_POLL)
+    if not take_round(round_key):
+        logger.info('Results stored, other worker publishes round %s', round_key)
+        return None
+    if missed:
+        logger.warning('Round %s merged without %s links', round_key, len(missed))
+    cleanup(round_key)
+    ordered = [link for link in lnks if link in stored]
+    ordered += sorted(set(stored) - set(lnks))
+    return [PageResult(*json.loads(stored[link])) for link in ordered]
+
+
+def stored_results(round_key: str) -> Dict[str, str]:
+    """Returns stored results of the round as JSON by link."""
+    conn = open_db()
+    try:
+        return dict(
+            conn.execute(
+                'SELECT link, result FROM results WHERE round = ?', (round_key,)
+            ).fetchall()
+        )
+    finally:
+        conn.close()
+
+
+def take_round(round_key: str) -> bool:
+    """Marks round published. Returns true for the only worker which marked it."""
+    conn = open_db()
+    try:
+        with conn:
+            return (
+                conn.execute(
+                    'UPDATE rounds SET published = 1 WHERE round = ? AND published = 0',
+                    (round_key,),
+                ).rowcount
+                == 1
+            )
+    finally:
+        conn.close()
+
+
+def cleanup(round_key: str) -> None:
+    """Deletes rounds, claims and results other than this one."""
+    conn = open_db()
+    try:
+        with conn:
+            conn.execute('DELETE FROM rounds WHERE round <> ?', (round_key,))
+            conn.execute('DELETE FROM claims WHERE round <> ?', (round_key,))
+            conn.execute('DELETE FROM results WHERE round <> ?', (round_key,))
+    finally:
+        conn.close()
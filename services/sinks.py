@@ -0,0 +1,160 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains result stream, flushing results to sinks by micro-batches."""
+
+import logging
+import time
+from collections import namedtuple
+from functools import partial
+from typing import Callable, List, Optional
+
+from config import CFG
+from parsing.results import PageResult
+from services.changes import changed_results, remember_results
+from services.filesaver import save_values
+from services.gconnect import Gc, log_header, log_row, post_values, result_row
+
+logger = logging.getLogger('A.SI')
+logger.setLevel(logging.DEBUG)
+
+#  Sink gets batch of results to write
+Sink = Callable[[List[PageResult]], None]
+
+
+def make_sinks(gc: Gc) -> List[Sink]:
+    """Returns sinks for results as config says: Google Sheets and file."""
+    sinks: List[Sink] = []
+    if CFG.SAVE_TO_GSHEETS:
+        sinks.append(partial(post_values, gc, log_rows=False))
+    if CFG.SAVE_TO_FILE:
+        sinks.append(save_values)
+    return sinks
+
+
+#  Batch of results moved to sinks: all results, results to write and indexes of sinks
+#  which have not written them yet
+Flushed = namedtuple('Flushed', 'batch to_publish waiting')
+
+
+def sink_name(sink: Sink) -> str:
+    """Returns name of sink function for logs."""
+    return getattr(getattr(sink, 'func', sink), '__name__', repr(sink))
+
+
+class ResultStream:
+    """
+    Takes results one by one as they are parsed. Aims of the class creating is:
+    1. Log every result to console at once, like post_values() does after the job.
+    2. Flush results to sinks by micro-batches: when STREAM_BATCH_SIZE results are
+       collected or the oldest of them waits longer than STREAM_FLUSH_SEC.
+    3. Filter unchanged results before sinks, if PUBLISH_ONLY_CHANGED.
+    4. Deliver to every sink apart: failed sink does not stop others, keeps results
+       not written and retries them with growing pause, never writing them twice.
+    """
+
+    def __init__(
+        self,
+        sinks: List[Sink],
+        on_published: Optional[Callable[[List[PageResult]], None]] = None,
+    ) -> None:
+        """
+        Args:
+            sinks: functions to write batch of results
+            on_published: function called with every batch after all sinks wrote it
+        """
+        self.sinks = sinks
+        self.on_published = on_published
+        self.batch: List[PageResult] = []
+        self.batch_started = time.monotonic()
+        self.flushed: List[Flushed] = []
+        self.failures = [0] * len(sinks)
+        self.retry_at = [0.0] * len(sinks)
+        log_header()
+
+    def add(self, result: PageResult) -> None:
+        """Logs result and flushes batch if it is full or old, or retry of sink is due."""
+        log_row(result_row(result))
+        if not self.batch:
+            self.batch_started = time.monotonic()
+        self.batch.append(result)
+        if (
+            len(self.batch) >= CFG.STREAM_BATCH_SIZE
+            or time.monotonic() - self.batch_started > CFG.STREAM_FLUSH_SEC
+        ):
+            self.flush()
+        elif self.flushed and min(self.retry_at) <= time.monotonic():
+            self.deliver_all(force=False)
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Moves collected results to sinks and writes results not written yet.
+        Args:
+            force: retry failed sinks now, not after their pause
+        """
+        if self.batch:
+            batch = self.batch
+            self.batch = []
+            if CFG.PUBLISH_ONLY_CHANGED:
+                to_publish = changed_results(batch)
+            else:
+                to_publish = batch
+            self.flushed.append(Flushed(batch, to_publish, set(range(len(self.sinks)))))
+        self.deliver_all(force)
+
+    def deliver_all(self, force: bool) -> None:
+        """Writes results to every sink, then completes batches written by all."""
+        for index in range(len(self.sinks)):
+            if force or self.retry_at[index] <= time.monotonic():
+                self.deliver(index)
+        for flushed in [flushed for flushed in self.flushed if not flushed.waiting]:
+            self.flushed.remove(flushed)
+            if CFG.PUBLISH_ONLY_CHANGED:
+                remember_results(flushed.batch)
+            if self.on_published:
+                self.on_published(flushed.batch)
+            logger.debug('Batch of %s results flushed', len(flushed.batch))
+
+    def deliver(self, index: int) -> None:
+        """Writes to sink all results it has not written. On error sets its pause."""
+        waiting = [flushed for flushed in self.flushed if index in flushed.waiting]
+        to_publish = [result for flushed in waiting for result in flushed.to_publish]
+        try:
+            if to_publish:
+                self.sinks[index](to_publish)
+        except Exception:  # pylint: disable=broad-exception-caught
+            delay = min(
+                CFG.RETRY_MAX_DELAY, CFG.RETRY_BASE_DELAY * 2 ** self.failures[index]
+            )
+            self.failures[index] += 1
+            self.retry_at[index] = time.monotonic() + delay
+            logger.exception(
+                '%s results not written by %s, retry in %s sec',
+                len(to_publish),
+                sink_name(self.sinks[index]),
+                delay,
+            )
+            return
+        self.failures[index] = 0
+        for flushed in waiting:
+            flushed.waiting.discard(index)
+
+    def close(self) -> None:
+        """Flushes the rest of results, retrying failed sinks once more."""
+        self.flush(force=True)
+        for index, sink in enumerate(self.sinks):
+            left = sum(len(f.to_publish) for f in self.flushed if index in f.waiting)
+            if left:
+                logger.warning(
+                    '%s results left not written by %s', left, sink_name(sink)
+                )
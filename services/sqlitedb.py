@@ -0,0 +1,33 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains function to open local SQLite databases used by the program."""
+
+import sqlite3
+
+
+def connect(filename: str, schema: str) -> sqlite3.Connection:
+    """
+    Opens SQLite database in WAL mode, so it can be read while written, and creates
+    tables if they not exist.
+    Args:
+        filename: path to database file
+        schema: SQL script with CREATE ... IF NOT EXISTS statements
+    Returns:
+        connection to the database
+    """
+    conn = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(schema)
+    return conn
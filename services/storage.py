@@ -0,0 +1,129 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""This file contains SQLite storage of results with typed columns and read API."""
+
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from config import CFG
+from parsing.results import SOLDOUT, PageResult
+from services.sqlitedb import connect
+
+logger = logging.getLogger('A.ST')
+logger.setLevel(logging.DEBUG)
+
+#  Rows are partitioned by 'day': queries for date range use only its index part
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    parsed_at TEXT NOT NULL,
+    day TEXT NOT NULL,
+    link TEXT NOT NULL,
+    brand_name TEXT,
+    goods_name TEXT,
+    seller_info TEXT,
+    nm_id INTEGER,
+    cus_rub INTEGER,
+    sel_rub INTEGER,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_day ON results (day);
+CREATE INDEX IF NOT EXISTS results_nm_id ON results (nm_id, parsed_at);
+"""
+
+#  Single row of price history: time parsed, customer price, seller price, status
+HistoryRow = Tuple[str, Optional[int], Optional[int], str]
+
+
+def to_int(value: object) -> Optional[int]:
+    """Returns integer from parsed field, None if it is not a number."""
+    try:
+        return int(str(value))
+    except ValueError:
+        return None
+
+
+def result_status(result: PageResult) -> str:
+    """Returns 'ok', 'soldout' or 'error' for the result."""
+    if result.cus_rub == SOLDOUT:
+        return 'soldout'
+    if CFG.ERROR_PARSE_STRING in (result.nm_id, result.cus_rub):
+        return 'error'
+    return 'ok'
+
+
+def result_row(result: PageResult) -> tuple:
+    """Converts PageResult into typed row of 'results' table."""
+    parsed_at = datetime.strptime(result.date, CFG.FORMAT_TIMESTAMP_PARSED)
+
+    def text(value: str) -> Optional[str]:
+        return None if value == CFG.ERROR_PARSE_STRING else value
+
+    return (
+        parsed_at.isoformat(sep=' '),
+        parsed_at.date().isoformat(),
+        result.link,
+        text(result.brand_name),
+        text(result.goods_name),
+        text(result.seller_info),
+        to_int(result.nm_id),
+        to_int(result.cus_rub),
+        to_int(result.sel_rub),
+        result_status(result),
+    )
+
+
+def save_sqlite(full_result: List[PageResult]) -> None:
+    """
+    Saves results of whole job into STORING_SQLITE_FILENAME in single transaction.
+    Args:
+        full_result: parsed data
+    """
+    conn = connect(CFG.STORING_SQLITE_FILENAME, SCHEMA)
+    try:
+        with conn:
+            conn.executemany(
+                'INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [result_row(result) for result in full_result],
+            )
+    finally:
+        conn.close()
+    logger.info('Data saved to database: %s', CFG.STORING_SQLITE_FILENAME)
+
+
+def price_history(
+    nm_id: int, since: Optional[str] = None, until: Optional[str] = None
+) -> List[HistoryRow]:
+    """
+    Reads price history of single product, using index instead of scanning all rows.
+    Args:
+        nm_id: product ID
+        since: first day to read, 'YYYY-MM-DD', inclusive
+        until: last day to read, 'YYYY-MM-DD', inclusive
+    Returns:
+        rows of parsed time, customer price, seller price and status, oldest first
+    """
+    query = 'SELECT parsed_at, cus_rub, sel_rub, status FROM results WHERE nm_id = ?'
+    params: list = [nm_id]
+    if since:
+        query += ' AND parsed_at >= ?'
+        params.append(since)
+    if until:
+        query += ' AND parsed_at < date(?, \'+1 day\')'
+        params.append(until)
+    conn = connect(CFG.STORING_SQLITE_FILENAME, SCHEMA)
+    try:
+        return conn.execute(query + ' ORDER BY parsed_at', params).fetchall()
+    finally:
+        conn.close()
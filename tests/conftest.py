@@ -0,0 +1,53 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""Shared fixtures of tests: own folder and config of every test, fixture server."""
+
+import tempfile
+from typing import Any, Callable, Iterator
+
+import pytest
+
+from benchmarks.server import start_server
+from config import CFG
+
+
+def pytest_configure() -> None:
+    """Writes main log of modules under test to temporary folder, not to repo root."""
+    CFG.PATH_LOGGER = tempfile.mkdtemp(prefix='wbmon-tests-')
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Runs every test in its own folder, so local databases of tests do not mix."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def cfg(monkeypatch) -> Callable[..., None]:
+    """Returns function setting config values for the test only."""
+
+    def override(**values: Any) -> None:
+        for name, value in values.items():
+            monkeypatch.setattr(CFG, name, value)
+
+    return override
+
+
+@pytest.fixture(scope='session')
+def base() -> Iterator[str]:
+    """Runs local server with product pages, cards and listings of benchmarks."""
+    server = start_server()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
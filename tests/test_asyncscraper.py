@@ -0,0 +1,107 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""Tests of asyncio engine against fixture server: limits, timeout and results."""
+
+import asyncio
+import socket
+import threading
+import time
+from typing import Iterator, List
+
+import pytest
+
+from benchmarks.server import server_settings
+from parsing import asyncscraper
+from parsing.asyncscraper import async_interval_scraper, async_scraper
+from parsing.httpfetcher import http_scraper
+
+NM_IDS = range(10000001, 10000021)
+
+
+def product_links(base: str) -> List[str]:
+    """Returns links of fixture products."""
+    return [f'{base}/catalog/{nm_id}/detail.aspx' for nm_id in NM_IDS]
+
+
+@pytest.fixture(name='async_cfg')
+def async_cfg_fixture(cfg, base):
+    """Points card API to fixture server, without limits unless test sets them."""
+    cfg(
+        **server_settings(base),
+        FETCHER_BACKEND='http',
+        ASYNC_CONCURRENCY=8,
+        ASYNC_HOST_RATE=1000.0,
+        ASYNC_HOST_BURST=1000,
+    )
+    return cfg
+
+
+@pytest.fixture(name='silent_host')
+def silent_host_fixture() -> Iterator[str]:
+    """Returns base URL of host accepting connections and never answering."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(8)
+        yield f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+
+def test_results_match_blocking_fetcher(async_cfg, base):
+    """Async engine gives the same results as HTTP fetcher, in order of links."""
+    async_cfg(HTTP_INTERFETCH_SEC=0)
+    lnks = product_links(base)
+    expected = http_scraper(lnks)
+    got = async_interval_scraper(lnks)
+    assert [result.link for result in got] == lnks
+    assert [result[1:] for result in got] == [result[1:] for result in expected]
+
+
+def test_concurrency_is_capped(async_cfg, base, monkeypatch):
+    """Not more than ASYNC_CONCURRENCY requests run at once."""
+    async_cfg(ASYNC_CONCURRENCY=3)
+    lock = threading.Lock()
+    running = [0, 0]
+    parser = asyncscraper.http_parser
+
+    def counting_parser(*args):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.02)
+        try:
+            return parser(*args)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    monkeypatch.setattr(asyncscraper, 'http_parser', counting_parser)
+    assert all(asyncio.run(async_scraper(product_links(base))))
+    assert running[1] == 3
+
+
+def test_host_rate_is_limited(async_cfg, base):
+    """Requests to one host after the burst go at ASYNC_HOST_RATE per second."""
+    async_cfg(ASYNC_HOST_RATE=50.0, ASYNC_HOST_BURST=2)
+    start_time = time.monotonic()
+    assert all(asyncio.run(async_scraper(product_links(base))))
+    assert time.monotonic() - start_time >= (len(NM_IDS) - 2) / 50
+
+
+def test_request_timeout_ends_request(async_cfg, silent_host):
+    """Silent host gives no result in ASYNC_REQUEST_TIMEOUT, no request is left."""
+    async_cfg(**server_settings(silent_host), ASYNC_REQUEST_TIMEOUT=0.2)
+    threads = threading.active_count()
+    start_time = time.monotonic()
+    assert asyncio.run(async_scraper(product_links(silent_host)[:2])) == [None, None]
+    assert time.monotonic() - start_time < 2
+    assert threading.active_count() == threads
@@ -0,0 +1,30 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""Tests of Chrome driver settings, without Chrome."""
+
+from parsing.drivers import block_patterns
+
+
+def test_allowed_url_is_exception_of_its_pattern(cfg):
+    """Allowed URL goes first and unblocked, its pattern still blocks the rest."""
+    allowed = 'https://static.wbstatic.net:*/logo.svg'
+    cfg(
+        DRIVER_BLOCK_URLS=['*://*:*/*.svg', '*://*vk.com:*/*'],
+        DRIVER_ALLOW_URLS=[allowed],
+    )
+    assert block_patterns() == [
+        {'urlPattern': allowed, 'block': False},
+        {'urlPattern': '*://*:*/*.svg', 'block': True},
+        {'urlPattern': '*://*vk.com:*/*', 'block': True},
+    ]
@@ -0,0 +1,84 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""Tests of publishing to Google Sheets, against fake spreadsheet counting API calls."""
+
+import pytest
+
+from benchmarks.fakesheets import FakeGc, FakeSpreadsheet
+from config import CFG
+from parsing.results import PageResult
+from services.gconnect import post_values, publish_batches, publish_rows
+
+POSITION = (2, 1)
+
+
+def make_rows(quantity):
+    """Returns distinct rows, oldest first."""
+    return [
+        [f'{i}-{col}' for col in range(len(CFG.DATA_HEADER))] for i in range(quantity)
+    ]
+
+
+def make_results(quantity):
+    """Returns distinct results, oldest first."""
+    return [
+        PageResult('date', f'link-{i}', 'b', 'g', 's', str(i), '10', '20')
+        for i in range(quantity)
+    ]
+
+
+@pytest.mark.parametrize('quantity', [1, 200, 450])
+def test_batches_place_rows_like_row_by_row(cfg, quantity):
+    """Chunks give the same sheet as row by row publishing, newest on top."""
+    cfg(GSHEETS_BATCH_ROWS=200)
+    rows = make_rows(quantity)
+    by_row = FakeSpreadsheet(CFG.DATA_HEADER).sheet1
+    by_batch = FakeSpreadsheet(CFG.DATA_HEADER).sheet1
+    publish_rows(by_row, POSITION, rows)
+    publish_batches(by_batch, POSITION, rows)
+    assert by_batch.rows == by_row.rows
+    assert by_batch.rows[0] == CFG.DATA_HEADER
+    assert by_batch.rows[1:] == rows[::-1]
+
+
+def test_batches_make_two_calls_per_chunk(cfg):
+    """450 rows by chunks of 200 rows are 3 inserts and 3 updates."""
+    cfg(GSHEETS_BATCH_ROWS=200)
+    wks = FakeSpreadsheet(CFG.DATA_HEADER).sheet1
+    publish_batches(wks, POSITION, make_rows(450))
+    assert dict(wks.calls) == {'insert_rows': 3, 'update_values': 3}
+
+
+def test_post_values_top_layout(cfg):
+    """Job of 450 results takes header lookup and two calls per chunk."""
+    cfg(GSHEETS_LAYOUT='top', GSHEETS_BATCH_PUBLISH=True, GSHEETS_BATCH_ROWS=200)
+    gc = FakeGc(CFG.DATA_HEADER)
+    results = make_results(450)
+    post_values(gc, results, log_rows=False)  # type: ignore
+    assert gc.calls == 1 + 3 * 2
+    assert [row[1] for row in gc.wks.rows[1:]] == [r.link for r in results[::-1]]
+
+
+def test_post_values_append_layout(cfg):
+    """Appending takes one call per chunk, rows stay oldest first."""
+    cfg(GSHEETS_LAYOUT='append', GSHEETS_BATCH_PUBLISH=True, GSHEETS_BATCH_ROWS=200)
+    gc = FakeGc(CFG.DATA_HEADER)
+    results = make_results(450)
+    post_values(gc, results, log_rows=False)  # type: ignore
+    calls_before = gc.sh.calls['values_append']
+    post_values(gc, results[:10], log_rows=False)  # type: ignore
+    assert gc.sh.calls['values_append'] == calls_before + 1
+    assert [row[1] for row in gc.log_wks.rows[1:]] == [
+        r.link for r in results + results[:10]
+    ]
@@ -0,0 +1,121 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Tests of browserless fetcher: on recorded product pages and cards it gives the fields
+the page shows, kept in fixtures/expected.json.
+"""
+
+import html
+import json
+import os
+import re
+import shutil
+from typing import Dict
+
+import pytest
+import requests
+
+from benchmarks.server import FIXTURES, server_settings
+from parsing.httpfetcher import http_parser, make_session
+from parsing.results import SOLDOUT
+
+with open(os.path.join(FIXTURES, 'expected.json'), encoding='utf-8') as _file:
+    EXPECTED: Dict[str, Dict[str, str]] = json.load(_file)
+
+#  Page elements by class, as wb_parser() reads them
+PAGE_CLASSES = {
+    'brand_name': 'product-page__header-brand',
+    'goods_name': 'product-page__title',
+    'seller_info': 'seller-info__name',
+    'nm_id': 'product-params__cell product-params__cell--copy',
+    'cus_rub': 'price-block__final-price',
+    'sel_rub': 'price-block__old-price',
+}
+
+CHROME = any(
+    shutil.which(name)
+    for name in ('google-chrome', 'chromium', 'chromium-browser', 'chrome')
+)
+
+
+def page_fields(page: str) -> Dict[str, str]:
+    """Returns fields shown on product page, prices as digits only."""
+    fields = {}
+    soldout = SOLDOUT in page
+    for name, css_class in PAGE_CLASSES.items():
+        if name.endswith('_rub') and soldout:
+            fields[name] = SOLDOUT
+            continue
+        match = re.search(f'class="{css_class}[ "][^>]*>([^<]*)<', page)
+        assert match, name
+        text = html.unescape(match.group(1)).strip()
+        fields[name] = re.sub(r'\D', '', text) if name.endswith('_rub') else text
+    return fields
+
+
+@pytest.fixture
+def http_cfg(cfg, base):
+    """Points card and listing APIs to fixture server."""
+    cfg(**server_settings(base))
+
+
+@pytest.mark.parametrize('nm_id', sorted(EXPECTED))
+def test_recorded_page_shows_expected_fields(base, nm_id):
+    """Expected fields are the ones recorded product page shows."""
+    page = requests.get(f'{base}/catalog/{nm_id}/detail.aspx', timeout=10).text
+    assert page_fields(page) == EXPECTED[nm_id]
+
+
+@pytest.mark.usefixtures('http_cfg')
+@pytest.mark.parametrize('nm_id', sorted(EXPECTED))
+def test_http_result_matches_page(base, nm_id):
+    """Recorded card gives the fields recorded product page shows."""
+    link = f'{base}/catalog/{nm_id}/detail.aspx'
+    with make_session() as session:
+        result = http_parser(session, link)
+    assert result is not None
+    assert result.link == link
+    assert {name: getattr(result, name) for name in EXPECTED[nm_id]} == EXPECTED[nm_id]
+
+
+@pytest.mark.usefixtures('http_cfg')
+def test_http_link_without_product(base):
+    """Link without product ID is left to selenium."""
+    with make_session() as session:
+        assert http_parser(session, base + '/seller/1') is None
+
+
+@pytest.mark.skipif(not CHROME, reason='Chrome is not installed')
+@pytest.mark.usefixtures('http_cfg')
+@pytest.mark.parametrize('nm_id', sorted(EXPECTED))
+def test_http_and_selenium_give_same_result(base, cfg, nm_id):
+    """Both backends give identical PageResult, except time of parsing."""
+    # pylint: disable=import-outside-toplevel
+    from parsing.drivers import make_driver, quit_driver
+    from parsing.wbparser import wb_parser
+
+    cfg(ARCHIVE_PAGES=False, PAGEWAIT_CSV_FILENAME='')
+    link = f'{base}/catalog/{nm_id}/detail.aspx'
+    driver = make_driver()
+    try:
+        page_result = wb_parser(driver, link)
+    finally:
+        quit_driver(driver)
+    with make_session() as session:
+        http_result = http_parser(session, link)
+    assert http_result is not None
+    assert page_result[1:] == http_result[1:]
+    assert {name: getattr(page_result, name) for name in EXPECTED[nm_id]} == (
+        EXPECTED[nm_id]
+    )
@@ -0,0 +1,142 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""Tests of durable job queue: jobs killed or not published are resumed by next run."""
+
+from typing import List, Optional
+
+import pytest
+
+from parsing import scheduler
+from parsing.links import link_nm_id
+from parsing.results import PageResult, ResultCallback
+from services.jobqueue import unfinished_job
+
+LINKS = [f'https://www.wildberries.ru/catalog/{i}/detail.aspx' for i in range(1, 7)]
+
+ROUND = '2026-01-01T12:00:00+00:00'
+
+
+class Killed(Exception):
+    """Process killed in the middle of the job."""
+
+
+class FakeScraper:  # pylint: disable=too-few-public-methods
+    """Scraper giving result of every link, killed after kill_after links if given."""
+
+    def __init__(self, kill_after: Optional[int] = None) -> None:
+        self.kill_after = kill_after
+        self.scraped: List[str] = []
+
+    def __call__(
+        self, lnks: List[str], on_result: Optional[ResultCallback] = None
+    ) -> List[PageResult]:
+        """Scrapes links like scheduler.scrape_links."""
+        full_result = []
+        for link in lnks:
+            if len(self.scraped) == self.kill_after:
+                raise Killed
+            self.scraped.append(link)
+            result = PageResult(
+                'date', link, 'b', 'g', 's', link_nm_id(link), '10', '20'
+            )
+            if on_result:
+                on_result(result)
+            full_result.append(result)
+        return full_result
+
+
+@pytest.fixture(name='published')
+def published_fixture(cfg, monkeypatch) -> List[PageResult]:
+    """Runs jobs in batch mode, returns results published by them."""
+    cfg(
+        JOB_QUEUE=True,
+        SHARDING=False,
+        STREAM_RESULTS=False,
+        PLAN_ADAPTIVE=False,
+        REFRESH_POLICIES=False,
+        PUBLISH_ONLY_CHANGED=False,
+    )
+    results: List[PageResult] = []
+
+    def publish(_, full_result: List[PageResult]) -> bool:
+        results.extend(full_result)
+        return True
+
+    monkeypatch.setattr(scheduler, 'publish_results', publish)
+    return results
+
+
+def use_scraper(monkeypatch, scraper: FakeScraper) -> FakeScraper:
+    """Makes jobs scrape with the scraper."""
+    monkeypatch.setattr(scheduler, 'scrape_links', scraper)
+    return scraper
+
+
+def test_killed_job_is_resumed_with_other_links(monkeypatch, published):
+    """
+    Job killed halfway is resumed in the same round, though links due changed after
+    scraped ones got new refresh times. Results before the kill are published too.
+    """
+    use_scraper(monkeypatch, FakeScraper(kill_after=3))
+    with pytest.raises(Killed):
+        scheduler.run_job(LINKS, None, ROUND, LINKS)
+    assert not published
+    assert unfinished_job(ROUND) is not None
+    scraper = use_scraper(monkeypatch, FakeScraper())
+    scheduler.run_job(LINKS[3:], None, ROUND, LINKS[3:])
+    assert scraper.scraped == LINKS[3:]
+    assert [result.link for result in published] == LINKS
+    assert unfinished_job(ROUND) is None
+
+
+def test_job_of_other_round_is_not_resumed(monkeypatch, published):
+    """Next round starts new job with all its links, results of killed one carried."""
+    use_scraper(monkeypatch, FakeScraper(kill_after=3))
+    with pytest.raises(Killed):
+        scheduler.run_job(LINKS, None, ROUND, LINKS)
+    scraper = use_scraper(monkeypatch, FakeScraper())
+    scheduler.run_job(LINKS, None, 'next round', LINKS)
+    assert scraper.scraped == LINKS
+    assert [result.link for result in published] == LINKS[:3] + LINKS
+    assert unfinished_job('next round') is None
+
+
+@pytest.mark.parametrize('next_round', [ROUND, 'next round'])
+def test_results_not_published_are_published_by_next_run(
+    monkeypatch, published, next_round
+):
+    """
+    Job is not finished while publishing fails. Next run in the same round resumes
+    it, next round carries its results, and they are published once.
+    """
+    failed: List[PageResult] = []
+
+    def publish_fails(_, full_result: List[PageResult]) -> bool:
+        failed.extend(full_result)
+        return False
+
+    use_scraper(monkeypatch, FakeScraper())
+    with monkeypatch.context() as patch:
+        patch.setattr(scheduler, 'publish_results', publish_fails)
+        scheduler.run_job(LINKS, None, ROUND, LINKS)
+    assert [result.link for result in failed] == LINKS
+    assert unfinished_job(ROUND) is not None
+    scraper = use_scraper(monkeypatch, FakeScraper())
+    scheduler.run_job(LINKS[:2], None, next_round, LINKS[:2])
+    fresh = [] if next_round == ROUND else LINKS[:2]
+    assert scraper.scraped == fresh
+    assert [result.link for result in published] == LINKS + fresh
+    assert unfinished_job(next_round) is None
+    scheduler.run_job([], None, 'last round', [])
+    assert len(published) == len(LINKS + fresh)
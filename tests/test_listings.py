@@ -0,0 +1,114 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""Tests of listing harvester against listing fixtures of benchmarks."""
+
+import pytest
+
+from benchmarks.server import LISTING_PAGE_SIZE, LISTING_PAGES, server_settings
+from parsing.links import link_nm_id
+from parsing.listings import LISTINGS, ListingHarvester, listing_kind
+from parsing.scheduler import round_links
+from parsing.scraper import interval_scraper
+
+PRODUCTS = LISTING_PAGES * LISTING_PAGE_SIZE
+
+#  Every tenth fixture product has no seller and is left to scrape
+MISSED = PRODUCTS // 10
+
+
+@pytest.fixture
+def listing_cfg(cfg, base):
+    """Points card and listing APIs to fixture server."""
+    cfg(**server_settings(base), LISTING_MAX_PAGES=20)
+
+
+@pytest.mark.parametrize(
+    'link, kind',
+    [
+        ('https://www.wildberries.ru/catalog/12345/detail.aspx', None),
+        ('https://www.wildberries.ru/seller/42', ('seller', '42')),
+        ('https://www.wildberries.ru/brands/some-brand', ('brand', 'some-brand')),
+        (
+            'https://www.wildberries.ru/catalog/0/search.aspx?search=red+dress',
+            ('search', 'red+dress'),
+        ),
+        (
+            'https://www.wildberries.ru/catalog/zhenshchinam/odezhda',
+            ('catalog', '/catalog/zhenshchinam/odezhda'),
+        ),
+    ],
+)
+def test_listing_kind(link, kind):
+    """Product links are not listings, listings give their key."""
+    assert listing_kind(link) == kind
+
+
+@pytest.mark.usefixtures('listing_cfg')
+@pytest.mark.parametrize(
+    'path',
+    [
+        '/seller/7',
+        '/catalog/0/search.aspx?search=query+1',
+        '/brands/brand-1',
+        '/catalog/zhenshchinam/odezhda/platya',
+    ],
+)
+def test_listing_is_expanded_into_products(base, path):
+    """All pages of listing give product links, results of full products are kept."""
+    harvester = ListingHarvester()
+    product = f'{base}/catalog/10000001/detail.aspx'
+    lnks = harvester.expand([product, base + path])
+    assert lnks[0] == product
+    assert len(lnks) == 1 + PRODUCTS
+    assert all(link_nm_id(link) for link in lnks)
+    left, harvested = harvester.take(lnks)
+    assert len(harvested) == PRODUCTS - MISSED
+    assert len(left) == 1 + MISSED
+    assert all(result.nm_id == link_nm_id(result.link) for result in harvested)
+    assert not any(harvester.has(link) for link in lnks)
+
+
+@pytest.mark.usefixtures('listing_cfg')
+def test_listing_products_are_listed_once(base):
+    """The same listing twice gives its products once."""
+    harvester = ListingHarvester()
+    lnks = harvester.expand([base + '/seller/7', base + '/seller/7'])
+    assert len(lnks) == len(set(lnks)) == PRODUCTS
+
+
+@pytest.mark.usefixtures('listing_cfg')
+def test_unknown_category_is_dropped(base):
+    """Category not in menu can not be harvested and gives no links."""
+    assert not ListingHarvester().expand([base + '/catalog/no/such/category'])
+
+
+@pytest.mark.usefixtures('listing_cfg')
+def test_results_come_in_order_of_links(cfg, base):
+    """Harvested and fetched results are merged back in order of links."""
+    cfg(FETCHER_BACKEND='http')
+    lnks = LISTINGS.expand([base + '/seller/7'])
+    lnks = [f'{base}/catalog/10000001/detail.aspx'] + lnks[::-1]
+    full_result = interval_scraper(lnks)
+    assert [result.link for result in full_result] == lnks
+
+
+@pytest.mark.usefixtures('listing_cfg')
+def test_link_cap_counts_links_to_scrape_only(cfg, base):
+    """Harvested products are kept over MAX_LINK_QUANTITY, they load no pages."""
+    cfg(SCRAPE_LISTINGS=True, REFRESH_POLICIES=False, MAX_LINK_QUANTITY=3)
+    lnks = [f'{base}/catalog/{nm_id}/detail.aspx' for nm_id in range(1, 6)]
+    capped = round_links(lnks + [base + '/seller/7'])
+    assert len(capped) == 3 + PRODUCTS - MISSED
+    assert capped[:3] == lnks[:3]
+    assert sum(not LISTINGS.has(link) for link in capped) == 3
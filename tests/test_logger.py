@@ -0,0 +1,33 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""Tests of background logging."""
+
+import logging
+import queue
+
+from services.logger import LazyQueueHandler
+
+
+def test_queued_record_keeps_args_as_at_call():
+    """Mutable argument changed after the call is logged as it was at the call."""
+    records: queue.Queue = queue.Queue()
+    lgr = logging.getLogger('T.queued')
+    lgr.propagate = False
+    lgr.addHandler(LazyQueueHandler(records))
+    links = ['first']
+    lgr.warning('Links: %s', links)
+    links.append('second')
+    record = records.get_nowait()
+    assert record.getMessage() == "Links: ['first']"
+    assert record.levelname == 'WARNING'
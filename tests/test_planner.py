@@ -0,0 +1,57 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""Tests of job planner pace, given to scrapers."""
+
+from parsing.planner import Planner
+
+
+def test_pace_follows_config_without_plan(cfg):
+    """Config changed after import is the pace, while no plan sets it."""
+    planner = Planner()
+    cfg(SCRAPER_WORKERS=4, SCRAPER_INTERPARSE_MIN=0, SCRAPER_INTERPARSE_MAX=0)
+    assert planner.workers == 4
+    assert planner.interparse == (0, 0)
+    assert planner.interparse_sleep() == 0
+
+
+def test_plan_sets_pace_of_selenium_scraper(cfg):
+    """
+    Tight window shrinks sleeps, adds drivers and defers links, unless deferring is
+    off. Other backend drops the pace.
+    """
+    cfg(
+        FETCHER_BACKEND='selenium',
+        SCRAPER_ENGINE='blocking',
+        SCRAPER_WORKERS=1,
+        SCRAPER_INTERPARSE_MIN=30,
+        SCRAPER_INTERPARSE_MAX=120,
+        SCRAPER_BEFOREQUIT_MAX=0,
+        PLAN_DEFAULT_LINK_SEC=10,
+        PLAN_INTERPARSE_FLOOR=5,
+        PLAN_MAX_WORKERS=3,
+        PLAN_WINDOW_SHARE=1,
+    )
+    planner = Planner()
+    lnks = [f'link-{i}' for i in range(30)]
+    plan = planner.plan(lnks, window=100)
+    assert (planner.workers, planner.interparse) == (plan.workers, plan.interparse)
+    assert plan.workers > 1
+    assert plan.interparse[1] < 120
+    assert plan.deferred
+    kept = planner.plan(lnks, window=100, rotate=False, defer=False)
+    assert kept.links == lnks
+    assert kept.workers == plan.workers
+    cfg(FETCHER_BACKEND='http', SCRAPER_WORKERS=2)
+    planner.plan(lnks, window=100)
+    assert (planner.workers, planner.interparse) == (2, (30, 120))
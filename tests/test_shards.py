@@ -0,0 +1,117 @@
+# wbmon — Wildberries marketplace price monitor with Google Sheets publishing.
+# Copyright (C) 2023 Ilia Baidakov <baidakovil@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <https://www.gnu.org/licenses/>.
+"""Tests of sharding: claims of worker processes sharing coordination database."""
+
+import multiprocessing
+import os
+import time
+
+from parsing.results import PageResult
+from services import shards
+
+LINKS = [f'https://www.wildberries.ru/catalog/{i}/detail.aspx' for i in range(60)]
+
+WORKERS = ['worker-a', 'worker-b', 'worker-c']
+
+
+def claim_in_process(worker, folder, barrier, claims) -> None:
+    """Joins shards as worker and claims links, when all workers joined."""
+    os.chdir(folder)
+    shards.WORKER_ID = worker
+    shards.heartbeat()
+    barrier.wait()
+    round_lnks, mine = shards.claim_links('round', LINKS)
+    claims.put((worker, round_lnks, mine))
+
+
+def result(link: str) -> PageResult:
+    """Returns result of the link."""
+    return PageResult('date', link, 'b', 'g', 's', '1', '10', '20')
+
+
+def test_processes_claim_disjoint_links(workdir):
+    """Every link is claimed by exactly one of worker processes."""
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(len(WORKERS))
+    claims = context.Queue()
+    processes = [
+        context.Process(
+            target=claim_in_process, args=(worker, str(workdir), barrier, claims)
+        )
+        for worker in WORKERS
+    ]
+    for process in processes:
+        process.start()
+    got = [claims.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    claimed = [link for _, _, mine in got for link in mine]
+    assert sorted(claimed) == sorted(LINKS)
+    assert all(mine for _, _, mine in got)
+    assert all(round_lnks == LINKS for _, round_lnks, _ in got)
+
+
+def test_round_links_are_shared(monkeypatch):
+    """Worker coming later shards links stored by the first one."""
+    monkeypatch.setattr(shards, 'WORKER_ID', 'worker-a')
+    shards.claim_links('round', LINKS[:30])
+    monkeypatch.setattr(shards, 'WORKER_ID', 'worker-b')
+    round_lnks, mine = shards.claim_links('round', LINKS[::-1])
+    assert round_lnks == LINKS[:30]
+    assert set(mine) <= set(LINKS[:30])
+
+
+def test_links_of_lost_worker_are_claimed_again(cfg, monkeypatch):
+    """Links claimed by worker without heartbeat are scraped by alive one."""
+    cfg(SHARD_HEARTBEAT_TTL=60, SHARD_MERGE_POLL=0, SHARD_MERGE_TIMEOUT=10)
+    monkeypatch.setattr(shards, 'WORKER_ID', 'worker-lost')
+    _, lost = shards.claim_links('round', LINKS)
+    conn = shards.open_db()
+    with conn:
+        conn.execute('UPDATE workers SET heartbeat = 0')
+    conn.close()
+    monkeypatch.setattr(shards, 'WORKER_ID', 'worker-alive')
+    _, mine = shards.claim_links('round', LINKS)
+    assert not mine
+    scraped = []
+
+    def scrape(lnks):
+        scraped.extend(lnks)
+        return [result(link) for link in lnks]
+
+    merged = shards.merge_results('round', LINKS, [], scrape)
+    assert sorted(scraped) == sorted(lost)
+    assert merged is not None
+    assert [r.link for r in merged] == LINKS
+
+
+def test_round_is_published_once(cfg, monkeypatch):
+    """The first worker to see all results publishes, others do not."""
+    cfg(SHARD_MERGE_POLL=0, SHARD_MERGE_TIMEOUT=10)
+    published = []
+    for worker in WORKERS:
+        monkeypatch.setattr(shards, 'WORKER_ID', worker)
+        shards.heartbeat()
+    for worker in WORKERS:
+        monkeypatch.setattr(shards, 'WORKER_ID', worker)
+        _, mine = shards.claim_links('round', LINKS)
+        shards.store_results('round', [result(link) for link in mine])
+    start_time = time.monotonic()
+    for worker in WORKERS:
+        monkeypatch.setattr(shards, 'WORKER_ID', worker)
+        published.append(shards.merge_results('round', LINKS, [], list))
+    assert time.monotonic() - start_time < 5
+    assert [merged is not None for merged in published] == [True, False, False]
+    assert [r.link for r in published[0]] == LINKS